@@ -1,13 +1,39 @@
-from importlib.metadata import PackageNotFoundError, version
+from importlib import import_module
+from typing import TYPE_CHECKING, Any
 
-from .sendgrid import SendgridAPI  # noqa
-from .pool import ConnectionPool  # noqa
+if TYPE_CHECKING:
+    from .pool import ConnectionPool  # noqa
+    from .sendgrid import SendgridAPI  # noqa
 
-__version__ = "0.0.0-dev"
-
-try:
-    __version__ = version("sendgrid-async")
-except PackageNotFoundError:
-    pass
+# The public names are imported on first access, so that importing the
+# package stays cheap for the processes that never send.
+_LAZY_ATTRIBUTES = {
+    "SendgridAPI": ".sendgrid",
+    "ConnectionPool": ".pool",
+}
 
 __all__ = ["SendgridAPI", "ConnectionPool"]
+
+
+def __getattr__(name: str) -> Any:
+    if name in _LAZY_ATTRIBUTES:
+        value = getattr(import_module(_LAZY_ATTRIBUTES[name], __name__), name)
+    elif name == "__version__":
+        value = _version()
+    else:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    globals()[name] = value
+    return value
+
+
+def __dir__() -> list[str]:
+    return sorted([*globals(), *_LAZY_ATTRIBUTES, "__version__"])
+
+
+def _version() -> str:
+    from importlib.metadata import PackageNotFoundError, version
+
+    try:
+        return version("sendgrid-async")
+    except PackageNotFoundError:
+        return "0.0.0-dev"
@@ -0,0 +1,222 @@
+"""
+Content-addressed cache of encoded attachments.
+
+The same files are often attached to many messages. The cache keeps the
+ready-to-splice JSON of each attachment, keyed by a hash of its content, so
+that it is read and base64-encoded once rather than on every send.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import base64
+import hashlib
+import os
+from collections import OrderedDict
+from typing import TYPE_CHECKING, NamedTuple
+
+if TYPE_CHECKING:
+    from typing import Any
+
+    from async_sendgrid.streaming import StreamingAttachment
+
+_CONTENT_OPEN = b'{"content":"'
+
+# Number of file identities remembered to skip hashing unchanged files.
+_MAX_FILE_DIGESTS = 4096
+# Buffers at least this large are hashed off the event loop.
+_HASH_OFFLOAD_BYTES = 1024 * 1024
+
+
+class CacheStats(NamedTuple):
+    """Counters of an ``AttachmentCache``."""
+
+    hits: int
+    misses: int
+    evictions: int
+    size: int
+    entries: int
+
+
+class AttachmentCache:
+    """
+    A byte-size bounded LRU cache of encoded attachments.
+
+    Attachments are keyed by the SHA-256 of their content and metadata.
+    File paths are only hashed again when their size or modification time
+    changes, and ``bytes`` sources only once per attachment. Attachments
+    larger than ``max_item_bytes`` once encoded are not cached, and are
+    streamed as usual.
+
+    Example::
+
+        sendgrid = SendgridAPI(
+            api_key="...", attachment_cache=AttachmentCache(64 * 2**20)
+        )
+        await sendgrid.send(
+            email, attachments=[StreamingAttachment("terms.pdf")]
+        )
+    """
+
+    def __init__(
+        self, max_bytes: int = 64 * 1024 * 1024, max_item_bytes: int = 0
+    ) -> None:
+        """
+        Initialize the cache.
+
+        Args:
+            max_bytes (int, optional): Maximum total size of the cached
+                attachments, once encoded. Defaults to 64 MiB.
+            max_item_bytes (int, optional): Maximum encoded size of a
+                cached attachment. Defaults to a quarter of ``max_bytes``.
+        """
+        if not isinstance(max_bytes, int) or max_bytes < 1:
+            raise ValueError("max_bytes must be a positive integer")
+        if not isinstance(max_item_bytes, int) or max_item_bytes < 0:
+            raise ValueError("max_item_bytes must be a non-negative integer")
+
+        self._max_bytes = max_bytes
+        self._max_item_bytes = min(max_item_bytes or max_bytes // 4, max_bytes)
+        self._fragments: OrderedDict[bytes, bytes] = OrderedDict()
+        self._file_digests: OrderedDict[tuple[Any, ...], bytes] = OrderedDict()
+        self._size = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    @property
+    def max_bytes(self) -> int:
+        """Maximum total size of the cached attachments."""
+        return self._max_bytes
+
+    @property
+    def stats(self) -> CacheStats:
+        """The hit, miss and eviction counters, and the current size."""
+        return CacheStats(
+            hits=self._hits,
+            misses=self._misses,
+            evictions=self._evictions,
+            size=self._size,
+            entries=len(self._fragments),
+        )
+
+    async def resolve(
+        self, attachment: StreamingAttachment
+    ) -> StreamingAttachment | bytes:
+        """
+        Return the encoded JSON of an attachment, from the cache if
+        possible.
+
+        Args:
+            attachment: The attachment to encode.
+
+        Returns:
+            The JSON fragment of the attachment, or the attachment itself
+            when it is too large to be cached.
+        """
+        metadata = attachment._metadata()
+        encoded_size = (
+            len(_CONTENT_OPEN) + attachment._encoded_size() + 1 + len(metadata)
+        )
+        if encoded_size > self._max_item_bytes:
+            return attachment
+
+        if isinstance(attachment._source, memoryview):
+            content: Any = attachment._source
+            digest = await self._hash(attachment)
+        else:
+            content, digest = await self._read(attachment)
+
+        key = hashlib.sha256(digest + metadata).digest()
+        fragment = self._fragments.get(key)
+        if fragment is not None:
+            self._hits += 1
+            self._fragments.move_to_end(key)
+            return fragment
+
+        self._misses += 1
+        if content is None:
+            content, _ = await self._read(attachment, force=True)
+        fragment = _CONTENT_OPEN + base64.b64encode(content) + b'"' + metadata
+        self._store(key, fragment)
+        return fragment
+
+    def clear(self) -> None:
+        """Remove every cached attachment. The counters are kept."""
+        self._fragments.clear()
+        self._file_digests.clear()
+        self._size = 0
+
+    async def _hash(self, attachment: StreamingAttachment) -> bytes:
+        """Return the digest of a buffer attachment."""
+        if attachment._digest is not None:
+            return attachment._digest
+
+        source = attachment._source
+        if len(source) < _HASH_OFFLOAD_BYTES:
+            digest = hashlib.sha256(source).digest()
+        else:
+            loop = asyncio.get_running_loop()
+            digest = await loop.run_in_executor(None, _sha256, source)
+        # Mutable buffers may change between sends.
+        if isinstance(source.obj, bytes):
+            attachment._digest = digest
+        return digest
+
+    async def _read(
+        self, attachment: StreamingAttachment, force: bool = False
+    ) -> tuple[Any, bytes]:
+        """Return the content, unless known to be cached, and digest."""
+        source = attachment._source
+        identity = None
+        if isinstance(source, str):
+            stat = os.stat(source)
+            identity = (source, stat.st_size, stat.st_mtime_ns)
+            known = self._file_digests.get(identity)
+            if known is not None and not force:
+                self._file_digests.move_to_end(identity)
+                return None, known
+
+        loop = asyncio.get_running_loop()
+        content, digest = await loop.run_in_executor(
+            None, _read_all, attachment
+        )
+
+        if identity is not None:
+            self._file_digests[identity] = digest
+            if len(self._file_digests) > _MAX_FILE_DIGESTS:
+                self._file_digests.popitem(last=False)
+        return content, digest
+
+    def _store(self, key: bytes, fragment: bytes) -> None:
+        self._fragments[key] = fragment
+        self._size += len(fragment)
+        while self._size > self._max_bytes:
+            _, evicted = self._fragments.popitem(last=False)
+            self._size -= len(evicted)
+            self._evictions += 1
+
+    def __len__(self) -> int:
+        return len(self._fragments)
+
+    def __repr__(self) -> str:
+        return (
+            f"AttachmentCache(max_bytes={self._max_bytes}, "
+            f"size={self._size})"
+        )
+
+
+def _read_all(attachment: StreamingAttachment) -> tuple[bytes, bytes]:
+    """Read the content of a file attachment, and hash it."""
+    source = attachment._source
+    if isinstance(source, str):
+        with open(source, "rb") as file:
+            content = file.read()
+    else:
+        # The file object may be read by a send at the same time.
+        content = attachment._read_at(source, 0, attachment._size)
+    return content, hashlib.sha256(content).digest()
+
+
+def _sha256(content: Any) -> bytes:
+    return hashlib.sha256(content).digest()
@@ -0,0 +1,167 @@
+"""
+Time-window micro-batching of concurrent sends.
+
+This is an internal module and should not be used directly.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+from typing import TYPE_CHECKING
+
+from async_sendgrid.packing import (
+    MAX_PERSONALIZATIONS,
+    PackedMessage,
+    pack_key,
+)
+
+if TYPE_CHECKING:
+    from typing import Any, Awaitable, Callable, Optional
+
+    from httpx import Response  # type: ignore
+    from sendgrid.helpers.mail import Mail  # type: ignore
+
+logger = logging.getLogger(__name__)
+
+
+class _Batch:
+    __slots__ = ("pack", "futures", "timer")
+
+    def __init__(self, payload: dict[str, Any]) -> None:
+        self.pack = PackedMessage(payload)
+        self.futures: list[asyncio.Future[Response]] = []
+        self.timer: Optional[asyncio.TimerHandle] = None
+
+
+class Coalescer:
+    """
+    Park messages for a short window and send compatible ones together.
+
+    Messages sharing everything but their personalizations are merged into
+    a single multi-personalization request. A batch is flushed when its
+    window elapses or when it holds ``max_size`` messages, and every caller
+    is resolved with the shared response.
+    """
+
+    def __init__(
+        self,
+        send: Callable[[dict[str, Any]], Awaitable[Response]],
+        window: float,
+        max_size: int = MAX_PERSONALIZATIONS,
+    ) -> None:
+        """
+        Initialize the coalescer.
+
+        Args:
+            send (Callable): Coroutine function posting a request body.
+            window (float): Maximum time in seconds a message is parked.
+            max_size (int, optional): Maximum number of messages merged
+                into one request. Defaults to 1000.
+        """
+        self._validate_window(window)
+        self._validate_max_size(max_size)
+
+        self._send = send
+        self._window = window
+        self._max_size = max_size
+        self._batches: dict[str, _Batch] = {}
+        self._tasks: set[asyncio.Task[None]] = set()
+
+    @property
+    def window(self) -> float:
+        """Maximum time in seconds a message is parked."""
+        return self._window
+
+    @property
+    def max_size(self) -> int:
+        """Maximum number of messages merged into one request."""
+        return self._max_size
+
+    async def submit(self, email: Mail | dict[str, Any]) -> Response:
+        """
+        Queue a message and wait for the response of its batch.
+
+        Args:
+            email: The message, or its JSON request body, to send.
+
+        Returns:
+            The response of the request the message was merged into.
+        """
+        payload = dict(email) if isinstance(email, dict) else email.get()
+        personalizations = payload.get("personalizations") or []
+
+        if not personalizations:
+            return await self._send(payload)
+
+        key = pack_key(payload)
+        batch = self._batches.get(key)
+
+        if batch is not None and not batch.pack.fits(personalizations):
+            self._flush(key, batch)
+            batch = None
+
+        if batch is None:
+            batch = _Batch(payload)
+            batch.timer = asyncio.get_running_loop().call_later(
+                self._window, self._flush, key, batch
+            )
+            self._batches[key] = batch
+
+        future: asyncio.Future[Response] = (
+            asyncio.get_running_loop().create_future()
+        )
+        batch.pack.add(len(batch.futures), personalizations)
+        batch.futures.append(future)
+
+        if len(batch.futures) >= self._max_size:
+            self._flush(key, batch)
+
+        return await future
+
+    def _flush(self, key: str, batch: _Batch) -> None:
+        if self._batches.get(key) is batch:
+            del self._batches[key]
+        if batch.timer is not None:
+            batch.timer.cancel()
+
+        task = asyncio.ensure_future(self._dispatch(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _dispatch(self, batch: _Batch) -> None:
+        logger.debug(
+            "Sending %d coalesced messages in one request",
+            len(batch.futures),
+        )
+        try:
+            response = await self._send(batch.pack.payload)
+        except Exception as exc:
+            for future in batch.futures:
+                if not future.done():
+                    future.set_exception(exc)
+        except BaseException:
+            # Do not leave the callers waiting on a cancelled request.
+            for future in batch.futures:
+                future.cancel()
+            raise
+        else:
+            for future in batch.futures:
+                if not future.done():
+                    future.set_result(response)
+
+    @staticmethod
+    def _validate_window(window: float) -> None:
+        if not isinstance(window, (int, float)) or window <= 0:
+            raise ValueError("coalesce_window must be a positive number")
+
+    @staticmethod
+    def _validate_max_size(max_size: int) -> None:
+        if (
+            not isinstance(max_size, int)
+            or not 1 <= max_size <= MAX_PERSONALIZATIONS
+        ):
+            raise ValueError(
+                "coalesce_max_size must be an integer between 1 and "
+                f"{MAX_PERSONALIZATIONS}"
+            )
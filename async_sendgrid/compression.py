@@ -0,0 +1,113 @@
+"""
+Gzip compression of request bodies.
+
+This is an internal module and should not be used directly.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import gzip
+import time
+from typing import TYPE_CHECKING
+
+from httpx import AsyncBaseTransport, Request, RequestNotRead  # type: ignore
+from opentelemetry import trace
+
+if TYPE_CHECKING:
+    from typing import Optional
+
+    from httpx import Response  # type: ignore
+
+    from async_sendgrid.metrics import SendMetrics
+
+# Bodies from this size are compressed in a worker thread.
+_OFFLOAD_THRESHOLD = 256 * 1024
+
+
+class CompressionTransport(AsyncBaseTransport):
+    """
+    A transport gzipping request bodies above a size threshold.
+
+    It sits above the retry transport, so a body is compressed once however
+    many times it is sent. Streamed bodies and bodies already carrying a
+    ``Content-Encoding`` are sent as they are. The original size, the
+    compression ratio and the CPU time spent compressing are recorded on
+    the current span, and with ``metrics`` as metrics.
+    """
+
+    def __init__(
+        self,
+        transport: AsyncBaseTransport,
+        threshold: int = 1024,
+        level: int = 6,
+        offload_threshold: int = _OFFLOAD_THRESHOLD,
+        metrics: bool = False,
+    ) -> None:
+        self._transport = transport
+        self._threshold = threshold
+        self._level = level
+        self._offload_threshold = offload_threshold
+        self._metrics: Optional[SendMetrics] = None
+        if metrics:
+            from async_sendgrid.metrics import get_metrics
+
+            self._metrics = get_metrics()
+
+    async def handle_async_request(self, request: Request) -> Response:
+        try:
+            content = request.content
+        except RequestNotRead:
+            return await self._transport.handle_async_request(request)
+
+        if (
+            len(content) < self._threshold
+            or "Content-Encoding" in request.headers
+        ):
+            return await self._transport.handle_async_request(request)
+
+        if len(content) >= self._offload_threshold:
+            loop = asyncio.get_running_loop()
+            compressed, cpu_time = await loop.run_in_executor(
+                None, _compress, content, self._level
+            )
+        else:
+            compressed, cpu_time = _compress(content, self._level)
+
+        ratio = len(content) / len(compressed)
+        if self._metrics is not None:
+            self._metrics.compression_ratio.record(ratio)
+            self._metrics.compression_cpu_time.record(cpu_time)
+        span = trace.get_current_span()
+        if span.is_recording():
+            span.set_attributes(
+                {
+                    "http.request.body.size": len(content),
+                    "sendgrid.compression.size": len(compressed),
+                    "sendgrid.compression.ratio": ratio,
+                    "sendgrid.compression.cpu_time_ms": cpu_time * 1000,
+                }
+            )
+
+        headers = request.headers.copy()
+        headers["Content-Encoding"] = "gzip"
+        headers["Content-Length"] = str(len(compressed))
+        compressed_request = Request(
+            request.method,
+            request.url,
+            headers=headers,
+            content=compressed,
+            extensions=request.extensions,
+        )
+        return await self._transport.handle_async_request(compressed_request)
+
+    async def aclose(self) -> None:
+        await self._transport.aclose()
+
+
+def _compress(content: bytes, level: int) -> tuple[bytes, float]:
+    """Gzip a body, returning it with the CPU time spent."""
+    start = time.thread_time()
+    # A fixed mtime keeps the output of a given body identical.
+    compressed = gzip.compress(content, compresslevel=level, mtime=0)
+    return compressed, time.thread_time() - start
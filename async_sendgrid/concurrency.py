@@ -0,0 +1,301 @@
+"""
+Adaptive concurrency control for SendGrid API requests.
+
+This is an internal module and should not be used directly.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import TYPE_CHECKING
+
+from httpx import (  # type: ignore
+    AsyncBaseTransport,
+    AsyncByteStream,
+    ByteStream,
+    TransportError,
+)
+
+from async_sendgrid.connections import add_limit_wait
+
+if TYPE_CHECKING:
+    from typing import AsyncIterator, Optional
+
+    from httpx import Request, Response  # type: ignore
+
+logger = logging.getLogger(__name__)
+
+_LATENCY_SAMPLES = 100
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    An AIMD (additive increase, multiplicative decrease) concurrency limit.
+
+    The number of requests allowed in flight grows by one after every
+    round of ``limit`` healthy completions, and is multiplied by
+    ``decrease_factor`` on a 429, a 5xx or a transport error such as a
+    timeout. A round whose p95 latency exceeds ``latency_target`` stops the
+    growth and cuts the limit as well. The limit always stays between
+    ``min_limit`` and ``max_limit``.
+    """
+
+    def __init__(
+        self,
+        max_limit: int,
+        min_limit: int = 1,
+        latency_target: Optional[float] = None,
+        decrease_factor: float = 0.5,
+    ) -> None:
+        """
+        Initialize the limiter. It starts at ``max_limit``.
+
+        Args:
+            max_limit (int): Maximum number of requests in flight.
+            min_limit (int, optional): Minimum number of requests in
+                flight. Defaults to 1.
+            latency_target (float, optional): p95 latency, in seconds,
+                above which the limit is cut. Defaults to None (latency
+                is not considered).
+            decrease_factor (float, optional): Multiplier applied to the
+                limit on errors, between 0 and 1. Defaults to 0.5.
+        """
+        if not isinstance(min_limit, int) or min_limit < 1:
+            raise ValueError("min_concurrency must be a positive integer")
+        if not isinstance(max_limit, int) or max_limit < min_limit:
+            raise ValueError(
+                "max_concurrency must be an integer of at least "
+                "min_concurrency"
+            )
+        if latency_target is not None and (
+            not isinstance(latency_target, (int, float)) or latency_target <= 0
+        ):
+            raise ValueError("latency_target must be a positive number")
+        if (
+            not isinstance(decrease_factor, (int, float))
+            or not 0 < decrease_factor < 1
+        ):
+            raise ValueError("decrease_factor must be between 0 and 1")
+
+        self._min_limit = min_limit
+        self._max_limit = max_limit
+        self._latency_target = latency_target
+        self._decrease_factor = decrease_factor
+
+        self._limit = max_limit
+        self._in_flight = 0
+        self._waiters: deque[asyncio.Future[None]] = deque()
+        self._latencies: deque[float] = deque(maxlen=_LATENCY_SAMPLES)
+        self._round_completed = 0
+        # Requests started before a cut must not trigger another cut.
+        self._started = 0
+        self._cut_at = 0
+
+    @property
+    def limit(self) -> int:
+        """The current number of requests allowed in flight."""
+        return self._limit
+
+    @property
+    def in_flight(self) -> int:
+        """The number of requests currently in flight."""
+        return self._in_flight
+
+    async def acquire(self) -> int:
+        """
+        Wait for a free slot.
+
+        Returns:
+            The sequence number of the request, to pass to ``release()``.
+        """
+        if self._in_flight >= self._limit or self._waiters:
+            future = asyncio.get_running_loop().create_future()
+            self._waiters.append(future)
+            try:
+                await future
+            except BaseException:
+                if future.done() and not future.cancelled():
+                    # The slot was handed over, give it back.
+                    self._in_flight -= 1
+                    self._wake()
+                raise
+        else:
+            self._in_flight += 1
+
+        self._started += 1
+        return self._started
+
+    def release(self, sequence: int, latency: float, overloaded: bool) -> None:
+        """
+        Free a slot and adjust the limit from the outcome of the request.
+
+        Args:
+            sequence: The value returned by ``acquire()``.
+            latency: The request latency in seconds.
+            overloaded: Whether the request failed with a 429, a 5xx or a
+                transport error.
+        """
+        self._in_flight -= 1
+
+        if overloaded:
+            if sequence > self._cut_at:
+                self._decrease("server overloaded")
+        else:
+            self._latencies.append(latency)
+            self._round_completed += 1
+            if self._round_completed >= self._limit:
+                self._end_round()
+
+        self._wake()
+
+    def _end_round(self) -> None:
+        self._round_completed = 0
+
+        if self._latency_target is not None:
+            latencies = sorted(self._latencies)
+            p95 = latencies[int(0.95 * (len(latencies) - 1))]
+            if p95 > self._latency_target:
+                self._decrease(f"p95 latency {p95:.3f}s above target")
+                return
+
+        if self._limit < self._max_limit:
+            self._limit += 1
+
+    def _decrease(self, reason: str) -> None:
+        limit = max(self._min_limit, int(self._limit * self._decrease_factor))
+        if limit != self._limit:
+            logger.debug(
+                "Reducing concurrency from %d to %d: %s",
+                self._limit,
+                limit,
+                reason,
+            )
+        self._limit = limit
+        self._cut_at = self._started
+        self._round_completed = 0
+        self._latencies.clear()
+
+    def _wake(self) -> None:
+        while self._waiters and self._in_flight < self._limit:
+            future = self._waiters.popleft()
+            if not future.done():
+                self._in_flight += 1
+                future.set_result(None)
+
+    def __repr__(self) -> str:
+        return (
+            f"AdaptiveConcurrencyLimiter("
+            f"limit={self._limit}, "
+            f"min_limit={self._min_limit}, "
+            f"max_limit={self._max_limit})"
+        )
+
+
+class AdaptiveConcurrencyTransport(AsyncBaseTransport):
+    """
+    A transport holding requests until the adaptive limit lets them run.
+    """
+
+    def __init__(
+        self,
+        transport: AsyncBaseTransport,
+        limiter: AdaptiveConcurrencyLimiter,
+    ) -> None:
+        self._transport = transport
+        self._limiter = limiter
+
+    async def handle_async_request(self, request: Request) -> Response:
+        waited = time.perf_counter()
+        sequence = await self._limiter.acquire()
+        add_limit_wait(request, time.perf_counter() - waited)
+        start = time.monotonic()
+        overloaded = True
+        try:
+            response = await self._transport.handle_async_request(request)
+            overloaded = (
+                response.status_code == 429 or response.status_code >= 500
+            )
+            return response
+        except TransportError:
+            raise
+        except BaseException:
+            # Not a sign of overload (e.g. a cancellation).
+            overloaded = False
+            raise
+        finally:
+            self._limiter.release(
+                sequence, time.monotonic() - start, overloaded
+            )
+
+    async def aclose(self) -> None:
+        await self._transport.aclose()
+
+
+class StreamLimitTransport(AsyncBaseTransport):
+    """
+    A transport capping the number of requests in flight across the pool.
+
+    In HTTP/2 mode, it holds the requests beyond ``max_connections``
+    times ``http2_max_streams`` until one of the requests in flight is
+    done. This is an aggregate cap: ``httpcore`` decides how the streams
+    are spread over the connections. A slot is held until the response
+    body is read or closed, so the count matches the open streams. It
+    sits right above the HTTP transport, so every attempt of every
+    request is counted.
+    """
+
+    def __init__(self, transport: AsyncBaseTransport, limit: int) -> None:
+        self._transport = transport
+        self._limit = limit
+        self._semaphore = asyncio.Semaphore(limit)
+
+    @property
+    def limit(self) -> int:
+        """The number of requests allowed in flight."""
+        return self._limit
+
+    async def handle_async_request(self, request: Request) -> Response:
+        start = time.perf_counter()
+        await self._semaphore.acquire()
+        add_limit_wait(request, time.perf_counter() - start)
+        try:
+            response = await self._transport.handle_async_request(request)
+        except BaseException:
+            self._semaphore.release()
+            raise
+        if isinstance(response.stream, ByteStream):
+            # The body is already in memory.
+            self._semaphore.release()
+        else:
+            response.stream = _ReleasingStream(
+                response.stream, self._semaphore  # type: ignore[arg-type]
+            )
+        return response
+
+    async def aclose(self) -> None:
+        await self._transport.aclose()
+
+
+class _ReleasingStream(AsyncByteStream):
+    """A response body releasing its slot once closed."""
+
+    def __init__(
+        self, stream: AsyncByteStream, semaphore: asyncio.Semaphore
+    ) -> None:
+        self._stream = stream
+        self._semaphore: Optional[asyncio.Semaphore] = semaphore
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self) -> None:
+        try:
+            await self._stream.aclose()
+        finally:
+            if self._semaphore is not None:
+                self._semaphore.release()
+                self._semaphore = None
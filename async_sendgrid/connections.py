@@ -0,0 +1,280 @@
+"""
+Connection statistics of the HTTP transport.
+
+This is an internal module and should not be used directly.
+"""
+
+from __future__ import annotations
+
+import time
+from typing import TYPE_CHECKING, NamedTuple
+
+from httpx import AsyncHTTPTransport  # type: ignore
+from opentelemetry.trace import get_current_span
+
+if TYPE_CHECKING:
+    from typing import Any, Callable, Optional
+
+    from httpx import Request, Response  # type: ignore
+    from opentelemetry.trace import Span
+
+# Events marking the end of the wait for a connection: a new connection
+# starts connecting, or the request is written on an existing one.
+_ACQUIRED = frozenset(
+    {
+        "connection.connect_tcp.started",
+        "http11.send_request_headers.started",
+        "http2.send_request_headers.started",
+    }
+)
+_PENDING = frozenset({"CONNECTING", "CONNECTION FAILED"})
+
+# The phases of an attempt, by httpcore trace step.
+_PHASES = {
+    "connection.connect_tcp": "connect",
+    "connection.start_tls": "tls",
+    "http11.send_request_headers": "write",
+    "http11.send_request_body": "write",
+    "http11.receive_response_headers": "server",
+    "http2.send_request_headers": "write",
+    "http2.send_request_body": "write",
+    "http2.receive_response_headers": "server",
+}
+_ATTRIBUTES = {
+    phase: f"sendgrid.phase.{phase}_ms"
+    for phase in (
+        "limit_wait",
+        "pool_wait",
+        "connect",
+        "tls",
+        "write",
+        "server",
+        "retry_wait",
+    )
+}
+
+# Request extension holding the phases of the previous attempts.
+_PHASES_EXTENSION = "sendgrid.phases"
+# Request extension holding the time the attempt was held by the
+# client-side limits.
+_LIMIT_WAIT_EXTENSION = "sendgrid.limit_wait"
+_ATTEMPT_END = "attempt_end"
+_ATTEMPTS = "attempts"
+_FIRST_ATTEMPT = "first_attempt"
+
+
+class PoolStats(NamedTuple):
+    """A snapshot of the connections of a ``ConnectionPool``."""
+
+    connections: int
+    active: int
+    idle: int
+    queued: int
+    opened: int
+    closed: int
+    tls_handshakes: int
+    waits: int
+    wait_time: float
+    max_wait: float
+
+    @property
+    def mean_wait(self) -> float:
+        """The mean wait for a connection, in seconds."""
+        return self.wait_time / self.waits if self.waits else 0.0
+
+
+EMPTY_STATS = PoolStats(0, 0, 0, 0, 0, 0, 0, 0, 0.0, 0.0)
+
+
+class TracedHTTPTransport(AsyncHTTPTransport):
+    """
+    An ``AsyncHTTPTransport`` keeping statistics of its connections.
+
+    Through the ``trace`` extension of ``httpcore``, it counts the
+    connections opened and the TLS handshakes, and measures how long each
+    request waits for a connection. The other figures are read from the
+    connection pool when ``stats()`` is called.
+
+    When the current span is recording, or ``on_phase`` is set, each
+    attempt is also broken down into phases: the wait on the client-side
+    limits (rate limiter, throttle gate and concurrency limits, as added
+    by ``add_limit_wait()``), the wait for a connection, the TCP
+    connection (DNS resolution included), the TLS handshake, the request
+    write, the server time to the response headers, and the wait since
+    the previous attempt. The span attributes hold the totals across
+    attempts, and each attempt of a retried request adds a span event.
+    """
+
+    def __init__(
+        self,
+        *args: Any,
+        on_phase: Optional[Callable[[str, float], None]] = None,
+        **kwargs: Any,
+    ) -> None:
+        super().__init__(*args, **kwargs)
+        self._on_phase = on_phase
+        self._opened = 0
+        self._tls_handshakes = 0
+        self._waits = 0
+        self._wait_time = 0.0
+        self._max_wait = 0.0
+
+    async def handle_async_request(self, request: Request) -> Response:
+        start = time.perf_counter()
+        waiting = True
+        parent = request.extensions.get("trace")
+        limit_wait = request.extensions.pop(_LIMIT_WAIT_EXTENSION, None)
+        span = get_current_span()
+        phases: Optional[dict[str, float]] = (
+            {} if self._on_phase is not None or span.is_recording() else None
+        )
+        if phases is not None and limit_wait is not None:
+            phases["limit_wait"] = limit_wait
+        started: dict[str, float] = {}
+
+        async def trace(event: str, info: dict[str, Any]) -> None:
+            nonlocal waiting
+            if waiting and event in _ACQUIRED:
+                waiting = False
+                wait = time.perf_counter() - start
+                self._record_wait(wait)
+                if phases is not None:
+                    phases["pool_wait"] = wait
+            if event == "connection.connect_tcp.complete":
+                self._opened += 1
+            elif event == "connection.start_tls.complete":
+                self._tls_handshakes += 1
+
+            if phases is not None:
+                step, _, stage = event.rpartition(".")
+                phase = _PHASES.get(step)
+                if phase is not None:
+                    if stage == "started":
+                        started[step] = time.perf_counter()
+                    elif step in started:
+                        phases[phase] = (
+                            phases.get(phase, 0.0)
+                            + time.perf_counter()
+                            - started.pop(step)
+                        )
+            if parent is not None:
+                await parent(event, info)
+
+        request.extensions["trace"] = trace
+        try:
+            return await super().handle_async_request(request)
+        finally:
+            # The request is sent again as it is on retries.
+            if parent is None:
+                del request.extensions["trace"]
+            else:
+                request.extensions["trace"] = parent
+            if phases is not None:
+                self._record_phases(request, span, start, phases)
+
+    def _record_phases(
+        self,
+        request: Request,
+        span: Span,
+        start: float,
+        phases: dict[str, float],
+    ) -> None:
+        # The timings of the previous attempts travel with the request.
+        totals = request.extensions.get(_PHASES_EXTENSION)
+        if totals is None:
+            totals = request.extensions[_PHASES_EXTENSION] = {}
+        else:
+            # The wait on the limits is a phase of its own.
+            phases["retry_wait"] = (
+                start
+                - phases.get("limit_wait", 0.0)
+                - totals.pop(_ATTEMPT_END)
+            )
+        totals[_ATTEMPT_END] = time.perf_counter()
+        attempts = totals.get(_ATTEMPTS, 0) + 1
+        totals[_ATTEMPTS] = attempts
+
+        for phase, seconds in phases.items():
+            totals[phase] = totals.get(phase, 0.0) + seconds
+            if self._on_phase is not None:
+                self._on_phase(phase, seconds)
+
+        if span.is_recording():
+            if attempts == 1:
+                # Attempts only get an event once the request is retried.
+                totals[_FIRST_ATTEMPT] = phases
+            else:
+                first = totals.pop(_FIRST_ATTEMPT, None)
+                if first is not None:
+                    span.add_event("sendgrid.attempt", _milliseconds(first))
+                span.add_event("sendgrid.attempt", _milliseconds(phases))
+            attributes = _milliseconds(totals)
+            attributes["sendgrid.attempts"] = attempts
+            span.set_attributes(attributes)
+
+    def _record_wait(self, wait: float) -> None:
+        self._waits += 1
+        self._wait_time += wait
+        if wait > self._max_wait:
+            self._max_wait = wait
+
+    def stats(self) -> PoolStats:
+        """Return a snapshot of the connection statistics."""
+        pool = self._pool
+        connections = pool.connections
+        idle = sum(1 for connection in connections if connection.is_idle())
+        established = sum(
+            1
+            for connection in connections
+            if connection.info() not in _PENDING and not connection.is_closed()
+        )
+        queued = _queued(pool)
+        return PoolStats(
+            connections=len(connections),
+            active=len(connections) - idle,
+            idle=idle,
+            queued=queued,
+            opened=self._opened,
+            closed=max(self._opened - established, 0),
+            tls_handshakes=self._tls_handshakes,
+            waits=self._waits,
+            wait_time=self._wait_time,
+            max_wait=self._max_wait,
+        )
+
+
+def add_limit_wait(request: Request, seconds: float) -> None:
+    """
+    Add the time a request was held by a client-side limit to its attempt.
+
+    Args:
+        request: The request about to be sent.
+        seconds: The time the request waited.
+    """
+    extensions = request.extensions
+    extensions[_LIMIT_WAIT_EXTENSION] = (
+        extensions.get(_LIMIT_WAIT_EXTENSION, 0.0) + seconds
+    )
+
+
+def _queued(pool: Any) -> int:
+    """
+    Count the requests waiting for a connection.
+
+    The queue is private to ``httpcore``, so it is only counted when it
+    can be read; it is reported as empty otherwise.
+    """
+    queued = 0
+    for request in getattr(pool, "_requests", ()):
+        is_queued = getattr(request, "is_queued", None)
+        if is_queued is not None and is_queued():
+            queued += 1
+    return queued
+
+
+def _milliseconds(phases: dict[str, Any]) -> dict[str, Any]:
+    return {
+        _ATTRIBUTES[phase]: seconds * 1000
+        for phase, seconds in phases.items()
+        if phase in _ATTRIBUTES
+    }
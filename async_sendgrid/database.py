@@ -0,0 +1,72 @@
+"""
+SQLite access from the event loop.
+
+This is an internal module and should not be used directly.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from typing import Any, Callable
+
+
+class DatabaseThread:
+    """
+    A thread running the database calls of a store.
+
+    ``sqlite3`` calls block, so they run off the event loop. They all run
+    on the same thread, in the order they were submitted, so a connection
+    is never used by two calls at once.
+    """
+
+    def __init__(self, name: str) -> None:
+        """
+        Initialize the thread.
+
+        Args:
+            name (str): Prefix of the thread name.
+        """
+        self._executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix=name
+        )
+
+    async def run(self, func: Callable[..., Any], *args: Any) -> Any:
+        """
+        Run a function on the thread.
+
+        Args:
+            func (Callable[..., Any]): The function to run.
+            *args (Any): The arguments of the function.
+
+        Returns:
+            Any: The result of the function.
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, func, *args)
+
+    def shutdown(self) -> None:
+        """Let the thread exit once the calls submitted have run."""
+        self._executor.shutdown(wait=False)
+
+
+def connect(path: str) -> sqlite3.Connection:
+    """
+    Open a database in WAL mode, for use from a ``DatabaseThread``.
+
+    Transactions are managed explicitly, and the connection may be used
+    from a thread other than the one opening it.
+
+    Args:
+        path (str): Path of the SQLite database.
+
+    Returns:
+        sqlite3.Connection: The connection.
+    """
+    db = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+    db.execute("PRAGMA journal_mode=WAL")
+    return db
@@ -0,0 +1,339 @@
+"""
+Idempotency keys and duplicate send suppression.
+
+SendGrid's mail/send endpoint has no idempotency support: posting the same
+message twice delivers it twice. A ``DedupeStore`` remembers the messages
+accepted recently, so a message sent again with the same key within the
+window is answered from the store instead of being delivered again.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import logging
+import sqlite3
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import TYPE_CHECKING, NamedTuple
+
+from httpx import Request, Response  # type: ignore
+
+from async_sendgrid.database import DatabaseThread, connect
+
+if TYPE_CHECKING:
+    from typing import Awaitable, Callable, Optional
+
+    from async_sendgrid.payload import Payload
+
+logger = logging.getLogger(__name__)
+
+# Set on the extensions of a response answered from the dedupe store.
+REPLAYED = "idempotent_replay"
+
+
+class SentMessage(NamedTuple):
+    """What is remembered of an accepted message."""
+
+    status_code: int
+    message_id: Optional[str] = None
+
+
+def content_key(payload: Payload) -> str:
+    """
+    Derive an idempotency key from the content of a request body.
+
+    Args:
+        payload: The encoded request body.
+
+    Returns:
+        The hex SHA-256 digest of the body.
+    """
+    return hashlib.sha256(payload.content).hexdigest()
+
+
+class DedupeStore(ABC):
+    """
+    Storage for the idempotency keys of recently accepted messages.
+
+    Keys expire ``ttl`` seconds after being stored, and the least recently
+    stored keys are evicted beyond ``max_size`` entries.
+    """
+
+    def __init__(self, ttl: float = 86400.0, max_size: int = 100_000):
+        """
+        Initialize the store.
+
+        Args:
+            ttl (float, optional): Seconds during which a key suppresses
+                duplicates. Defaults to 86400.0 (a day).
+            max_size (int, optional): Maximum number of keys kept.
+                Defaults to 100000.
+        """
+        if not isinstance(ttl, (int, float)) or ttl <= 0:
+            raise ValueError("ttl must be a positive number")
+        if not isinstance(max_size, int) or max_size < 1:
+            raise ValueError("max_size must be a positive integer")
+
+        self._ttl = ttl
+        self._max_size = max_size
+
+    @property
+    def ttl(self) -> float:
+        """Seconds during which a key suppresses duplicates."""
+        return self._ttl
+
+    @property
+    def max_size(self) -> int:
+        """Maximum number of keys kept."""
+        return self._max_size
+
+    @abstractmethod
+    async def get(self, key: str) -> Optional[SentMessage]:
+        """Return the message accepted under ``key``, if not expired."""
+
+    @abstractmethod
+    async def put(self, key: str, message: SentMessage) -> None:
+        """Remember that a message was accepted under ``key``."""
+
+    async def close(self) -> None:
+        """Release the resources held by the store."""
+
+
+class MemoryDedupeStore(DedupeStore):
+    """An in-process TTL/LRU dedupe store."""
+
+    def __init__(self, ttl: float = 86400.0, max_size: int = 100_000):
+        super().__init__(ttl, max_size)
+        self._entries: OrderedDict[str, tuple[float, SentMessage]] = (
+            OrderedDict()
+        )
+
+    async def get(self, key: str) -> Optional[SentMessage]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= time.monotonic():
+            del self._entries[key]
+            return None
+        return entry[1]
+
+    async def put(self, key: str, message: SentMessage) -> None:
+        self._entries.pop(key, None)
+        self._entries[key] = (time.monotonic() + self._ttl, message)
+        while len(self._entries) > self._max_size:
+            self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __repr__(self) -> str:
+        return f"MemoryDedupeStore(ttl={self._ttl}, max_size={self._max_size})"
+
+
+class SQLiteDedupeStore(DedupeStore):
+    """
+    A dedupe store persisted to SQLite, surviving process restarts and
+    shared by the processes using the same file.
+    """
+
+    def __init__(
+        self, path: str, ttl: float = 86400.0, max_size: int = 100_000
+    ):
+        """
+        Initialize the store.
+
+        Args:
+            path (str): Path of the SQLite database.
+            ttl (float, optional): Seconds during which a key suppresses
+                duplicates. Defaults to 86400.0 (a day).
+            max_size (int, optional): Maximum number of keys kept.
+                Defaults to 100000.
+        """
+        super().__init__(ttl, max_size)
+        self._path = path
+        self._thread = DatabaseThread("sendgrid-dedupe")
+        self._db: Optional[sqlite3.Connection] = None
+        self._writes = 0
+
+    @property
+    def path(self) -> str:
+        """Path of the SQLite database."""
+        return self._path
+
+    async def get(self, key: str) -> Optional[SentMessage]:
+        return await self._thread.run(self._get, key, time.time())
+
+    async def put(self, key: str, message: SentMessage) -> None:
+        await self._thread.run(self._put, key, message, time.time())
+
+    async def close(self) -> None:
+        await self._thread.run(self._close)
+        self._thread.shutdown()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._db is None:
+            self._db = connect(self._path)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS dedupe ("
+                "key TEXT PRIMARY KEY, "
+                "status_code INTEGER NOT NULL, "
+                "message_id TEXT, "
+                "expires_at REAL NOT NULL)"
+            )
+            self._db.execute(
+                "CREATE INDEX IF NOT EXISTS dedupe_expiry "
+                "ON dedupe (expires_at)"
+            )
+        return self._db
+
+    def _get(self, key: str, now: float) -> Optional[SentMessage]:
+        row = (
+            self._connect()
+            .execute(
+                "SELECT status_code, message_id FROM dedupe "
+                "WHERE key = ? AND expires_at > ?",
+                (key, now),
+            )
+            .fetchone()
+        )
+        return SentMessage(*row) if row is not None else None
+
+    def _put(self, key: str, message: SentMessage, now: float) -> None:
+        db = self._connect()
+        db.execute(
+            "INSERT OR REPLACE INTO dedupe VALUES (?, ?, ?, ?)",
+            (key, message.status_code, message.message_id, now + self._ttl),
+        )
+        self._writes += 1
+        if self._writes % 1000 == 0:
+            self._evict(db, now)
+
+    def _evict(self, db: sqlite3.Connection, now: float) -> None:
+        db.execute("DELETE FROM dedupe WHERE expires_at <= ?", (now,))
+        db.execute(
+            "DELETE FROM dedupe WHERE key IN ("
+            "SELECT key FROM dedupe ORDER BY expires_at DESC "
+            "LIMIT -1 OFFSET ?)",
+            (self._max_size,),
+        )
+
+    def _close(self) -> None:
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    def __repr__(self) -> str:
+        return f"SQLiteDedupeStore(path={self._path!r}, ttl={self._ttl})"
+
+
+class Deduplicator:
+    """
+    Suppress duplicate sends of the same idempotency key.
+
+    A key already accepted within the store's window is answered with a
+    replayed response, and concurrent sends of the same key share a single
+    request. Only accepted (2xx) messages are remembered, so a failed send
+    can be tried again.
+
+    This is an internal class and should not be used directly.
+    """
+
+    def __init__(
+        self,
+        store: DedupeStore,
+        on_suppressed: Optional[Callable[[], None]] = None,
+    ) -> None:
+        """
+        Initialize the deduplicator.
+
+        Args:
+            store: The store of the accepted keys.
+            on_suppressed: Called for each send answered without a
+                request of its own.
+        """
+        self._store = store
+        self._on_suppressed = on_suppressed
+        self._in_flight: dict[str, asyncio.Future[Response]] = {}
+
+    @property
+    def store(self) -> DedupeStore:
+        return self._store
+
+    async def run(
+        self, key: str, url: str, send: Callable[[], Awaitable[Response]]
+    ) -> Response:
+        """
+        Send a message unless its key was already accepted.
+
+        Args:
+            key: The idempotency key of the message.
+            url: The URL of the endpoint, set on replayed responses.
+            send: Coroutine function sending the message.
+
+        Returns:
+            The response of the request, or a replayed response flagged
+            with ``response.extensions["idempotent_replay"]``.
+        """
+        while key in self._in_flight:
+            pending = self._in_flight[key]
+            try:
+                response = await asyncio.shield(pending)
+            except asyncio.CancelledError:
+                if not pending.cancelled():
+                    raise
+                # The request was cancelled by its caller, not by us.
+            else:
+                self._suppressed(key)
+                return response
+
+        future: asyncio.Future[Response] = (
+            asyncio.get_running_loop().create_future()
+        )
+        self._in_flight[key] = future
+        try:
+            sent = await self._store.get(key)
+            if sent is not None:
+                response = _replay(sent, url)
+                self._suppressed(key)
+            else:
+                response = await send()
+                if response.is_success:
+                    await self._store.put(
+                        key,
+                        SentMessage(
+                            response.status_code,
+                            response.headers.get("X-Message-Id"),
+                        ),
+                    )
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as exc:
+            future.set_exception(exc)
+            # Waiters get the exception; do not warn if there are none.
+            future.exception()
+            raise
+        else:
+            future.set_result(response)
+            return response
+        finally:
+            del self._in_flight[key]
+
+    def _suppressed(self, key: str) -> None:
+        logger.info("Suppressed a duplicate send of key %s", key)
+        if self._on_suppressed is not None:
+            self._on_suppressed()
+
+
+def _replay(sent: SentMessage, url: str) -> Response:
+    headers = {}
+    if sent.message_id is not None:
+        headers["X-Message-Id"] = sent.message_id
+    return Response(
+        sent.status_code,
+        headers=headers,
+        request=Request("POST", url),
+        extensions={REPLAYED: True},
+    )
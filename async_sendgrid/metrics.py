@@ -0,0 +1,257 @@
+"""
+OpenTelemetry metrics for SendGrid API requests.
+
+This is an internal module and should not be used directly.
+"""
+
+from __future__ import annotations
+
+import time
+import weakref
+from typing import TYPE_CHECKING
+
+from httpx import AsyncBaseTransport  # type: ignore
+from opentelemetry import metrics
+from opentelemetry.metrics import Observation
+
+if TYPE_CHECKING:
+    from typing import Iterable, Optional
+
+    from httpx import Request, Response  # type: ignore
+    from opentelemetry.metrics import CallbackOptions, MeterProvider
+
+    from async_sendgrid.connections import PoolStats
+    from async_sendgrid.pool import ConnectionPool
+
+# Request extension counting the attempts of a request.
+_ATTEMPTS = "sendgrid.attempts"
+
+_STATUS_CLASSES = {
+    1: {"http.response.status_class": "1xx"},
+    2: {"http.response.status_class": "2xx"},
+    3: {"http.response.status_class": "3xx"},
+    4: {"http.response.status_class": "4xx"},
+    5: {"http.response.status_class": "5xx"},
+}
+_ERROR = {"http.response.status_class": "error"}
+
+# Attributes of the phase durations, built once per phase.
+_PHASES: dict[str, dict[str, str]] = {}
+
+
+class SendMetrics:
+    """
+    The metric instruments of the library.
+
+    The instruments are created once; recording a request only adds
+    values to them.
+    """
+
+    def __init__(self, meter_provider: Optional[MeterProvider] = None):
+        meter = metrics.get_meter(__name__, meter_provider=meter_provider)
+        self.request_duration = meter.create_histogram(
+            "sendgrid.request.duration",
+            unit="s",
+            description="Duration of mail/send requests, retries included.",
+        )
+        self.request_size = meter.create_histogram(
+            "sendgrid.request.body.size",
+            unit="By",
+            description="Size of mail/send request bodies.",
+        )
+        self.attempt_size = meter.create_histogram(
+            "http.client.request.body.size",
+            unit="By",
+            description="Size of the bodies sent on the wire, per attempt.",
+        )
+        self.compression_ratio = meter.create_histogram(
+            "sendgrid.compression.ratio",
+            unit="1",
+            description="Size of request bodies over their compressed size.",
+        )
+        self.compression_cpu_time = meter.create_histogram(
+            "sendgrid.compression.cpu_time",
+            unit="s",
+            description="CPU time spent compressing request bodies.",
+        )
+        self.responses = meter.create_counter(
+            "sendgrid.responses",
+            unit="{response}",
+            description="mail/send requests, by response status class.",
+        )
+        self.retries = meter.create_counter(
+            "sendgrid.retries",
+            unit="{attempt}",
+            description="Retried mail/send attempts.",
+        )
+        self.throttled = meter.create_counter(
+            "sendgrid.throttled",
+            unit="{response}",
+            description="Attempts rejected with a 429.",
+        )
+        self.suppressed = meter.create_counter(
+            "sendgrid.dedupe.suppressed",
+            unit="{message}",
+            description="Duplicate sends answered without a request.",
+        )
+        self.in_flight = meter.create_up_down_counter(
+            "sendgrid.requests.in_flight",
+            unit="{request}",
+            description="mail/send requests in flight.",
+        )
+        self.pool_wait = meter.create_histogram(
+            "sendgrid.pool.wait.duration",
+            unit="s",
+            description="Time requests wait for a connection.",
+        )
+        self.phase_duration = meter.create_histogram(
+            "sendgrid.phase.duration",
+            unit="s",
+            description="Duration of the phases of mail/send requests.",
+        )
+
+        # Pools are observed without being kept alive.
+        self._pools: weakref.WeakSet[ConnectionPool] = weakref.WeakSet()
+        meter.create_observable_up_down_counter(
+            "http.client.open_connections",
+            callbacks=[self._observe_connections],
+            unit="{connection}",
+            description="Open connections, by state.",
+        )
+        meter.create_observable_gauge(
+            "sendgrid.pool.queued_requests",
+            callbacks=[self._observe("queued")],
+            unit="{request}",
+            description="Requests waiting for a connection.",
+        )
+        meter.create_observable_counter(
+            "sendgrid.pool.connections.opened",
+            callbacks=[self._observe("opened")],
+            unit="{connection}",
+            description="Connections opened.",
+        )
+        meter.create_observable_counter(
+            "sendgrid.pool.connections.closed",
+            callbacks=[self._observe("closed")],
+            unit="{connection}",
+            description="Connections closed.",
+        )
+        meter.create_observable_counter(
+            "sendgrid.pool.tls_handshakes",
+            callbacks=[self._observe("tls_handshakes")],
+            unit="{handshake}",
+            description="TLS handshakes completed.",
+        )
+
+    def record_phase(self, phase: str, seconds: float) -> None:
+        """Record the duration of a phase of a request."""
+        attributes = _PHASES.get(phase)
+        if attributes is None:
+            attributes = _PHASES[phase] = {"sendgrid.phase": phase}
+        self.phase_duration.record(seconds, attributes)
+        if phase == "pool_wait":
+            self.pool_wait.record(seconds)
+
+    def observe(self, pool: ConnectionPool) -> None:
+        """Report the connection statistics of a pool."""
+        self._pools.add(pool)
+
+    def _stats(self) -> list[PoolStats]:
+        return [pool.stats() for pool in list(self._pools)]
+
+    def _observe_connections(
+        self, options: CallbackOptions
+    ) -> Iterable[Observation]:
+        stats = self._stats()
+        yield Observation(
+            sum(s.active for s in stats), {"http.connection.state": "active"}
+        )
+        yield Observation(
+            sum(s.idle for s in stats), {"http.connection.state": "idle"}
+        )
+
+    def _observe(self, field: str):
+        def callback(options: CallbackOptions) -> Iterable[Observation]:
+            yield Observation(sum(getattr(s, field) for s in self._stats()))
+
+        return callback
+
+
+_instruments: Optional[SendMetrics] = None
+
+
+def get_metrics() -> SendMetrics:
+    """Return the metric instruments, creating them on first use."""
+    global _instruments
+    if _instruments is None:
+        _instruments = SendMetrics()
+    return _instruments
+
+
+class MetricsTransport(AsyncBaseTransport):
+    """
+    A transport recording the duration, size and outcome of requests.
+
+    It sits above the retry transport, so a request is measured once
+    however many attempts it takes.
+    """
+
+    def __init__(self, transport: AsyncBaseTransport) -> None:
+        self._transport = transport
+        self._metrics = get_metrics()
+
+    async def handle_async_request(self, request: Request) -> Response:
+        instruments = self._metrics
+        length = request.headers.get("Content-Length")
+        if length is not None:
+            instruments.request_size.record(int(length))
+
+        instruments.in_flight.add(1)
+        start = time.perf_counter()
+        attributes = _ERROR
+        try:
+            response = await self._transport.handle_async_request(request)
+            attributes = _STATUS_CLASSES.get(
+                response.status_code // 100, _ERROR
+            )
+            return response
+        finally:
+            instruments.in_flight.add(-1)
+            instruments.request_duration.record(
+                time.perf_counter() - start, attributes
+            )
+            instruments.responses.add(1, attributes)
+
+    async def aclose(self) -> None:
+        await self._transport.aclose()
+
+
+class AttemptMetricsTransport(AsyncBaseTransport):
+    """
+    A transport counting retries and 429s.
+
+    It sits below the retry transport, so it sees every attempt.
+    """
+
+    def __init__(self, transport: AsyncBaseTransport) -> None:
+        self._transport = transport
+        self._metrics = get_metrics()
+
+    async def handle_async_request(self, request: Request) -> Response:
+        instruments = self._metrics
+        attempts = request.extensions.get(_ATTEMPTS, 0) + 1
+        request.extensions[_ATTEMPTS] = attempts
+        if attempts > 1:
+            instruments.retries.add(1)
+
+        length = request.headers.get("Content-Length")
+        if length is not None:
+            instruments.attempt_size.record(int(length))
+
+        response = await self._transport.handle_async_request(request)
+        if response.status_code == 429:
+            instruments.throttled.add(1)
+        return response
+
+    async def aclose(self) -> None:
+        await self._transport.aclose()
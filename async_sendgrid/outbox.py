@@ -0,0 +1,393 @@
+"""
+Durable on-disk outbox for SendGrid messages.
+
+Messages are persisted to a SQLite database in WAL mode before being sent,
+and are only removed once SendGrid accepted them. Messages left over by a
+crashed process are sent on the next start.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import sqlite3
+import time
+from typing import TYPE_CHECKING
+
+from async_sendgrid.database import DatabaseThread, connect
+from async_sendgrid.exception import SessionClosedException
+from async_sendgrid.payload import to_payload
+
+if TYPE_CHECKING:
+    from typing import Any, Callable, Optional
+
+    from async_sendgrid.payload import Body
+    from async_sendgrid.sendgrid import SendgridAPI
+
+logger = logging.getLogger(__name__)
+
+_PENDING = 0
+_FAILED = 1
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    body BLOB NOT NULL,
+    state INTEGER NOT NULL DEFAULT 0,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    available_at REAL NOT NULL DEFAULT 0,
+    last_error TEXT
+);
+CREATE INDEX IF NOT EXISTS outbox_pending
+    ON outbox (state, available_at, id);
+"""
+
+
+class Outbox:
+    """
+    A persistent queue in front of ``SendgridAPI.send``.
+
+    ``enqueue()`` returns once the message is durably stored. Concurrent
+    enqueues are group-committed: they share a single transaction, and
+    therefore a single fsync. A pool of workers drains the outbox through
+    the client's connection pool; a message is deleted once SendGrid
+    accepted it, retried with exponential backoff on 429, 5xx and transport
+    errors, and marked as failed on other errors or after ``max_attempts``.
+
+    Example::
+
+        async with Outbox(sendgrid, "outbox.db") as outbox:
+            await outbox.enqueue(email)
+    """
+
+    def __init__(
+        self,
+        client: SendgridAPI,
+        path: str,
+        workers: int = 10,
+        max_attempts: int = 10,
+        backoff_factor: float = 0.5,
+        max_backoff: float = 300.0,
+    ) -> None:
+        """
+        Initialize the outbox.
+
+        Args:
+            client (SendgridAPI): The client sending the messages.
+            path (str): Path of the SQLite database.
+            workers (int, optional): Maximum number of messages sent
+                concurrently. Defaults to 10.
+            max_attempts (int, optional): Number of attempts after which a
+                message is marked as failed. Defaults to 10.
+            backoff_factor (float, optional): Multiplier for the
+                exponential backoff between attempts. Defaults to 0.5.
+            max_backoff (float, optional): Maximum delay in seconds between
+                attempts. Defaults to 300.0.
+        """
+        if not isinstance(workers, int) or workers < 1:
+            raise ValueError("workers must be a positive integer")
+        if not isinstance(max_attempts, int) or max_attempts < 1:
+            raise ValueError("max_attempts must be a positive integer")
+        if not isinstance(backoff_factor, (int, float)) or backoff_factor < 0:
+            raise ValueError("backoff_factor must be a positive number")
+        if not isinstance(max_backoff, (int, float)) or max_backoff < 0:
+            raise ValueError("max_backoff must be a positive number")
+
+        self._client = client
+        self._path = path
+        self._workers = workers
+        self._max_attempts = max_attempts
+        self._backoff_factor = backoff_factor
+        self._max_backoff = max_backoff
+
+        self._thread: Optional[DatabaseThread] = None
+        self._db: Optional[sqlite3.Connection] = None
+
+        self._writes: list[tuple[Any, ...]] = []
+        self._flush_task: Optional[asyncio.Task[None]] = None
+        self._dispatcher: Optional[asyncio.Task[None]] = None
+        self._deliveries: set[asyncio.Task[None]] = set()
+        self._in_progress: set[int] = set()
+        self._wakeup = asyncio.Event()
+        self._flushed = asyncio.Condition()
+        self._running = False
+
+    @property
+    def path(self) -> str:
+        """Path of the SQLite database."""
+        return self._path
+
+    @property
+    def is_running(self) -> bool:
+        """Whether the outbox accepts and sends messages."""
+        return self._running
+
+    async def start(self) -> None:
+        """Open the database and start draining it."""
+        if self._running:
+            return
+
+        self._thread = DatabaseThread("sendgrid-outbox")
+        await self._run(self._open)
+        self._running = True
+        self._dispatcher = asyncio.ensure_future(self._dispatch())
+
+    async def stop(self) -> None:
+        """
+        Stop sending, wait for the messages in flight and close the
+        database. Messages not sent yet are kept for the next start.
+        """
+        if not self._running:
+            return
+
+        self._running = False
+        self._wakeup.set()
+        if self._dispatcher is not None:
+            await self._dispatcher
+            self._dispatcher = None
+        if self._deliveries:
+            await asyncio.gather(*self._deliveries, return_exceptions=True)
+        if self._flush_task is not None:
+            await self._flush_task
+        if self._writes:
+            await self._flush()
+
+        await self._run(self._close)
+        assert self._thread is not None
+        self._thread.shutdown()
+        self._thread = None
+
+    async def enqueue(self, email: Body) -> int:
+        """
+        Durably store a message to be sent.
+
+        Args:
+            email: The message, as accepted by ``SendgridAPI.send()``.
+
+        Returns:
+            The identifier of the stored message.
+
+        Raises:
+            SessionClosedException: If the outbox is not running.
+        """
+        if not self._running:
+            raise SessionClosedException("Outbox is not running")
+
+        future: asyncio.Future[int] = (
+            asyncio.get_running_loop().create_future()
+        )
+        self._write(("insert", to_payload(email).content, future))
+        return await future
+
+    async def pending(self) -> int:
+        """Return the number of messages waiting to be sent."""
+        return await self._run(self._count, _PENDING)
+
+    async def failed(self) -> int:
+        """Return the number of messages which could not be sent."""
+        return await self._run(self._count, _FAILED)
+
+    async def join(self) -> None:
+        """Wait until every stored message was sent or failed."""
+        async with self._flushed:
+            while self._writes or await self.pending():
+                await self._flushed.wait()
+
+    async def __aenter__(self) -> Outbox:
+        await self.start()
+        return self
+
+    async def __aexit__(self, *args: Any) -> None:
+        await self.stop()
+
+    async def _dispatch(self) -> None:
+        errors = 0
+        while self._running:
+            self._wakeup.clear()
+            free = self._workers - len(self._in_progress)
+            rows = []
+            if free > 0:
+                try:
+                    rows = await self._run(
+                        self._fetch, time.time(), free + len(self._in_progress)
+                    )
+                except sqlite3.Error:
+                    # Keep draining once the database is usable again.
+                    errors += 1
+                    delay = self._backoff(errors)
+                    logger.exception(
+                        "Failed to read the outbox, retrying in %.2fs", delay
+                    )
+                    await self._wait(delay)
+                    continue
+                errors = 0
+                rows = [r for r in rows if r[0] not in self._in_progress]
+                rows = rows[:free]
+
+            for row_id, body, attempts in rows:
+                self._in_progress.add(row_id)
+                task = asyncio.ensure_future(
+                    self._deliver(row_id, body, attempts)
+                )
+                self._deliveries.add(task)
+                task.add_done_callback(self._deliveries.discard)
+
+            if not rows:
+                await self._wait(self._poll_interval())
+
+    async def _wait(self, timeout: float) -> None:
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _deliver(self, row_id: int, body: bytes, attempts: int) -> None:
+        try:
+            response = await self._client.send(body)
+        except Exception as exc:
+            self._retry_later(row_id, attempts, repr(exc))
+            return
+
+        status = response.status_code
+        if status < 300:
+            self._write(("delete", row_id))
+        elif status == 429 or status >= 500:
+            self._retry_later(row_id, attempts, f"HTTP {status}")
+        else:
+            logger.error(
+                "Outbox message %d rejected with HTTP %d", row_id, status
+            )
+            self._write(("fail", row_id, f"HTTP {status}: {response.text}"))
+
+    def _retry_later(self, row_id: int, attempts: int, error: str) -> None:
+        attempts += 1
+        if attempts >= self._max_attempts:
+            logger.error(
+                "Outbox message %d failed after %d attempts: %s",
+                row_id,
+                attempts,
+                error,
+            )
+            self._write(("fail", row_id, error))
+            return
+
+        delay = self._backoff(attempts)
+        self._write(("retry", row_id, time.time() + delay, error))
+
+    def _backoff(self, attempts: int) -> float:
+        return min(
+            self._backoff_factor * (2 ** (attempts - 1)), self._max_backoff
+        )
+
+    def _poll_interval(self) -> float:
+        # Delayed retries are picked up without being woken up.
+        return max(min(self._backoff_factor, 1.0), 0.01)
+
+    def _write(self, operation: tuple[Any, ...]) -> None:
+        self._writes.append(operation)
+        if self._flush_task is None:
+            self._flush_task = asyncio.ensure_future(self._flush_soon())
+
+    async def _flush_soon(self) -> None:
+        try:
+            # Let the other coroutines queue their writes in the same
+            # commit. Writes queued during a commit share the next one.
+            await asyncio.sleep(0)
+            while self._writes:
+                await self._flush()
+        finally:
+            self._flush_task = None
+
+    async def _flush(self) -> None:
+        writes, self._writes = self._writes, []
+        try:
+            row_ids = await self._run(self._apply, writes)
+        except Exception as exc:
+            logger.exception("Failed to write to the outbox")
+            for operation in writes:
+                if operation[0] != "insert":
+                    # Send the message again rather than losing it.
+                    self._in_progress.discard(operation[1])
+                elif not operation[2].done():
+                    operation[2].set_exception(exc)
+            return
+
+        for operation in writes:
+            if operation[0] == "insert":
+                if not operation[2].done():
+                    operation[2].set_result(row_ids.pop(0))
+            else:
+                # Only release the message once its new state is stored.
+                self._in_progress.discard(operation[1])
+
+        self._wakeup.set()
+        async with self._flushed:
+            self._flushed.notify_all()
+
+    async def _run(self, func: Callable[..., Any], *args: Any) -> Any:
+        if self._thread is None:
+            raise SessionClosedException("Outbox is not running")
+        return await self._thread.run(func, *args)
+
+    def _open(self) -> None:
+        self._db = connect(self._path)
+        self._db.execute("PRAGMA synchronous=FULL")
+        self._db.executescript(_SCHEMA)
+
+    def _close(self) -> None:
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    def _apply(self, writes: list[tuple[Any, ...]]) -> list[int]:
+        assert self._db is not None
+        row_ids = []
+        self._db.execute("BEGIN IMMEDIATE")
+        try:
+            for operation in writes:
+                kind = operation[0]
+                if kind == "insert":
+                    cursor = self._db.execute(
+                        "INSERT INTO outbox (body) VALUES (?)",
+                        (operation[1],),
+                    )
+                    assert cursor.lastrowid is not None
+                    row_ids.append(cursor.lastrowid)
+                elif kind == "delete":
+                    self._db.execute(
+                        "DELETE FROM outbox WHERE id = ?", (operation[1],)
+                    )
+                elif kind == "retry":
+                    self._db.execute(
+                        "UPDATE outbox SET attempts = attempts + 1, "
+                        "available_at = ?, last_error = ? WHERE id = ?",
+                        (operation[2], operation[3], operation[1]),
+                    )
+                else:
+                    self._db.execute(
+                        "UPDATE outbox SET attempts = attempts + 1, "
+                        "state = ?, last_error = ? WHERE id = ?",
+                        (_FAILED, operation[2], operation[1]),
+                    )
+            self._db.execute("COMMIT")
+        except BaseException:
+            self._db.execute("ROLLBACK")
+            raise
+        return row_ids
+
+    def _fetch(self, now: float, limit: int) -> list[tuple[int, bytes, int]]:
+        assert self._db is not None
+        return self._db.execute(
+            "SELECT id, body, attempts FROM outbox "
+            "WHERE state = ? AND available_at <= ? ORDER BY id LIMIT ?",
+            (_PENDING, now, limit),
+        ).fetchall()
+
+    def _count(self, state: int) -> int:
+        assert self._db is not None
+        return self._db.execute(
+            "SELECT COUNT(*) FROM outbox WHERE state = ?", (state,)
+        ).fetchone()[0]
+
+    def __repr__(self) -> str:
+        return f"Outbox(path={self._path!r}, workers={self._workers})"
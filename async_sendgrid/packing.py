@@ -0,0 +1,130 @@
+"""
+Personalization packing for the SendGrid v3 mail/send endpoint.
+
+Messages that only differ by their personalizations are merged into a
+single request body carrying many personalizations.
+"""
+
+from __future__ import annotations
+
+import json
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from typing import Any, Iterable
+
+    from sendgrid.helpers.mail import Mail  # type: ignore
+
+MAX_PERSONALIZATIONS = 1000
+MAX_RECIPIENTS = 1000
+
+_RECIPIENT_FIELDS = ("to", "cc", "bcc")
+
+
+class PackedMessage:
+    """
+    A request body merged from one or more messages.
+
+    Attributes:
+        payload: The JSON request body.
+        indexes: The input positions of the messages packed into it.
+    """
+
+    __slots__ = ("payload", "indexes", "_recipients")
+
+    def __init__(self, payload: dict[str, Any]) -> None:
+        self.payload = payload
+        self.payload["personalizations"] = []
+        self.indexes: list[int] = []
+        self._recipients: set[str] = set()
+
+    def fits(self, personalizations: list[dict[str, Any]]) -> bool:
+        """Whether the personalizations can be added to this body."""
+        recipients = _recipients(personalizations)
+        return (
+            len(self.payload["personalizations"]) + len(personalizations)
+            <= MAX_PERSONALIZATIONS
+            and len(self._recipients) + len(recipients) <= MAX_RECIPIENTS
+            # A recipient listed twice would only get the message once.
+            and self._recipients.isdisjoint(recipients)
+        )
+
+    def add(self, index: int, personalizations: list[dict[str, Any]]) -> None:
+        """Add a message's personalizations to this body."""
+        self.payload["personalizations"].extend(personalizations)
+        self._recipients.update(_recipients(personalizations))
+        self.indexes.append(index)
+
+    def __repr__(self) -> str:
+        return (
+            f"PackedMessage("
+            f"personalizations={len(self.payload['personalizations'])}, "
+            f"indexes={self.indexes!r})"
+        )
+
+
+def pack_key(payload: dict[str, Any]) -> str:
+    """
+    Compute the key grouping compatible messages.
+
+    Two messages can be packed together when everything but their
+    personalizations (sender, subject, content, template ID, attachments,
+    settings...) is identical.
+
+    Args:
+        payload: The JSON request body of a message.
+
+    Returns:
+        The packing key.
+    """
+    shared = {k: v for k, v in payload.items() if k != "personalizations"}
+    return json.dumps(shared, sort_keys=True, separators=(",", ":"))
+
+
+def pack_messages(emails: Iterable[Mail]) -> list[PackedMessage]:
+    """
+    Merge compatible messages into multi-personalization request bodies.
+
+    Each body holds at most 1000 personalizations and 1000 recipients, as
+    accepted by the v3 mail/send endpoint.
+
+    Args:
+        emails: The messages to pack.
+
+    Returns:
+        The packed request bodies, ordered by their first message.
+    """
+    packed: list[PackedMessage] = []
+    open_packs: dict[str, PackedMessage] = {}
+
+    for index, email in enumerate(emails):
+        payload = email.get()
+        personalizations = payload.get("personalizations") or []
+
+        if not personalizations:
+            # Nothing to merge, let the API report the invalid message.
+            single = PackedMessage(payload)
+            single.indexes.append(index)
+            packed.append(single)
+            continue
+
+        key = pack_key(payload)
+        current = open_packs.get(key)
+
+        if current is None or not current.fits(personalizations):
+            current = PackedMessage(payload)
+            open_packs[key] = current
+            packed.append(current)
+
+        current.add(index, personalizations)
+
+    return packed
+
+
+def _recipients(personalizations: list[dict[str, Any]]) -> set[str]:
+    return {
+        recipient["email"].lower()
+        for personalization in personalizations
+        for field in _RECIPIENT_FIELDS
+        for recipient in personalization.get(field, ())
+    }
@@ -0,0 +1,195 @@
+"""
+Request body encoding for the SendGrid v3 mail/send endpoint.
+
+Bodies are encoded to JSON bytes once and posted as-is, so httpx never
+re-encodes them. When ``orjson`` is installed it is used as the JSON
+backend, otherwise the standard library encoder is used.
+"""
+
+from __future__ import annotations
+
+import json
+from typing import TYPE_CHECKING, Union
+
+try:
+    import orjson  # type: ignore
+except ImportError:  # pragma: no cover
+    orjson = None  # type: ignore[assignment]
+
+if TYPE_CHECKING:
+    from typing import Any, Optional
+
+    from sendgrid.helpers.mail import Mail  # type: ignore
+
+
+def dumps(obj: Any) -> bytes:
+    """
+    Encode an object to compact JSON bytes.
+
+    Args:
+        obj: The object to encode.
+
+    Returns:
+        The UTF-8 encoded JSON document.
+    """
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False).encode()
+
+
+def loads(content: bytes) -> Any:
+    """
+    Decode a JSON document.
+
+    Args:
+        content: The UTF-8 encoded JSON document.
+
+    Returns:
+        The decoded object.
+    """
+    if orjson is not None:
+        return orjson.loads(content)
+    return json.loads(content)
+
+
+class Payload:
+    """
+    A pre-encoded mail/send request body.
+
+    Building a ``Payload`` once and sending it skips both ``Mail.get()`` and
+    JSON encoding on the send path. The optional metadata is only used for
+    telemetry.
+    """
+
+    __slots__ = (
+        "content",
+        "num_recipients",
+        "num_personalizations",
+        "has_attachments",
+    )
+
+    def __init__(
+        self,
+        content: bytes,
+        num_recipients: Optional[int] = None,
+        num_personalizations: Optional[int] = None,
+        has_attachments: Optional[bool] = None,
+    ) -> None:
+        """
+        Initialize the payload.
+
+        Args:
+            content (bytes): The JSON encoded request body.
+            num_recipients (int, optional): Number of ``to`` recipients of
+                the first personalization.
+            num_personalizations (int, optional): Number of
+                personalizations.
+            has_attachments (bool, optional): Whether the body carries
+                attachments.
+        """
+        self.content = content
+        self.num_recipients = num_recipients
+        self.num_personalizations = num_personalizations
+        self.has_attachments = has_attachments
+
+    @classmethod
+    def from_dict(cls, message: dict[str, Any]) -> Payload:
+        """
+        Encode a JSON request body.
+
+        Args:
+            message: The request body, as returned by ``Mail.get()``.
+
+        Returns:
+            The encoded payload.
+        """
+        personalizations = message.get("personalizations") or []
+        return cls(
+            dumps(message),
+            num_recipients=(
+                len(personalizations[0].get("to", ()))
+                if personalizations
+                else 0
+            ),
+            num_personalizations=len(personalizations),
+            has_attachments=bool(message.get("attachments")),
+        )
+
+    @classmethod
+    def from_mail(cls, email: Mail) -> Payload:
+        """
+        Encode a Mail object.
+
+        Args:
+            email: The message to encode.
+
+        Returns:
+            The encoded payload.
+        """
+        return cls.from_dict(email.get())
+
+    def __len__(self) -> int:
+        return len(self.content)
+
+    def __repr__(self) -> str:
+        return f"Payload(size={len(self.content)})"
+
+
+Body = Union["Mail", "dict[str, Any]", bytes, bytearray, memoryview, Payload]
+
+
+def to_payload(message: Body) -> Payload:
+    """
+    Turn any supported request body into a ``Payload``.
+
+    Args:
+        message: A Mail object, a JSON request body, pre-encoded JSON bytes
+            or a ``Payload``.
+
+    Returns:
+        The encoded payload.
+    """
+    if isinstance(message, Payload):
+        return message
+    if isinstance(message, bytes):
+        return Payload(message)
+    if isinstance(message, (bytearray, memoryview)):
+        # httpx only posts ``bytes`` as a single chunk.
+        return Payload(bytes(message))
+    if isinstance(message, dict):
+        return Payload.from_dict(message)
+    return Payload.from_mail(message)
+
+
+def estimate_size(message: Body) -> int:
+    """
+    Estimate the encoded size of a request body without encoding it.
+
+    Only the content and the attachments are counted, as they make up the
+    bulk of large messages.
+
+    Args:
+        message: Any request body accepted by ``to_payload()``.
+
+    Returns:
+        The approximate size of the body in bytes.
+    """
+    if isinstance(message, Payload):
+        return len(message.content)
+    if isinstance(message, (bytes, bytearray, memoryview)):
+        return len(message)
+    if isinstance(message, dict):
+        return sum(
+            len(content.get("value") or "")
+            for content in message.get("content") or ()
+        ) + sum(
+            len(attachment.get("content") or "")
+            for attachment in message.get("attachments") or ()
+        )
+    return sum(
+        len(content.content or "") for content in message.contents or ()
+    ) + sum(
+        len(attachment.file_content.get())
+        for attachment in message.attachments or ()
+        if attachment.file_content is not None
+    )
@@ -4,14 +4,50 @@ Connection pool manager for SendGrid API requests.
 
 from __future__ import annotations
 
+import asyncio
+import logging
+from importlib.util import find_spec
 from typing import TYPE_CHECKING
 
-from httpx import AsyncClient, AsyncHTTPTransport, Limits  # type: ignore
-from httpx_retries import Retry, RetryTransport  # type: ignore
+from httpx import (  # type: ignore
+    AsyncBaseTransport,
+    AsyncClient,
+    ConnectError,
+    ConnectTimeout,
+    Limits,
+    PoolTimeout,
+    Request,
+    Timeout,
+)
+
+from async_sendgrid.connections import EMPTY_STATS, TracedHTTPTransport
+from async_sendgrid.concurrency import (
+    AdaptiveConcurrencyLimiter,
+    AdaptiveConcurrencyTransport,
+    StreamLimitTransport,
+)
+from async_sendgrid.exception import SessionClosedException
+from async_sendgrid.ratelimit import (
+    RateLimiter,
+    RateLimitTransport,
+    ThrottleGate,
+)
 
 if TYPE_CHECKING:
     from typing import Any
 
+    from httpx import Response  # type: ignore
+    from httpx_retries import Retry  # type: ignore
+
+    from async_sendgrid.connections import PoolStats
+
+_MAX_RETRY_POLICIES = 32
+# Errors raised before a request reached the server, so that retrying it
+# cannot deliver it twice.
+_UNSENT_ERRORS = (ConnectError, ConnectTimeout, PoolTimeout)
+
+logger = logging.getLogger(__name__)
+
 
 class ConnectionPool:
     """
@@ -28,6 +64,20 @@ class ConnectionPool:
         backoff_factor: float = 0.5,
         backoff_jitter: float = 1.0,
         timeout: float = 5.0,
+        rate_limit: bool = False,
+        throttle_gate: bool = False,
+        throttle_release_rate: float = 50.0,
+        adaptive_concurrency: bool = False,
+        min_concurrency: int = 1,
+        max_concurrency: int | None = None,
+        latency_target: float | None = None,
+        http2: bool = False,
+        http2_max_streams: int = 100,
+        compress: bool = False,
+        compress_threshold: int = 1024,
+        compress_level: int = 6,
+        metrics: bool = False,
+        transport: AsyncBaseTransport | None = None,
     ) -> None:
         """
         Initialize the connection pool.
@@ -54,17 +104,80 @@ class ConnectionPool:
                 between 0 and 1. Defaults to 1.0.
             timeout (float, optional):
                 Request timeout in seconds. Defaults to 5.0.
+            rate_limit (bool, optional):
+                Pace requests from the SendGrid rate-limit headers to
+                avoid wasted 429 round trips. Defaults to False.
+            throttle_gate (bool, optional):
+                Pause every request of the pool on the first 429 with
+                ``Retry-After``, until the reset time. Defaults to False.
+            throttle_release_rate (float, optional):
+                Number of queued requests released per second once the
+                throttle gate reopens. Defaults to 50.0.
+            adaptive_concurrency (bool, optional):
+                Tune the number of requests in flight at runtime:
+                increase it additively while requests are healthy and
+                cut it multiplicatively on 429, 5xx and timeouts.
+                Defaults to False.
+            min_concurrency (int, optional):
+                Floor of the adaptive concurrency limit. Defaults to 1.
+            max_concurrency (int, optional):
+                Ceiling of the adaptive concurrency limit, which is also
+                its starting value. Defaults to ``max_connections``,
+                multiplied by ``http2_max_streams`` in HTTP/2 mode.
+            latency_target (float, optional):
+                p95 latency in seconds above which the adaptive
+                concurrency limit is cut. Defaults to None (latency is
+                not considered).
+            http2 (bool, optional):
+                Multiplex concurrent requests over HTTP/2 connections.
+                Requires the ``h2`` package (``sendgrid-async[http2]``);
+                falls back to HTTP/1.1 when it is missing or when the
+                server does not negotiate HTTP/2. Defaults to False.
+            http2_max_streams (int, optional):
+                Streams budgeted per HTTP/2 connection: at most
+                ``max_connections`` times this number of requests are in
+                flight across the pool, the others wait. Defaults to 100.
+            compress (bool, optional):
+                Gzip request bodies with ``Content-Encoding: gzip``.
+                Large bodies are compressed in a worker thread.
+                Defaults to False.
+            compress_threshold (int, optional):
+                Size in bytes from which bodies are compressed.
+                Defaults to 1024.
+            compress_level (int, optional):
+                Gzip compression level, from 1 (fastest) to 9 (smallest).
+                Defaults to 6.
+            metrics (bool, optional):
+                Record OpenTelemetry metrics of the requests: durations
+                and their breakdown by phase, body sizes, responses by
+                status class, retries, 429s, requests in flight and
+                connection statistics. Defaults to False.
+            transport (AsyncBaseTransport, optional):
+                The transport sending the requests, in place of an
+                ``AsyncHTTPTransport`` built from the connection limits,
+                such as a ``SendGridSimulator``. The retry, rate-limit,
+                concurrency and compression layers still apply. It is
+                kept open when the client is rebuilt, and closed on
+                ``shutdown()``. Defaults to None.
         """
         self._validate_retry_attempts(retry_attempts)
         self._validate_backoff_factor(backoff_factor)
         self._validate_backoff_jitter(backoff_jitter)
         self._validate_timeout(timeout)
+        self._validate_http2_max_streams(http2_max_streams)
+        self._validate_compress_threshold(compress_threshold)
+        self._validate_compress_level(compress_level)
 
+        self._http2 = http2 and _h2_available()
+        self._http2_max_streams = http2_max_streams
         self._limits = Limits(
             max_connections=max_connections,
             max_keepalive_connections=max_keepalive_connections,
             keepalive_expiry=keepalive_expiry,
         )
+        # httpx_retries is only imported once a pool is built.
+        from httpx_retries import Retry  # type: ignore
+
         self._retry = Retry(
             total=retry_attempts,
             backoff_factor=backoff_factor,
@@ -72,7 +185,37 @@ class ConnectionPool:
             allowed_methods=["POST"],
         )
         self._timeout = timeout
+        self._compress = compress
+        self._compress_threshold = compress_threshold
+        self._compress_level = compress_level
+        self._metrics = metrics
+        self._retry_policies: dict[tuple[int, float, bool], Retry] = {}
+        self._rate_limiter = RateLimiter() if rate_limit else None
+        self._throttle_gate = (
+            ThrottleGate(throttle_release_rate) if throttle_gate else None
+        )
+        self._concurrency_limiter: AdaptiveConcurrencyLimiter | None = None
+        if adaptive_concurrency:
+            ceiling = (
+                max_concurrency
+                if max_concurrency is not None
+                else self._max_in_flight
+            )
+            if ceiling is None:
+                raise ValueError(
+                    "max_concurrency is required when max_connections "
+                    "is unlimited"
+                )
+            self._concurrency_limiter = AdaptiveConcurrencyLimiter(
+                max_limit=ceiling,
+                min_limit=min_concurrency,
+                latency_target=latency_target,
+            )
         self._client: AsyncClient | None = None
+        self._transport = transport
+        self._http_transport: AsyncBaseTransport | None = None
+        self._keeper: asyncio.Task[None] | None = None
+        self._bulk_slots: asyncio.Semaphore | None = None
         self._shutdown = False
 
     def _create_client(self, headers: dict[str, Any]) -> AsyncClient:
@@ -81,6 +224,8 @@ class ConnectionPool:
 
         Args:
             headers (dict[str, Any]): The headers to use for the client.
+                The client is shared by every user of the pool, so
+                credentials belong on each request instead.
 
         Returns:
             AsyncClient: The configured HTTP client.
@@ -88,10 +233,54 @@ class ConnectionPool:
         if self._client is not None and not self._client.is_closed:
             return self._client
 
-        transport = RetryTransport(
-            transport=AsyncHTTPTransport(limits=self._limits),
-            retry=self._retry,
-        )
+        if self._transport is not None:
+            self._http_transport = self._transport
+            # Closing the client must not close the caller's transport,
+            # which is reused when the client is rebuilt.
+            transport: AsyncBaseTransport = _BorrowedTransport(self._transport)
+        else:
+            on_phase = None
+            if self._metrics:
+                from async_sendgrid.metrics import get_metrics
+
+                instruments = get_metrics()
+                instruments.observe(self)
+                on_phase = instruments.record_phase
+            self._http_transport = TracedHTTPTransport(
+                limits=self._limits, http2=self._http2, on_phase=on_phase
+            )
+            transport = self._http_transport
+        if self._http2 and self._max_in_flight is not None:
+            transport = StreamLimitTransport(transport, self._max_in_flight)
+        if self._concurrency_limiter is not None:
+            transport = AdaptiveConcurrencyTransport(
+                transport, self._concurrency_limiter
+            )
+        if self._rate_limiter is not None or self._throttle_gate is not None:
+            transport = RateLimitTransport(
+                transport, self._rate_limiter, self._throttle_gate
+            )
+        if self._metrics:
+            from async_sendgrid.metrics import AttemptMetricsTransport
+
+            transport = AttemptMetricsTransport(transport)
+
+        from httpx_retries import RetryTransport  # type: ignore
+
+        transport = RetryTransport(transport=transport, retry=self._retry)
+        if self._compress:
+            from async_sendgrid.compression import CompressionTransport
+
+            transport = CompressionTransport(
+                transport,
+                self._compress_threshold,
+                self._compress_level,
+                metrics=self._metrics,
+            )
+        if self._metrics:
+            from async_sendgrid.metrics import MetricsTransport
+
+            transport = MetricsTransport(transport)
         self._client = AsyncClient(
             headers=headers,
             timeout=self._timeout,
@@ -99,61 +288,217 @@ class ConnectionPool:
         )
         return self._client
 
-    def _create_ephemeral_client(
+    def _retry_policy(
         self,
-        headers: dict[str, Any],
         retry: int | None = None,
         backoff: float | None = None,
-    ) -> AsyncClient:
+        retry_ambiguous: bool = True,
+    ) -> Retry:
         """
-        Create a single-use HTTP client with custom retry/backoff settings.
+        Get the retry policy for a request with custom retry/backoff.
 
-        The caller is responsible for closing the returned client.
+        The policy travels with the request in its ``retry`` extension, so
+        the request still goes through the shared client and its
+        keep-alive connections. Policies are cached per settings.
 
         Args:
-            headers (dict[str, Any]): The headers to use for the client.
             retry (int, optional): Override the number of retry attempts.
                 Uses the pool default when not set.
             backoff (float, optional): Override the backoff factor.
                 Uses the pool default when not set.
+            retry_ambiguous (bool, optional): Whether to retry errors
+                raised once the request may have reached the server, such
+                as read timeouts and dropped connections. When False, only
+                connection failures and throttled or unavailable
+                responses are retried.
+                Defaults to True.
 
         Returns:
-            AsyncClient: An ephemeral HTTP client.
+            Retry: The retry policy.
         """
         if retry is not None:
             self._validate_retry_attempts(retry)
         if backoff is not None:
             self._validate_backoff_factor(backoff)
 
-        retry_strategy = Retry(
-            total=retry if retry is not None else self._retry.total,
-            backoff_factor=(
-                backoff if backoff is not None else self._retry.backoff_factor
-            ),
-            backoff_jitter=self._retry.backoff_jitter,
-            allowed_methods=["POST"],
-        )
-        transport = RetryTransport(
-            transport=AsyncHTTPTransport(),
-            retry=retry_strategy,
-        )
-        return AsyncClient(
-            headers=headers,
-            timeout=self._timeout,
-            transport=transport,
+        key = (
+            retry if retry is not None else self._retry.total,
+            backoff if backoff is not None else self._retry.backoff_factor,
+            retry_ambiguous,
         )
+        policy = self._retry_policies.pop(key, None)
+        if policy is None:
+            from httpx_retries import Retry  # type: ignore
+
+            policy = Retry(
+                total=key[0],
+                backoff_factor=key[1],
+                backoff_jitter=self._retry.backoff_jitter,
+                allowed_methods=["POST"],
+                retry_on_exceptions=(
+                    None if retry_ambiguous else _UNSENT_ERRORS
+                ),
+            )
+            if len(self._retry_policies) >= _MAX_RETRY_POLICIES:
+                del self._retry_policies[next(iter(self._retry_policies))]
+
+        # Re-insert to keep the most recently used policies last.
+        self._retry_policies[key] = policy
+        return policy
+
+    def _bulk_semaphore(self) -> asyncio.Semaphore | None:
+        """
+        Get the semaphore shared by the bulk sends of every client.
+
+        Concurrent ``send_many()`` and ``send_packed()`` calls on clients
+        of the pool together keep at most ``max_connections`` requests in
+        flight (times ``http2_max_streams`` in HTTP/2 mode).
+
+        Returns:
+            asyncio.Semaphore | None: The semaphore, or None when the
+                number of connections is unlimited.
+        """
+        if self._bulk_slots is None and self._max_in_flight is not None:
+            self._bulk_slots = asyncio.Semaphore(self._max_in_flight)
+        return self._bulk_slots
+
+    def stats(self) -> PoolStats:
+        """
+        Get a snapshot of the connections of the pool.
+
+        Counters run from the creation of the pool. Everything is zero
+        with a custom ``transport``, which manages its own connections.
+
+        Returns:
+            PoolStats: The active, idle and queued counts, the connections
+                opened and closed, the TLS handshakes, and the time
+                requests waited for a connection.
+        """
+        if isinstance(self._http_transport, TracedHTTPTransport):
+            return self._http_transport.stats()
+        return EMPTY_STATS
 
     @property
     def is_shutdown(self) -> bool:
         """Whether the pool has been explicitly shut down."""
         return self._shutdown
 
+    async def warm(self, url: str, connections: int | None = None) -> int:
+        """
+        Pre-establish keep-alive connections to the given URL.
+
+        Concurrent ``HEAD`` requests are sent to the URL so that the DNS
+        lookup, TCP connect and TLS handshake of each connection happen
+        ahead of latency-critical sends. Idle connections are reused and
+        their keep-alive expiry refreshed.
+
+        Args:
+            url (str): The URL whose origin to connect to.
+            connections (int, optional): Number of connections to open.
+                Defaults to, and is capped at,
+                ``max_keepalive_connections``.
+
+        Returns:
+            int: The number of connections successfully warmed. Under
+            HTTP/2 the requests are multiplexed, so this is the number of
+            connections actually open rather than of requests sent.
+        """
+        if self._shutdown or self._client is None or self._client.is_closed:
+            raise SessionClosedException("Session not initialized")
+
+        max_keepalive = self._limits.max_keepalive_connections
+        if connections is None:
+            connections = max_keepalive if max_keepalive is not None else 1
+        else:
+            self._validate_connections(connections)
+            if max_keepalive is not None:
+                connections = min(connections, max_keepalive)
+
+        transport = self._http_transport
+        assert transport is not None
+
+        async def _touch() -> bool:
+            request = Request(
+                "HEAD",
+                url,
+                extensions={"timeout": Timeout(self._timeout).as_dict()},
+            )
+            try:
+                response = await transport.handle_async_request(request)
+                # The response must be complete for the connection to be
+                # kept alive.
+                await response.aread()
+                await response.aclose()
+            except Exception as exc:
+                logger.debug("Failed to warm a connection to %s: %s", url, exc)
+                return False
+            return True
+
+        results = await asyncio.gather(*(_touch() for _ in range(connections)))
+        warmed = sum(results)
+        if isinstance(transport, TracedHTTPTransport):
+            # Requests sharing a connection only warm it once.
+            warmed = min(warmed, transport.stats().connections)
+        logger.debug("Warmed %d connections to %s", warmed, url)
+        return warmed
+
+    def keep_warm(
+        self,
+        url: str,
+        connections: int | None = None,
+        interval: float | None = None,
+    ) -> None:
+        """
+        Keep connections to the given URL open in the background.
+
+        A background task warms the connections right away, then refreshes
+        them before their keep-alive expiry lapses, so that sends after an
+        idle period never wait on a handshake. The task stops on
+        ``shutdown()``. Must be called from a running event loop.
+
+        Args:
+            url (str): The URL whose origin to connect to.
+            connections (int, optional): Number of connections to keep
+                open. Defaults to ``max_keepalive_connections``.
+            interval (float, optional): Seconds between refreshes.
+                Defaults to 80% of ``keepalive_expiry``.
+        """
+        if interval is None:
+            expiry = self._limits.keepalive_expiry
+            interval = 0.8 * expiry if expiry else 5.0
+        self._validate_interval(interval)
+        if connections is not None:
+            # Checked here, as the background task would fail silently.
+            self._validate_connections(connections)
+
+        if self._keeper is not None and not self._keeper.done():
+            self._keeper.cancel()
+        self._keeper = asyncio.get_running_loop().create_task(
+            self._keep_warm(url, connections, interval)
+        )
+
+    async def _keep_warm(
+        self, url: str, connections: int | None, interval: float
+    ) -> None:
+        while not self._shutdown:
+            try:
+                await self.warm(url, connections)
+            except SessionClosedException:
+                # The client is rebuilt on the next send.
+                pass
+            await asyncio.sleep(interval)
+
     async def shutdown(self) -> None:
         """Close all clients and release their connections."""
         self._shutdown = True
+        if self._keeper is not None:
+            self._keeper.cancel()
+            self._keeper = None
         if self._client is not None and not self._client.is_closed:
             await self._client.aclose()
             self._client = None
+        if self._transport is not None:
+            await self._transport.aclose()
 
     @staticmethod
     def _validate_retry_attempts(retry_attempts: int) -> None:
@@ -170,11 +515,86 @@ class ConnectionPool:
         if not isinstance(backoff_jitter, (int, float)) or backoff_jitter < 0:
             raise ValueError("backoff_jitter must be a positive number")
 
+    @staticmethod
+    def _validate_http2_max_streams(http2_max_streams: int) -> None:
+        if not isinstance(http2_max_streams, int) or http2_max_streams < 1:
+            raise ValueError("http2_max_streams must be a positive integer")
+
+    @staticmethod
+    def _validate_compress_threshold(compress_threshold: int) -> None:
+        if not isinstance(compress_threshold, int) or compress_threshold < 0:
+            raise ValueError("compress_threshold must be a positive integer")
+
+    @staticmethod
+    def _validate_compress_level(compress_level: int) -> None:
+        if not isinstance(compress_level, int) or not 1 <= compress_level <= 9:
+            raise ValueError("compress_level must be between 1 and 9")
+
+    @staticmethod
+    def _validate_connections(connections: int) -> None:
+        if not isinstance(connections, int) or connections < 1:
+            raise ValueError("connections must be a positive integer")
+
+    @staticmethod
+    def _validate_interval(interval: float) -> None:
+        if not isinstance(interval, (int, float)) or interval <= 0:
+            raise ValueError("interval must be a positive number")
+
     @staticmethod
     def _validate_timeout(timeout: float) -> None:
         if not isinstance(timeout, (int, float)) or timeout <= 0:
             raise ValueError("timeout must be a positive number")
 
+    @property
+    def rate_limiter(self) -> RateLimiter | None:
+        """The rate limiter pacing requests, if rate limiting is enabled."""
+        return self._rate_limiter
+
+    @property
+    def throttle_gate(self) -> ThrottleGate | None:
+        """The pool-wide 429 pause, if enabled."""
+        return self._throttle_gate
+
+    @property
+    def concurrency_limit(self) -> int | None:
+        """
+        The number of requests currently allowed in flight.
+
+        This is the adaptive limit when adaptive concurrency is enabled.
+        Otherwise it is ``max_connections``, multiplied by
+        ``http2_max_streams`` in HTTP/2 mode.
+        """
+        if self._concurrency_limiter is not None:
+            return self._concurrency_limiter.limit
+        return self._max_in_flight
+
+    @property
+    def _max_in_flight(self) -> int | None:
+        max_connections = self._limits.max_connections
+        if self._http2 and max_connections is not None:
+            return max_connections * self._http2_max_streams
+        return max_connections
+
+    @property
+    def http2(self) -> bool:
+        """Whether requests are multiplexed over HTTP/2."""
+        return self._http2
+
+    @property
+    def compress(self) -> bool:
+        """Whether request bodies are gzipped."""
+        return self._compress
+
+    @property
+    def metrics(self) -> bool:
+        """Whether OpenTelemetry metrics are recorded."""
+        return self._metrics
+
+    @property
+    def concurrency_limiter(self) -> AdaptiveConcurrencyLimiter | None:
+        """The adaptive concurrency limiter, if enabled."""
+        return self._concurrency_limiter
+
     @property
     def limits(self) -> Limits:
         """
@@ -199,3 +619,26 @@ class ConnectionPool:
 
     def __str__(self) -> str:
         return repr(self)
+
+
+class _BorrowedTransport(AsyncBaseTransport):
+    """A caller-supplied transport, left open when the client closes."""
+
+    def __init__(self, transport: AsyncBaseTransport) -> None:
+        self._transport = transport
+
+    async def handle_async_request(self, request: Request) -> Response:
+        return await self._transport.handle_async_request(request)
+
+    async def aclose(self) -> None:
+        pass
+
+
+def _h2_available() -> bool:
+    if find_spec("h2") is None:
+        logger.warning(
+            "HTTP/2 requires the h2 package, falling back to HTTP/1.1. "
+            "Install it with: pip install 'sendgrid-async[http2]'"
+        )
+        return False
+    return True
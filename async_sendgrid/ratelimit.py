@@ -0,0 +1,308 @@
+"""
+Client-side rate limiting driven by SendGrid rate-limit headers.
+
+This is an internal module and should not be used directly.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from email.utils import parsedate_to_datetime
+from typing import TYPE_CHECKING
+
+from httpx import AsyncBaseTransport  # type: ignore
+
+from async_sendgrid.connections import add_limit_wait
+
+if TYPE_CHECKING:
+    from typing import Optional
+
+    from httpx import Headers, Request, Response  # type: ignore
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimiter:
+    """
+    A token bucket paced from the rate-limit headers of the responses.
+
+    SendGrid reports the state of the current rate-limit window with the
+    ``X-RateLimit-Limit``, ``X-RateLimit-Remaining`` and
+    ``X-RateLimit-Reset`` headers. The limiter spreads the remaining
+    budget evenly over the time left in the window, and holds every
+    request until the window resets once the budget is exhausted. A
+    ``429`` carrying ``Retry-After`` holds every request until that time,
+    which later responses can only extend. Once a window is over, its
+    budget is refilled to ``X-RateLimit-Limit``.
+
+    Until a window is known, requests are not delayed.
+    """
+
+    def __init__(self, burst: int = 10) -> None:
+        """
+        Initialize the rate limiter.
+
+        Args:
+            burst (int, optional): Maximum number of requests sent
+                back-to-back within a window. Defaults to 10.
+        """
+        if not isinstance(burst, int) or burst < 1:
+            raise ValueError("burst must be a positive integer")
+
+        self._burst = burst
+        self._tokens = float(burst)
+        self._rate = 0.0
+        self._limit: Optional[int] = None
+        self._remaining: Optional[int] = None
+        self._reset_at = 0.0
+        self._held_until = 0.0
+        self._updated = time.monotonic()
+
+    @property
+    def remaining(self) -> Optional[int]:
+        """Requests left in the current window, if known."""
+        now = time.monotonic()
+        if now < self._held_until:
+            return 0
+        if now >= self._reset_at:
+            return self._limit
+        return self._remaining
+
+    async def acquire(self) -> None:
+        """Wait until a request may be sent."""
+        # The waits are computed and the tokens taken without yielding,
+        # so no lock is held while sleeping.
+        while True:
+            now = time.monotonic()
+            hold = self._hold(now)
+            if hold <= 0:
+                break
+            await asyncio.sleep(hold)
+
+        delay = self._take(now)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def update(self, response: Response) -> None:
+        """
+        Update the limiter from the headers of a response.
+
+        Args:
+            response: The response to read the rate-limit headers from.
+        """
+        now = time.monotonic()
+        headers = response.headers
+
+        limit = _parse_limit(headers)
+        if limit is not None:
+            self._limit = limit
+
+        window = _parse_window(headers)
+        if window is not None:
+            remaining, until_reset = window
+            self._refill(now)
+            self._remaining = remaining
+            self._reset_at = now + until_reset
+            self._rate = max(remaining, 1) / until_reset
+            self._tokens = min(self._tokens, remaining)
+
+        if response.status_code == 429:
+            delay = _parse_retry_after(headers.get("Retry-After"))
+            if delay is None and window is not None:
+                delay = window[1]
+            if delay is not None:
+                logger.debug("Rate limited, holding requests for %.3fs", delay)
+                # A hold is only ever moved later.
+                self._held_until = max(self._held_until, now + delay)
+
+    def _hold(self, now: float) -> float:
+        """Return how long every request is held, starting over if due."""
+        if now < self._held_until:
+            return self._held_until - now
+
+        if now >= self._reset_at:
+            # The window is over: refill its budget until the next headers.
+            self._remaining = None
+            self._tokens = float(
+                min(self._burst, self._limit) if self._limit else self._burst
+            )
+            return 0.0
+
+        if self._remaining is not None and self._remaining <= 0:
+            return self._reset_at - now
+        return 0.0
+
+    def _take(self, now: float) -> float:
+        """Take a token, and return the wait until it is due."""
+        if self._remaining is None:
+            return 0.0
+
+        self._refill(now)
+        self._tokens -= 1
+        self._remaining -= 1
+        if self._tokens >= 0:
+            return 0.0
+        return -self._tokens / self._rate
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(
+            float(self._burst),
+            self._tokens + (now - self._updated) * self._rate,
+        )
+        self._updated = now
+
+    def __repr__(self) -> str:
+        return f"RateLimiter(burst={self._burst})"
+
+
+class ThrottleGate:
+    """
+    A pool-wide pause shared by every request after a ``429``.
+
+    The first ``429`` carrying ``Retry-After`` (or ``X-RateLimit-Reset``)
+    closes the gate until that time for every request of the pool, instead
+    of letting each request back off on its own and stampede again. When
+    the gate reopens, the queued requests are released at a controlled
+    rate.
+    """
+
+    def __init__(self, release_rate: float = 50.0) -> None:
+        """
+        Initialize the throttle gate.
+
+        Args:
+            release_rate (float, optional): Number of queued requests
+                released per second once the gate reopens.
+                Defaults to 50.0.
+        """
+        if not isinstance(release_rate, (int, float)) or release_rate <= 0:
+            raise ValueError("release_rate must be a positive number")
+
+        self._interval = 1 / release_rate
+        self._closed_until = 0.0
+        self._next_slot = 0.0
+
+    @property
+    def is_closed(self) -> bool:
+        """Whether requests are currently paused."""
+        return time.monotonic() < self._closed_until
+
+    async def wait(self) -> None:
+        """Wait until the gate lets a request through."""
+        while True:
+            now = time.monotonic()
+            if now >= self._closed_until and now >= self._next_slot:
+                return
+
+            # Queue behind the requests already waiting for the gate.
+            slot = max(self._closed_until, self._next_slot)
+            self._next_slot = slot + self._interval
+            await asyncio.sleep(slot - now)
+
+            if time.monotonic() >= self._closed_until:
+                return
+
+    def update(self, response: Response) -> None:
+        """
+        Close the gate if the response asks to back off.
+
+        Args:
+            response: The response to inspect.
+        """
+        if response.status_code != 429:
+            return
+
+        delay = _parse_retry_after(response.headers.get("Retry-After"))
+        if delay is None:
+            window = _parse_window(response.headers)
+            delay = window[1] if window is not None else None
+        if delay is None:
+            return
+
+        closed_until = time.monotonic() + delay
+        if closed_until > self._closed_until:
+            logger.warning(
+                "Rate limited by SendGrid, pausing all requests for %.3fs",
+                delay,
+            )
+            self._closed_until = closed_until
+
+    def __repr__(self) -> str:
+        return f"ThrottleGate(release_rate={1 / self._interval})"
+
+
+class RateLimitTransport(AsyncBaseTransport):
+    """
+    A transport pacing requests through a ``ThrottleGate`` and/or a
+    ``RateLimiter``.
+
+    It sits below the retry transport, so retried attempts are paced too.
+    """
+
+    def __init__(
+        self,
+        transport: AsyncBaseTransport,
+        limiter: Optional[RateLimiter] = None,
+        gate: Optional[ThrottleGate] = None,
+    ) -> None:
+        self._transport = transport
+        self._limiter = limiter
+        self._gate = gate
+
+    async def handle_async_request(self, request: Request) -> Response:
+        start = time.perf_counter()
+        if self._gate is not None:
+            await self._gate.wait()
+        if self._limiter is not None:
+            await self._limiter.acquire()
+        add_limit_wait(request, time.perf_counter() - start)
+
+        response = await self._transport.handle_async_request(request)
+
+        if self._gate is not None:
+            self._gate.update(response)
+        if self._limiter is not None:
+            self._limiter.update(response)
+        return response
+
+    async def aclose(self) -> None:
+        await self._transport.aclose()
+
+
+def _parse_limit(headers: Headers) -> Optional[int]:
+    """Return the number of requests allowed per window."""
+    try:
+        limit = int(headers["X-RateLimit-Limit"])
+    except (KeyError, ValueError):
+        return None
+    return limit if limit > 0 else None
+
+
+def _parse_window(headers: Headers) -> Optional[tuple[int, float]]:
+    """Return the remaining requests and seconds until the window resets."""
+    try:
+        remaining = int(headers["X-RateLimit-Remaining"])
+        reset = float(headers["X-RateLimit-Reset"])
+    except (KeyError, ValueError):
+        return None
+
+    until_reset = reset - time.time()
+    if until_reset <= 0:
+        return None
+    return remaining, until_reset
+
+
+def _parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Parse a ``Retry-After`` header given in seconds or as a date."""
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0)
+    except (TypeError, ValueError):
+        return None
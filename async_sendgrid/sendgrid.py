@@ -4,24 +4,65 @@ Sendgrid API client.
 
 from __future__ import annotations
 
+import asyncio
+import hashlib
 import logging
+import time
 from abc import ABC, abstractmethod
+from collections import deque
 from typing import TYPE_CHECKING
 
 from httpx import AsyncClient  # type: ignore
+from opentelemetry.trace import get_current_span
 
+from async_sendgrid.coalescing import Coalescer
 from async_sendgrid.exception import SessionClosedException
+from async_sendgrid.idempotency import Deduplicator, content_key
+from async_sendgrid.packing import MAX_PERSONALIZATIONS, pack_messages
+from async_sendgrid.payload import Payload, estimate_size, to_payload
 from async_sendgrid.pool import ConnectionPool
+from async_sendgrid.streaming import StreamingBody, stream_body
 from async_sendgrid.telemetry import trace_client
 
 logger = logging.getLogger(__name__)
 
 if TYPE_CHECKING:
-    from typing import Any, Optional
+    from concurrent.futures import Executor
+    from typing import (
+        Any,
+        AsyncIterable,
+        AsyncIterator,
+        Awaitable,
+        Callable,
+        Iterable,
+        Optional,
+        Sequence,
+    )
 
     from httpx import Response  # type: ignore
+    from httpx_retries import Retry  # type: ignore
     from sendgrid.helpers.mail import Mail  # type: ignore
 
+    from async_sendgrid.cache import AttachmentCache
+    from async_sendgrid.idempotency import DedupeStore
+    from async_sendgrid.payload import Body
+    from async_sendgrid.streaming import StreamingAttachment
+
+# Bodies which are already encoded and cannot be coalesced.
+_ENCODED = (Payload, StreamingBody, bytes, bytearray, memoryview)
+
+_SERIALIZE_THRESHOLD = 256 * 1024
+
+_MAX_TENANTS = 128
+
+# Headers shared by every client of a pool. The tenant headers,
+# Authorization and On-Behalf-Of, are set on each request instead.
+_CLIENT_HEADERS = {
+    "User-Agent": "sendgrid-async;python",
+    "Accept": "*/*",
+    "Content-Type": "application/json",
+}
+
 
 class BaseSendgridAPI(ABC):
     @property
@@ -52,9 +93,11 @@ class BaseSendgridAPI(ABC):
     @abstractmethod
     async def send(
         self,
-        message: Mail,
+        message: Body,
         retry: Optional[int] = None,
         backoff: Optional[float] = None,
+        idempotency_key: Optional[str] = None,
+        attachments: Optional[Sequence[StreamingAttachment]] = None,
     ) -> Response:
         """Not implemented"""
 
@@ -75,6 +118,33 @@ class SendgridAPI(BaseSendgridAPI):
         for more details.
     :param pool:
         The connection pool to use. Defaults to a new ConnectionPool instance.
+    :param coalesce_window: Opt into coalescing. When set, ``send()`` parks
+        each message for up to this many seconds and merges it with
+        concurrent compatible messages into a single multi-personalization
+        request. Defaults to None (disabled).
+    :param coalesce_max_size: The maximum number of messages merged into one
+        coalesced request; a batch is sent as soon as it is full.
+        Defaults to 1000.
+    :param dedupe_store: Opt into duplicate suppression. When set, a
+        message sent again with the same idempotency key while the key is
+        in the store is not delivered again, and errors after which the
+        message may have been delivered are not retried. Defaults to None
+        (disabled).
+    :param dedupe_content: Derive the idempotency key from the request
+        body when ``send()`` is given none, so that identical messages are
+        only delivered once while the key is in the store. Requires a
+        ``dedupe_store``. Defaults to False: messages sent without a key
+        are always delivered.
+    :param serialize_executor: Opt into offloading. When set, messages
+        larger than ``serialize_threshold`` are encoded in this executor
+        instead of on the event loop. A ``ProcessPoolExecutor`` spreads
+        the work across cores. Defaults to None (disabled).
+    :param serialize_threshold: The estimated size in bytes of the
+        content and attachments above which a message is offloaded.
+        Defaults to 262144 (256 KiB).
+    :param attachment_cache: The cache of encoded attachments used by
+        ``send(..., attachments=...)``, so that attachments reused across
+        messages are only read and encoded once. Defaults to None.
     """
 
     def __init__(
@@ -83,22 +153,56 @@ class SendgridAPI(BaseSendgridAPI):
         endpoint: str = "https://api.sendgrid.com/v3/mail/send",
         on_behalf_of: Optional[str] = None,
         pool: Optional[ConnectionPool] = None,
+        coalesce_window: Optional[float] = None,
+        coalesce_max_size: int = MAX_PERSONALIZATIONS,
+        dedupe_store: Optional[DedupeStore] = None,
+        dedupe_content: bool = False,
+        serialize_executor: Optional[Executor] = None,
+        serialize_threshold: int = _SERIALIZE_THRESHOLD,
+        attachment_cache: Optional[AttachmentCache] = None,
     ):
         self._api_key = api_key
         self._endpoint = endpoint
+        self._on_behalf_of = on_behalf_of
 
-        self._headers = {
-            "Authorization": f"Bearer {self._api_key}",
-            "User-Agent": "sendgrid-async;python",
-            "Accept": "*/*",
-            "Content-Type": "application/json",
-        }
-
+        self._tenant_headers = {"Authorization": f"Bearer {self._api_key}"}
         if on_behalf_of:
-            self._headers["On-Behalf-Of"] = on_behalf_of
+            self._tenant_headers["On-Behalf-Of"] = on_behalf_of
+        self._headers = {**_CLIENT_HEADERS, **self._tenant_headers}
 
         self._pool = pool if pool is not None else ConnectionPool()
-        self._session = self._pool._create_client(self._headers)
+        self._session = self._pool._create_client(_CLIENT_HEADERS)
+
+        self._coalesce_window = coalesce_window
+        self._coalesce_max_size = coalesce_max_size
+        self._coalescer: Optional[Coalescer] = None
+        if coalesce_window is not None:
+            self._coalescer = Coalescer(
+                self._post_payload, coalesce_window, coalesce_max_size
+            )
+
+        if dedupe_content and dedupe_store is None:
+            raise ValueError("dedupe_content requires a dedupe_store")
+        self._dedupe_store = dedupe_store
+        self._dedupe_content = dedupe_content
+        self._deduplicator: Optional[Deduplicator] = None
+        if dedupe_store is not None:
+            self._deduplicator = Deduplicator(
+                dedupe_store, self._record_suppressed
+            )
+            # Tenants sharing a store do not suppress each other's messages.
+            self._dedupe_scope = hashlib.sha256(
+                f"{api_key}\0{on_behalf_of or ''}".encode()
+            ).hexdigest()[:16]
+
+        if not isinstance(serialize_threshold, int) or serialize_threshold < 0:
+            raise ValueError(
+                "serialize_threshold must be a non-negative integer"
+            )
+        self._serialize_executor = serialize_executor
+        self._serialize_threshold = serialize_threshold
+        self._attachment_cache = attachment_cache
+        self._tenants: dict[tuple[str, Optional[str]], SendgridAPI] = {}
 
     @property
     def api_key(self) -> str:
@@ -120,61 +224,347 @@ class SendgridAPI(BaseSendgridAPI):
     def session(self) -> AsyncClient:
         return self._session
 
+    def for_tenant(
+        self,
+        api_key: Optional[str] = None,
+        on_behalf_of: Optional[str] = None,
+    ) -> SendgridAPI:
+        """
+        Get a client sending as another tenant over the same pool.
+
+        The tenant client shares the pool, and therefore its keep-alive
+        connections and concurrency budget, along with the endpoint and
+        the other settings of this client. Its messages are only coalesced
+        with its own, and its duplicate suppression keys are scoped to it.
+        The most recently used tenant clients are cached, so this is cheap
+        to call on every send.
+
+        Args:
+            api_key: The API key of the tenant. Defaults to the API key of
+                this client.
+            on_behalf_of: The subuser to send on behalf of.
+                Defaults to None.
+
+        Returns:
+            The client of the tenant.
+        """
+        key = (api_key or self._api_key, on_behalf_of)
+        tenant = self._tenants.pop(key, None)
+        if tenant is None:
+            tenant = SendgridAPI(
+                api_key=key[0],
+                endpoint=self._endpoint,
+                on_behalf_of=on_behalf_of,
+                pool=self._pool,
+                coalesce_window=self._coalesce_window,
+                coalesce_max_size=self._coalesce_max_size,
+                dedupe_store=self._dedupe_store,
+                dedupe_content=self._dedupe_content,
+                serialize_executor=self._serialize_executor,
+                serialize_threshold=self._serialize_threshold,
+                attachment_cache=self._attachment_cache,
+            )
+            if len(self._tenants) >= _MAX_TENANTS:
+                del self._tenants[next(iter(self._tenants))]
+
+        # Re-insert to keep the most recently used tenants last.
+        self._tenants[key] = tenant
+        return tenant
+
     @trace_client()
     async def send(
         self,
-        email: Mail,
+        email: Body,
         retry: Optional[int] = None,
         backoff: Optional[float] = None,
+        idempotency_key: Optional[str] = None,
+        attachments: Optional[Sequence[StreamingAttachment]] = None,
     ) -> Response:
         """
         Make a Twilio SendGrid v3 API request with the request body generated
         by the Mail object.
 
-        .. warning::
-            Calling this method repeatedly with per-call ``retry`` or
-            ``backoff`` overrides will open and close a new connection
-            each time, which can degrade throughput significantly.
-            For regular sends, configure the desired retry and backoff
-            on the ``ConnectionPool`` once at initialization.
+        The body is encoded to JSON once and posted as-is. Passing a dict,
+        pre-encoded JSON bytes or a ``Payload`` skips ``Mail.get()``, and
+        bytes or a ``Payload`` skip JSON encoding altogether.
 
         Args:
-            email: The Twilio SendGrid v3 API request body generated
-                by the Mail object or dict.
+            email: The Twilio SendGrid v3 API request body: a Mail
+                object, its JSON dict, pre-encoded JSON bytes or a
+                ``Payload``.
             retry: Override the number of retry attempts for this
-                request.  Creates an ephemeral client.
+                request. The request still uses the pool's connections.
                 Uses the pool default when not set.
             backoff: Override the backoff factor for this request.
-                Creates an ephemeral client.
+                The request still uses the pool's connections.
                 Uses the pool default when not set.
+            idempotency_key: The key identifying this message for
+                duplicate suppression. Requires a ``dedupe_store``. Without
+                it, the message is delivered without suppression, unless
+                the client derives keys from the content.
+            attachments: Attachments streamed from disk or memory while
+                the request is sent, after the message's own. Requires a
+                Mail object or a dict body.
 
         Returns:
-            The Twilio SendGrid v3 API response.
+            The Twilio SendGrid v3 API response. With coalescing enabled,
+            the response of the request the message was merged into. A
+            suppressed duplicate gets a replayed response, flagged with
+            ``response.extensions["idempotent_replay"]``.
+
+        Raises:
+            ValueError: If an idempotency key is given without a
+                ``dedupe_store``, or attachments with an encoded body.
         """
         self._check_session_closed()
-        json_message = email.get()
 
-        if retry is not None or backoff is not None:
-            session = self._build_client(retry, backoff)
-            try:
-                return await self._send(session, json_message)
-            finally:
-                await session.aclose()
+        if attachments:
+            parts: Sequence[StreamingAttachment | bytes] = attachments
+            if self._attachment_cache is not None:
+                parts = [
+                    await self._attachment_cache.resolve(attachment)
+                    for attachment in attachments
+                ]
+            email = stream_body(email, parts)  # type: ignore[arg-type]
+
+        if self._deduplicator is not None and (
+            idempotency_key is not None or self._dedupe_content
+        ):
+            if idempotency_key is None:
+                payload = await self._encode(email)
+                idempotency_key = (
+                    await payload.sha256()
+                    if isinstance(payload, StreamingBody)
+                    else content_key(payload)
+                )
+                if self._coalescer is None:
+                    # Do not encode the message twice.
+                    email = payload
+            return await self._deduplicator.run(
+                f"{self._dedupe_scope}:{idempotency_key}",
+                self._endpoint,
+                # A retry after an ambiguous error could deliver it twice.
+                lambda: self._deliver(
+                    email, retry, backoff, retry_ambiguous=False
+                ),
+            )
+
+        if idempotency_key is not None:
+            raise ValueError("idempotency_key requires a dedupe_store")
+
+        return await self._deliver(email, retry, backoff)
+
+    async def send_many(
+        self,
+        emails: Iterable[Body] | AsyncIterable[Body],
+        concurrency: Optional[int] = None,
+    ) -> AsyncIterator[Response | Exception]:
+        """
+        Send many messages with a bounded number of in-flight requests.
 
-        return await self._send(self._session, json_message)
+        The input is consumed lazily, so memory stays flat regardless of
+        how many messages are supplied. Results are yielded in input order;
+        a message that failed yields its exception instead of a response.
 
-    async def _send(
-        self, client: AsyncClient, json_message: dict[str, Any]
+        Example::
+
+            async for result in sendgrid.send_many(emails, concurrency=20):
+                if isinstance(result, Exception):
+                    ...
+
+        Args:
+            emails: An iterable or async iterable of Mail objects, or of
+                any request body accepted by ``send()``.
+            concurrency: Maximum number of requests in flight at once.
+                Defaults to, and is capped at, the pool's
+                ``concurrency_limit``.
+
+        Yields:
+            The response, or the raised exception, for each message.
+        """
+        limit = self._resolve_concurrency(concurrency)
+        async for result in _map_bounded(
+            self.send, emails, limit, self._pool._bulk_semaphore()
+        ):
+            yield result
+
+    async def send_packed(
+        self,
+        emails: Iterable[Mail],
+        concurrency: Optional[int] = None,
+    ) -> list[Response | Exception]:
+        """
+        Send messages, merging compatible ones into a single request.
+
+        Messages sharing the same sender, subject, content, template ID,
+        attachments and settings are packed into one request with many
+        personalizations (up to 1000 per request), cutting HTTP round trips
+        for newsletters and notification fan-out.
+
+        Args:
+            emails: The messages to send.
+            concurrency: Maximum number of requests in flight at once.
+                Defaults to, and is capped at, the pool's
+                ``concurrency_limit``.
+
+        Returns:
+            One result per message, in input order: the response of the
+            request the message was packed into, or the exception it
+            raised.
+        """
+        limit = self._resolve_concurrency(concurrency)
+        packed = pack_messages(emails)
+        results: list[Response | Exception] = [None] * sum(  # type: ignore
+            len(pack.indexes) for pack in packed
+        )
+
+        payloads = (pack.payload for pack in packed)
+        position = 0
+        async for result in _map_bounded(
+            self._send_payload, payloads, limit, self._pool._bulk_semaphore()
+        ):
+            for index in packed[position].indexes:
+                results[index] = result
+            position += 1
+
+        return results
+
+    async def warm(self, connections: Optional[int] = None) -> int:
+        """
+        Pre-establish keep-alive connections to the endpoint.
+
+        Args:
+            connections: Number of connections to open. Defaults to, and
+                is capped at, the pool's ``max_keepalive_connections``.
+
+        Returns:
+            The number of connections successfully warmed.
+        """
+        self._check_session_closed()
+        return await self._pool.warm(self._endpoint, connections)
+
+    def keep_warm(
+        self,
+        connections: Optional[int] = None,
+        interval: Optional[float] = None,
+    ) -> None:
+        """
+        Keep connections to the endpoint open in the background, until
+        the pool is shut down.
+
+        Args:
+            connections: Number of connections to keep open. Defaults to
+                the pool's ``max_keepalive_connections``.
+            interval: Seconds between refreshes. Defaults to 80% of the
+                pool's ``keepalive_expiry``.
+        """
+        self._pool.keep_warm(self._endpoint, connections, interval)
+
+    def _resolve_concurrency(self, concurrency: Optional[int]) -> int:
+        max_in_flight = self._pool.concurrency_limit
+
+        if concurrency is None:
+            return max_in_flight if max_in_flight is not None else 10
+
+        if not isinstance(concurrency, int) or concurrency < 1:
+            raise ValueError("concurrency must be a positive integer")
+
+        if max_in_flight is not None and concurrency > max_in_flight:
+            logger.debug(
+                "Capping concurrency %d to the pool limit %d",
+                concurrency,
+                max_in_flight,
+            )
+            return max_in_flight
+
+        return concurrency
+
+    @trace_client()
+    async def _send_payload(self, payload: dict[str, Any]) -> Response:
+        return await self._post_payload(payload)
+
+    async def _post_payload(self, payload: dict[str, Any]) -> Response:
+        self._check_session_closed()
+        start = time.perf_counter()
+        encoded = Payload.from_dict(payload)
+        self._record_serialization(time.perf_counter() - start)
+        return await self._send(self._session, encoded)
+
+    async def _deliver(
+        self,
+        email: Body,
+        retry: Optional[int],
+        backoff: Optional[float],
+        retry_ambiguous: bool = True,
     ) -> Response:
-        return await client.post(url=self._endpoint, json=json_message)
+        if retry is not None or backoff is not None or not retry_ambiguous:
+            policy = self._pool._retry_policy(retry, backoff, retry_ambiguous)
+            return await self._send(
+                self._session, await self._encode(email), retry=policy
+            )
+
+        if self._coalescer is not None and not isinstance(email, _ENCODED):
+            return await self._coalescer.submit(email)
+
+        return await self._send(self._session, await self._encode(email))
+
+    async def _encode(self, email: Body) -> Payload | StreamingBody:
+        if isinstance(email, StreamingBody):
+            return email
+        if isinstance(email, _ENCODED):
+            return to_payload(email)
+
+        start = time.perf_counter()
+        if (
+            self._serialize_executor is None
+            or estimate_size(email) < self._serialize_threshold
+        ):
+            payload = to_payload(email)
+        else:
+            loop = asyncio.get_running_loop()
+            payload = await loop.run_in_executor(
+                self._serialize_executor, to_payload, email
+            )
+        self._record_serialization(time.perf_counter() - start)
+        return payload
+
+    def _record_suppressed(self) -> None:
+        if self._pool.metrics:
+            from async_sendgrid.metrics import get_metrics
+
+            get_metrics().suppressed.add(1)
+
+    def _record_serialization(self, seconds: float) -> None:
+        span = get_current_span()
+        if span.is_recording():
+            span.set_attribute("sendgrid.phase.serialize_ms", seconds * 1000)
+        if self._pool.metrics:
+            from async_sendgrid.metrics import get_metrics
+
+            get_metrics().record_phase("serialize", seconds)
 
-    def _build_client(
+    async def _send(
         self,
-        retry: Optional[int] = None,
-        backoff: Optional[float] = None,
-    ) -> AsyncClient:
-        return self._pool._create_ephemeral_client(
-            self._headers, retry=retry, backoff=backoff
+        client: AsyncClient,
+        payload: Payload | StreamingBody,
+        retry: Optional[Retry] = None,
+    ) -> Response:
+        if isinstance(payload, StreamingBody):
+            # Send the exact length rather than a chunked body.
+            return await client.post(
+                url=self._endpoint,
+                content=payload,
+                headers={
+                    **self._tenant_headers,
+                    "Content-Length": str(len(payload)),
+                },
+                extensions={"retry": retry} if retry is not None else None,
+            )
+        return await client.post(
+            url=self._endpoint,
+            content=payload.content,
+            headers=self._tenant_headers,
+            extensions={"retry": retry} if retry is not None else None,
         )
 
     def _check_session_closed(self):
@@ -196,7 +586,7 @@ class SendgridAPI(BaseSendgridAPI):
             raise SessionClosedException("Session not initialized")
 
         logger.debug("Session closed unexpectedly, rebuilding client")
-        self._session = self._pool._create_client(self._headers)
+        self._session = self._pool._create_client(_CLIENT_HEADERS)
 
     def __repr__(self) -> str:
         return (
@@ -207,3 +597,57 @@ class SendgridAPI(BaseSendgridAPI):
 
     def __str__(self) -> str:
         return repr(self)
+
+
+async def _map_bounded(
+    func: Callable[[Any], Awaitable[Response]],
+    items: Iterable[Any] | AsyncIterable[Any],
+    limit: int,
+    shared: Optional[asyncio.Semaphore] = None,
+) -> AsyncIterator[Response | Exception]:
+    """
+    Apply ``func`` to each item with at most ``limit`` calls in flight,
+    yielding the results (or exceptions) in input order. Each call also
+    holds a slot of ``shared``, the budget of every concurrent caller.
+    """
+    semaphore = asyncio.Semaphore(limit)
+    # The reorder window lets later items keep the connections busy while
+    # an earlier, slower one is still being awaited.
+    window: deque[asyncio.Task[Response]] = deque()
+
+    async def _call(item: Any) -> Response:
+        async with semaphore:
+            if shared is None:
+                return await func(item)
+            async with shared:
+                return await func(item)
+
+    try:
+        async for item in _aiter(items):
+            if len(window) >= 2 * limit:
+                yield await _settle(window.popleft())
+            window.append(asyncio.ensure_future(_call(item)))
+
+        while window:
+            yield await _settle(window.popleft())
+    finally:
+        for task in window:
+            task.cancel()
+
+
+async def _aiter(
+    items: Iterable[Any] | AsyncIterable[Any],
+) -> AsyncIterator[Any]:
+    if hasattr(items, "__aiter__"):
+        async for item in items:  # type: ignore[union-attr]
+            yield item
+    else:
+        for item in items:  # type: ignore[union-attr]
+            yield item
+
+
+async def _settle(task: asyncio.Task[Response]) -> Response | Exception:
+    try:
+        return await task
+    except Exception as exc:
+        return exc
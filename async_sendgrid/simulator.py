@@ -0,0 +1,381 @@
+"""
+An in-process simulator of the SendGrid v3 mail/send endpoint.
+
+``SendGridSimulator`` is an ``httpx`` transport answering requests without
+any network access. Plugged into a ``ConnectionPool`` in place of the HTTP
+transport, it lets the retry, rate-limit and concurrency layers be tested
+and benchmarked deterministically::
+
+    simulator = SendGridSimulator(
+        latency=lognormal(median=0.05, sigma=0.5),
+        rate_limit=600,
+        error_rate=0.01,
+        seed=42,
+    )
+    sendgrid = SendgridAPI(
+        api_key="SG.test", pool=ConnectionPool(transport=simulator)
+    )
+"""
+
+from __future__ import annotations
+
+import asyncio
+import gzip
+import math
+import random
+import time
+import zlib
+from typing import TYPE_CHECKING
+
+from httpx import (  # type: ignore
+    AsyncBaseTransport,
+    ReadError,
+    ReadTimeout,
+    Response,
+)
+
+from async_sendgrid.payload import dumps, loads
+
+if TYPE_CHECKING:
+    from typing import Any, Callable, Optional, Union
+
+    from httpx import Request  # type: ignore
+
+    Latency = Union[float, Callable[[random.Random], float]]
+
+_SERVER_ERRORS = (500, 502, 503)
+
+
+def uniform(low: float, high: float) -> Callable[[random.Random], float]:
+    """
+    A latency drawn uniformly between two bounds.
+
+    Args:
+        low: The minimum latency in seconds.
+        high: The maximum latency in seconds.
+
+    Returns:
+        The latency distribution, to pass as ``latency``.
+    """
+    return lambda rng: rng.uniform(low, high)
+
+
+def lognormal(
+    median: float, sigma: float = 0.5
+) -> Callable[[random.Random], float]:
+    """
+    A log-normal latency, the usual shape of network service latencies.
+
+    Args:
+        median: The median latency in seconds.
+        sigma: The standard deviation of the underlying normal
+            distribution. Higher values give a longer tail.
+
+    Returns:
+        The latency distribution, to pass as ``latency``.
+    """
+    mu = math.log(median)
+    return lambda rng: rng.lognormvariate(mu, sigma)
+
+
+class SimulatorStats:
+    """Counters of the requests answered by a ``SendGridSimulator``."""
+
+    __slots__ = (
+        "requests",
+        "accepted",
+        "invalid",
+        "throttled",
+        "errors",
+        "timeouts",
+        "resets",
+    )
+
+    def __init__(self) -> None:
+        self.requests = 0
+        self.accepted = 0
+        self.invalid = 0
+        self.throttled = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.resets = 0
+
+    def __repr__(self) -> str:
+        counters = ", ".join(
+            f"{name}={getattr(self, name)}" for name in self.__slots__
+        )
+        return f"SimulatorStats({counters})"
+
+
+class SendGridSimulator(AsyncBaseTransport):
+    """
+    A transport mimicking ``POST /v3/mail/send``.
+
+    Each request is checked for an API key and a valid body. Accepted
+    messages get a ``202`` with an ``X-Message-Id`` after the configured
+    latency. With ``rate_limit`` set, every response carries the
+    ``X-RateLimit-*`` headers of a fixed window, and requests over the
+    limit get a ``429`` with ``Retry-After``. Server errors, throttled
+    responses, timeouts and connection resets are injected at the
+    configured rates. Given a ``seed``, the same sequence of requests gets
+    the same answers.
+    """
+
+    def __init__(
+        self,
+        latency: Latency = 0.0,
+        rate_limit: Optional[int] = None,
+        rate_limit_window: float = 1.0,
+        error_rate: float = 0.0,
+        timeout_rate: float = 0.0,
+        reset_rate: float = 0.0,
+        throttle_rate: float = 0.0,
+        timeout_delay: float = 0.0,
+        validate: bool = True,
+        seed: Optional[int] = None,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        """
+        Initialize the simulator.
+
+        Args:
+            latency (float | Callable, optional): Seconds waited before
+                answering, or a function drawing it from a
+                ``random.Random``, such as ``uniform()`` or
+                ``lognormal()``. Defaults to 0.0.
+            rate_limit (int, optional): Requests allowed per window.
+                Defaults to None (unlimited).
+            rate_limit_window (float, optional): Length of a rate-limit
+                window in seconds. Defaults to 1.0.
+            error_rate (float, optional): Share of requests answered with a
+                500, 502 or 503. Defaults to 0.0.
+            timeout_rate (float, optional): Share of requests failing with
+                a ``ReadTimeout``. Defaults to 0.0.
+            reset_rate (float, optional): Share of requests failing with a
+                connection reset. Defaults to 0.0.
+            throttle_rate (float, optional): Share of requests answered
+                with a ``429`` without ``Retry-After``, within the rate
+                limit, as under a burst. Defaults to 0.0.
+            timeout_delay (float, optional): Seconds waited before a
+                timeout is raised. Defaults to 0.0.
+            validate (bool, optional): Check the request bodies and answer
+                invalid ones with a ``400``. Defaults to True.
+            seed (int, optional): Seed of the random draws.
+                Defaults to None.
+            clock (Callable, optional): The wall clock, in seconds since
+                the epoch, used for the rate-limit windows.
+                Defaults to ``time.time``.
+        """
+        self._validate_rate("error_rate", error_rate)
+        self._validate_rate("timeout_rate", timeout_rate)
+        self._validate_rate("reset_rate", reset_rate)
+        self._validate_rate("throttle_rate", throttle_rate)
+        if error_rate + timeout_rate + reset_rate + throttle_rate > 1:
+            raise ValueError("the fault rates must add up to at most 1")
+        if rate_limit is not None and (
+            not isinstance(rate_limit, int) or rate_limit < 1
+        ):
+            raise ValueError("rate_limit must be a positive integer")
+        if (
+            not isinstance(rate_limit_window, (int, float))
+            or rate_limit_window <= 0
+        ):
+            raise ValueError("rate_limit_window must be a positive number")
+        if not callable(latency) and (
+            not isinstance(latency, (int, float)) or latency < 0
+        ):
+            raise ValueError("latency must be a positive number or callable")
+
+        self._latency = latency
+        self._rate_limit = rate_limit
+        self._window = rate_limit_window
+        self._error_rate = error_rate
+        self._timeout_rate = timeout_rate
+        self._reset_rate = reset_rate
+        self._throttle_rate = throttle_rate
+        self._timeout_delay = timeout_delay
+        self._validate = validate
+        self._random = random.Random(seed)
+        self._clock = clock
+
+        self._window_start = 0.0
+        self._window_count = 0
+        self._message_ids = 0
+        self.stats = SimulatorStats()
+
+    async def handle_async_request(self, request: Request) -> Response:
+        if request.method != "POST":
+            # Connection warm-up requests.
+            return Response(200, request=request)
+
+        self.stats.requests += 1
+        content = await request.aread()
+
+        if not request.headers.get("Authorization", "").startswith("Bearer "):
+            self.stats.invalid += 1
+            return _errors(401, "authorization required", None)
+
+        headers = self._rate_limit_headers()
+        if headers is not None and headers["X-RateLimit-Remaining"] == "-1":
+            self.stats.throttled += 1
+            headers["X-RateLimit-Remaining"] = "0"
+            reset = float(headers["X-RateLimit-Reset"])
+            headers["Retry-After"] = str(
+                max(math.ceil(reset - self._clock()), 1)
+            )
+            return _errors(429, "too many requests", None, headers)
+
+        draw = self._random.random()
+        if draw < self._timeout_rate:
+            self.stats.timeouts += 1
+            if self._timeout_delay:
+                await asyncio.sleep(self._timeout_delay)
+            raise ReadTimeout("Simulated timeout", request=request)
+        draw -= self._timeout_rate
+        if draw < self._reset_rate:
+            self.stats.resets += 1
+            raise ReadError("Connection reset by peer", request=request)
+        draw -= self._reset_rate
+        if draw < self._throttle_rate:
+            self.stats.throttled += 1
+            return _errors(429, "too many requests", None, headers)
+        draw -= self._throttle_rate
+
+        latency = (
+            self._latency(self._random)
+            if callable(self._latency)
+            else self._latency
+        )
+        if latency > 0:
+            await asyncio.sleep(latency)
+
+        if draw < self._error_rate:
+            self.stats.errors += 1
+            status = self._random.choice(_SERVER_ERRORS)
+            return _errors(status, "internal server error", None, headers)
+
+        if self._validate:
+            error = _check_body(
+                content, request.headers.get("Content-Encoding")
+            )
+            if error is not None:
+                self.stats.invalid += 1
+                return _errors(400, error[1], error[0], headers)
+
+        self.stats.accepted += 1
+        self._message_ids += 1
+        response_headers = dict(headers or {})
+        response_headers["X-Message-Id"] = f"simulated-{self._message_ids}"
+        return Response(202, headers=response_headers, request=request)
+
+    def _rate_limit_headers(self) -> Optional[dict[str, str]]:
+        """Count the request in the window; ``Remaining`` is -1 if over."""
+        if self._rate_limit is None:
+            return None
+
+        now = self._clock()
+        if now >= self._window_start + self._window:
+            self._window_start = now
+            self._window_count = 0
+        self._window_count += 1
+
+        return {
+            "X-RateLimit-Limit": str(self._rate_limit),
+            "X-RateLimit-Remaining": str(
+                max(self._rate_limit - self._window_count, -1)
+            ),
+            "X-RateLimit-Reset": str(self._window_start + self._window),
+        }
+
+    @staticmethod
+    def _validate_rate(name: str, rate: float) -> None:
+        if not isinstance(rate, (int, float)) or not 0 <= rate <= 1:
+            raise ValueError(f"{name} must be between 0 and 1")
+
+    def __repr__(self) -> str:
+        return f"SendGridSimulator({self.stats!r})"
+
+
+def _check_body(
+    content: bytes, encoding: Optional[str] = None
+) -> Optional[tuple[Optional[str], str]]:
+    """Return the field and message of the first error in a body."""
+    try:
+        if encoding == "gzip":
+            content = gzip.decompress(content)
+        message = loads(content)
+    except (ValueError, OSError, EOFError, zlib.error):
+        return None, "Bad Request"
+    if not isinstance(message, dict):
+        return None, "Bad Request"
+
+    personalizations = message.get("personalizations")
+    if (
+        not isinstance(personalizations, list)
+        or not personalizations
+        or not all(isinstance(p, dict) for p in personalizations)
+    ):
+        return (
+            "personalizations",
+            "The personalizations field is required and must have at "
+            "least one personalization.",
+        )
+    if len(personalizations) > 1000:
+        return (
+            "personalizations",
+            "The personalizations field cannot have more than 1000 "
+            "personalizations.",
+        )
+    for personalization in personalizations:
+        recipients = personalization.get("to")
+        if not isinstance(recipients, list) or not recipients:
+            return (
+                "personalizations.to",
+                "The to array is required for all personalization objects, "
+                "and must have at least one email object with a valid "
+                "email address.",
+            )
+        if any(not _is_email(recipient) for recipient in recipients):
+            return (
+                "personalizations.to.email",
+                "Does not contain a valid address.",
+            )
+
+    if not _is_email(message.get("from")):
+        return "from.email", "The from email does not contain a valid address."
+
+    if "template_id" not in message:
+        if not message.get("subject") and not all(
+            p.get("subject") for p in personalizations
+        ):
+            return "subject", "The subject is required."
+        contents = message.get("content")
+        if not isinstance(contents, list) or not contents:
+            return (
+                "content",
+                "Unless a valid template_id is provided, the content "
+                "parameter is required.",
+            )
+    return None
+
+
+def _is_email(value: Any) -> bool:
+    if not isinstance(value, dict):
+        return False
+    address = value.get("email")
+    return isinstance(address, str) and "@" in address.strip("@")
+
+
+def _errors(
+    status_code: int,
+    message: str,
+    field: Optional[str],
+    headers: Optional[dict[str, str]] = None,
+) -> Response:
+    return Response(
+        status_code,
+        headers={**(headers or {}), "Content-Type": "application/json"},
+        content=dumps(
+            {"errors": [{"message": message, "field": field, "help": None}]}
+        ),
+    )
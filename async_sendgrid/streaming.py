@@ -0,0 +1,300 @@
+"""
+Streamed request bodies for messages with large attachments.
+
+A ``StreamingAttachment`` points at a file path, a binary file object or a
+buffer such as an ``mmap``. The request body is produced chunk by chunk
+while it is being sent, base64-encoding the attachments on the fly, so the
+memory used by a send does not grow with the size of its attachments.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import base64
+import hashlib
+import mmap
+import os
+import threading
+from typing import TYPE_CHECKING
+
+from async_sendgrid.payload import dumps
+
+if TYPE_CHECKING:
+    from typing import Any, AsyncIterator, BinaryIO, Optional, Sequence
+
+    from sendgrid.helpers.mail import Mail  # type: ignore
+
+# A multiple of 3, so that the base64 of each chunk can be concatenated.
+_CHUNK_SIZE = 3 * 64 * 1024
+
+
+class StreamingAttachment:
+    """
+    An attachment read and base64-encoded while the request is sent.
+
+    Example::
+
+        await sendgrid.send(
+            email,
+            attachments=[
+                StreamingAttachment("report.pdf", file_type="application/pdf")
+            ],
+        )
+
+    The source must not change while a message is being sent: its size is
+    read once to set the ``Content-Length`` of the request. File objects
+    must be seekable, so that retried requests can read them again, and
+    concurrent sends of the same attachment can share them.
+    """
+
+    __slots__ = (
+        "_source",
+        "_offset",
+        "_size",
+        "_lock",
+        "_digest",
+        "filename",
+        "file_type",
+        "disposition",
+        "content_id",
+    )
+
+    def __init__(
+        self,
+        source: str | os.PathLike[str] | BinaryIO | bytes | mmap.mmap,
+        filename: Optional[str] = None,
+        file_type: Optional[str] = None,
+        disposition: Optional[str] = None,
+        content_id: Optional[str] = None,
+    ) -> None:
+        """
+        Initialize the attachment.
+
+        Args:
+            source: A file path, a seekable binary file object opened for
+                reading, or a bytes-like object such as an ``mmap``.
+            filename (str, optional): The attachment file name. Defaults to
+                the base name of a file path.
+            file_type (str, optional): The MIME type of the attachment.
+            disposition (str, optional): ``"attachment"`` or ``"inline"``.
+            content_id (str, optional): The content ID of an inline
+                attachment.
+        """
+        self._offset = 0
+        self._lock: Optional[threading.Lock] = None
+        # The SHA-256 of an immutable buffer, memoized by AttachmentCache.
+        self._digest: Optional[bytes] = None
+        if isinstance(source, (str, os.PathLike)):
+            self._source: Any = os.fspath(source)
+            self._size = os.stat(self._source).st_size
+            if filename is None:
+                filename = os.path.basename(self._source)
+        elif isinstance(source, (bytes, bytearray, memoryview, mmap.mmap)):
+            self._source = memoryview(source).cast("B")
+            self._size = len(self._source)
+        else:
+            if not source.seekable():
+                raise ValueError("file objects must be seekable")
+            self._source = source
+            self._offset = source.tell()
+            self._size = source.seek(0, os.SEEK_END) - self._offset
+            source.seek(self._offset)
+            # Sends reading the file at once each seek to their position.
+            self._lock = threading.Lock()
+
+        if not filename:
+            raise ValueError("filename is required")
+
+        self.filename = filename
+        self.file_type = file_type
+        self.disposition = disposition
+        self.content_id = content_id
+
+    @property
+    def size(self) -> int:
+        """The size of the attachment in bytes, before encoding."""
+        return self._size
+
+    def _metadata(self) -> bytes:
+        fields = {"filename": self.filename}
+        if self.file_type is not None:
+            fields["type"] = self.file_type
+        if self.disposition is not None:
+            fields["disposition"] = self.disposition
+        if self.content_id is not None:
+            fields["content_id"] = self.content_id
+        # b'{"filename":...}' becomes b',"filename":...}'.
+        return b"," + dumps(fields)[1:]
+
+    def _encoded_size(self) -> int:
+        return 4 * ((self._size + 2) // 3)
+
+    async def _chunks(self) -> AsyncIterator[bytes | memoryview]:
+        if isinstance(self._source, memoryview):
+            for start in range(0, self._size, _CHUNK_SIZE):
+                end = start + _CHUNK_SIZE
+                yield self._source[start:end]
+            return
+
+        loop = asyncio.get_running_loop()
+        if isinstance(self._source, str):
+            file = await loop.run_in_executor(None, open, self._source, "rb")
+        else:
+            file = self._source
+
+        try:
+            position = 0
+            while position < self._size:
+                chunk = await loop.run_in_executor(
+                    None,
+                    self._read_at,
+                    file,
+                    position,
+                    min(_CHUNK_SIZE, self._size - position),
+                )
+                if not chunk:
+                    raise ValueError(f"{self.filename} was truncated")
+                position += len(chunk)
+                yield chunk
+        finally:
+            if file is not self._source:
+                await loop.run_in_executor(None, file.close)
+
+    def _read_at(self, file: BinaryIO, position: int, size: int) -> bytes:
+        """Read up to size bytes at a position of the attachment."""
+        if self._lock is None:
+            # A file opened for this read, read from start to end.
+            return _read(file, size)
+        with self._lock:
+            file.seek(self._offset + position)
+            return _read(file, size)
+
+    def __repr__(self) -> str:
+        return (
+            f"StreamingAttachment(filename={self.filename!r}, "
+            f"size={self._size})"
+        )
+
+
+class StreamingBody:
+    """
+    A mail/send request body whose attachments are streamed.
+
+    Attachments given as bytes are JSON fragments encoded beforehand, such
+    as the ones held by an ``AttachmentCache``, and are spliced as-is.
+
+    Iterating the body produces the JSON document chunk by chunk. It can
+    be iterated several times, so requests using it can be retried.
+
+    This is an internal class and should not be used directly.
+    """
+
+    __slots__ = ("_parts", "_attachments", "_size")
+
+    def __init__(
+        self,
+        message: dict[str, Any],
+        attachments: Sequence[StreamingAttachment | bytes],
+    ) -> None:
+        message = dict(message)
+        inline = message.pop("attachments", None) or []
+
+        # The attachments are spliced at the end of the message:
+        # b'{...}' becomes b'{...,"attachments":[...]}'.
+        head = dumps(message)[:-1] + (b"," if message else b"")
+        head += b'"attachments":['
+        head += b",".join(dumps(item) for item in inline)
+
+        self._attachments = list(attachments)
+        self._parts = [head]
+        for position, attachment in enumerate(self._attachments):
+            separator = b"," if position or inline else b""
+            if isinstance(attachment, bytes):
+                self._parts.append(separator)
+                self._parts.append(b"")
+            else:
+                self._parts.append(separator + b'{"content":"')
+                self._parts.append(b'"' + attachment._metadata())
+        self._parts.append(b"]}")
+
+        self._size = sum(len(part) for part in self._parts) + sum(
+            (
+                len(attachment)
+                if isinstance(attachment, bytes)
+                else attachment._encoded_size()
+            )
+            for attachment in self._attachments
+        )
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        yield self._parts[0]
+        for position, attachment in enumerate(self._attachments):
+            yield self._parts[2 * position + 1]
+            if isinstance(attachment, bytes):
+                yield attachment
+            else:
+                # Only whole 3-byte groups are encoded, so that no padding
+                # lands in the middle of the content.
+                rest = b""
+                async for chunk in attachment._chunks():
+                    if rest:
+                        chunk = rest + chunk
+                    end = len(chunk) - len(chunk) % 3
+                    rest = bytes(chunk[end:])
+                    if end:
+                        yield base64.b64encode(chunk[:end])
+                if rest:
+                    yield base64.b64encode(rest)
+            yield self._parts[2 * position + 2]
+        yield self._parts[-1]
+
+    async def sha256(self) -> str:
+        """Return the hex SHA-256 digest of the body."""
+        digest = hashlib.sha256()
+        async for chunk in self:
+            digest.update(chunk)
+        return digest.hexdigest()
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __repr__(self) -> str:
+        return f"StreamingBody(size={self._size})"
+
+
+def _read(file: BinaryIO, size: int) -> bytes:
+    """Read up to size bytes, as many times as needed until EOF."""
+    data = file.read(size)
+    if not data or len(data) == size:
+        return data
+    parts = [data]
+    size -= len(data)
+    while size > 0:
+        data = file.read(size)
+        if not data:
+            break
+        parts.append(data)
+        size -= len(data)
+    return b"".join(parts)
+
+
+def stream_body(
+    email: Mail | dict[str, Any],
+    attachments: Sequence[StreamingAttachment | bytes],
+) -> StreamingBody:
+    """
+    Build a streamed request body.
+
+    Args:
+        email: The message, as a Mail object or its JSON dict. Its own
+            attachments, if any, are kept.
+        attachments: The attachments to stream after the message's own.
+
+    Returns:
+        The streamed request body.
+    """
+    if not isinstance(email, dict) and not hasattr(email, "get"):
+        raise ValueError("attachments require a Mail or dict body")
+
+    message = email if isinstance(email, dict) else email.get()
+    return StreamingBody(message, attachments)
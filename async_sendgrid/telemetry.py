@@ -8,37 +8,66 @@ from __future__ import annotations
 
 import logging
 import os
+import random
 from functools import wraps
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, NamedTuple
 
 from opentelemetry import trace
-from opentelemetry.sdk.trace import TracerProvider
 from opentelemetry.trace.span import Span
 from opentelemetry.trace.status import Status, StatusCode
 
+from async_sendgrid.payload import Payload
+
 if TYPE_CHECKING:
     from typing import Any, Optional
 
     from httpx import Response  # type: ignore
-    from sendgrid.helpers.mail import Mail  # type: ignore
 
+    from async_sendgrid.payload import Body
     from async_sendgrid.sendgrid import SendgridAPI
 
 logger = logging.getLogger(__name__)
 
-_SPAN_NAME = os.getenv("SENDGRID_TELEMETRY_SPAN_NAME", "sendgrid.send")
-logger.info("Telemetry span name is set as %s", _SPAN_NAME)
+# The proxy tracer follows the provider set by the application.
+_tracer = trace.get_tracer(__name__)
+
+
+class _Settings(NamedTuple):
+    enabled: bool
+    span_name: str
+    sample_ratio: float
+
+
+_settings: Optional[_Settings] = None
 
-if os.getenv("SENDGRID_TELEMETRY_IS_ENABLED", "true") == "false":
-    logger.info("Telemetry is disabled")
-    _SENGRID_TELEMETRY_ENABLED = False
-else:
-    _SENGRID_TELEMETRY_ENABLED = True
 
-# Only create a default tracer provider if one isn't already set
-if trace.get_tracer_provider() is None:
-    tracer_provider = TracerProvider()
-    trace.set_tracer_provider(tracer_provider)
+def _get_settings() -> _Settings:
+    """Read the telemetry settings from the environment on first use."""
+    global _settings
+    if _settings is None:
+        enabled = os.getenv("SENDGRID_TELEMETRY_IS_ENABLED", "true") != "false"
+        span_name = os.getenv("SENDGRID_TELEMETRY_SPAN_NAME", "sendgrid.send")
+        if enabled:
+            logger.info("Telemetry span name is set as %s", span_name)
+        else:
+            logger.info("Telemetry is disabled")
+        _settings = _Settings(enabled, span_name, _sample_ratio())
+    return _settings
+
+
+def _sample_ratio() -> float:
+    value = os.getenv("SENDGRID_TELEMETRY_SAMPLE_RATIO", "1.0")
+    try:
+        ratio = float(value)
+    except ValueError:
+        ratio = -1.0
+    if not 0.0 <= ratio <= 1.0:
+        logger.warning(
+            "Invalid SENDGRID_TELEMETRY_SAMPLE_RATIO %r, tracing every send",
+            value,
+        )
+        return 1.0
+    return ratio
 
 
 def create_span(
@@ -54,67 +83,113 @@ def create_span(
     Returns:
         The span.
     """
-    tracer = trace.get_tracer(__name__)
-    span = tracer.start_span(name, attributes=attributes)
-    return span
+    return _tracer.start_span(name, attributes=attributes)
 
 
-def trace_client():
+def trace_client(sample_ratio: Optional[float] = None):
     """
     Decorator to trace the response of a SendgridAPI method.
 
+    The ``SENDGRID_TELEMETRY_*`` environment variables are read on the
+    first call, not when the library is imported.
+
     Args:
-        func: The function to decorate.
+        sample_ratio: The share of calls traced, between 0 and 1. Calls
+            left out run without a span. Defaults to the
+            ``SENDGRID_TELEMETRY_SAMPLE_RATIO`` environment variable, or 1.
 
     Returns:
-        The decorated function.
+        The decorator.
     """
+    if sample_ratio is not None and not 0.0 <= sample_ratio <= 1.0:
+        raise ValueError("sample_ratio must be between 0 and 1")
 
     def decorator(func):
-        if _SENGRID_TELEMETRY_ENABLED is False:
+        if sample_ratio == 0.0:
             return func
 
         @wraps(func)
         async def wrapper(
-            self: SendgridAPI, email: Mail, **kwargs: Any
+            self: SendgridAPI, email: Body, **kwargs: Any
         ) -> Response:
-            span = create_span(_SPAN_NAME)
-            try:
-                set_sendgrid_metrics(span, email)
-                response: Response = await func(self, email, **kwargs)
-                set_http_metrics(span, response)
-                return response
-            except Exception as exc:
-                span.record_exception(exc)
-                span.set_status(Status(StatusCode.ERROR, str(exc)))
-                raise exc
-            finally:
-                span.end()
+            settings = _settings or _get_settings()
+            ratio = (
+                settings.sample_ratio if sample_ratio is None else sample_ratio
+            )
+            if not settings.enabled or (
+                ratio < 1.0 and random.random() >= ratio
+            ):
+                return await func(self, email, **kwargs)
+
+            span = _tracer.start_span(settings.span_name)
+            # Make the span current so the transports can annotate it.
+            with trace.use_span(
+                span,
+                end_on_exit=True,
+                record_exception=False,
+                set_status_on_exception=False,
+            ):
+                try:
+                    set_sendgrid_metrics(span, email)
+                    response: Response = await func(self, email, **kwargs)
+                    set_http_metrics(span, response)
+                    return response
+                except Exception as exc:
+                    span.record_exception(exc)
+                    span.set_status(Status(StatusCode.ERROR, str(exc)))
+                    raise exc
 
         return wrapper
 
     return decorator
 
 
-def set_sendgrid_metrics(span: Span, message: Mail) -> None:
+def set_sendgrid_metrics(span: Span, message: Body) -> None:
     """
     Set SendGrid metrics on a span.
 
     Args:
         span: The span to set the metrics on.
-        message: The message to set the metrics on.
+        message: The message, or its request body, to set the metrics on.
+            Metrics are skipped for raw bytes, which are never decoded.
 
     Returns:
         None
     """
+    if not span.is_recording() or isinstance(
+        message, (bytes, bytearray, memoryview)
+    ):
+        return
+
+    if isinstance(message, Payload):
+        attributes = {
+            "email.has_attachments": message.has_attachments,
+            "email.num_recipients": message.num_recipients,
+            "email.num_personalizations": message.num_personalizations,
+        }
+        span.set_attributes(
+            {k: v for k, v in attributes.items() if v is not None}
+        )
+        return
+
+    if isinstance(message, dict):
+        attachments = message.get("attachments")
+        personalizations = message.get("personalizations") or []
+        num_recipients = (
+            len(personalizations[0].get("to", ())) if personalizations else 0
+        )
+    else:
+        attachments = message.attachments
+        personalizations = message.personalizations or []
+        num_recipients = (
+            len(personalizations[0].tos) if personalizations else 0
+        )
+
     span.set_attributes(
         {
-            "email.has_attachments": True if message.attachments else False,
-            "email.num_recipients": (
-                len(message.personalizations[0].tos)
-                if message.personalizations
-                else 0
-            ),
+            "email.has_attachments": True if attachments else False,
+            "email.num_recipients": num_recipients,
+            "email.num_personalizations": len(personalizations),
         }
     )
 
@@ -123,6 +198,9 @@ def set_http_metrics(span: Span, response: Response) -> None:
     """
     Set response metrics on a span.
 
+    The content length is taken from the headers: the body is never read
+    or decoded.
+
     Args:
         span: The span to set the metrics on.
         response: The response to set the metrics on.
@@ -130,18 +208,27 @@ def set_http_metrics(span: Span, response: Response) -> None:
     Returns:
         None
     """
+    if not span.is_recording():
+        return
+
+    status_code = response.status_code
     span.set_attributes(
         {
-            "http.status_code": response.status_code,
+            "http.status_code": status_code,
             "http.url": str(response.url),
-            "http.content_length": (
-                len(response.content) if response.content else 0
-            ),
             "http.method": response.request.method,
         }
     )
-
-    if response.status_code >= 400:
+    try:
+        content_length = int(response.headers.get("Content-Length", 0))
+    except ValueError:
+        pass
+    else:
+        span.set_attribute("http.content_length", content_length)
+
+    if status_code >= 400:
         span.set_status(
-            StatusCode.ERROR, f"Request failed with message {response.text}"
+            StatusCode.ERROR,
+            f"Request failed with status {status_code} "
+            f"{response.reason_phrase}",
         )
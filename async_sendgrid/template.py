@@ -0,0 +1,121 @@
+"""
+Compiled message templates.
+
+A ``MessageTemplate`` encodes everything but the personalizations of a
+message once, then builds each request body by splicing per-recipient
+personalizations in front of the cached bytes.
+"""
+
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+from async_sendgrid.payload import Payload, dumps
+
+if TYPE_CHECKING:
+    from typing import Any, Optional
+
+    from sendgrid.helpers.mail import Mail, Personalization  # type: ignore
+
+_PREFIX = b'{"personalizations":'
+
+
+class MessageTemplate:
+    """
+    A message whose invariant part is pre-encoded to JSON bytes.
+
+    Example::
+
+        template = MessageTemplate(
+            Mail(
+                from_email="noreply@example.com",
+                subject="Your code",
+                html_content=html,
+            )
+        )
+        await sendgrid.send(
+            template.for_recipient("jane@example.com", substitutions=...)
+        )
+
+    Per send, only the personalizations are encoded, so the cost scales
+    with the per-recipient data rather than with the size of the content.
+    """
+
+    __slots__ = ("_suffix", "_has_attachments")
+
+    def __init__(self, email: Mail) -> None:
+        """
+        Compile the template.
+
+        Args:
+            email (Mail): The message to compile. Its personalizations,
+                if any, are ignored.
+        """
+        message = email.get()
+        message.pop("personalizations", None)
+        shared = dumps(message)
+
+        # Reuse the shared body as the tail of every request body:
+        # b'{"from":...}' becomes b',"from":...}'.
+        self._suffix = b"," + shared[1:] if message else b"}"
+        self._has_attachments = bool(message.get("attachments"))
+
+    def render(
+        self, *personalizations: Personalization | dict[str, Any]
+    ) -> Payload:
+        """
+        Build a request body for the given personalizations.
+
+        Args:
+            personalizations: ``Personalization`` objects or their JSON
+                dicts.
+
+        Returns:
+            The encoded request body.
+        """
+        if not personalizations:
+            raise ValueError("at least one personalization is required")
+
+        items = [
+            p if isinstance(p, dict) else p.get() for p in personalizations
+        ]
+        return Payload(
+            _PREFIX + dumps(items) + self._suffix,
+            num_recipients=len(items[0].get("to", ())),
+            num_personalizations=len(items),
+            has_attachments=self._has_attachments,
+        )
+
+    def for_recipient(
+        self,
+        email: str,
+        name: Optional[str] = None,
+        dynamic_template_data: Optional[dict[str, Any]] = None,
+        substitutions: Optional[dict[str, str]] = None,
+    ) -> Payload:
+        """
+        Build a request body for a single recipient.
+
+        Args:
+            email: The recipient email address.
+            name: The recipient name.
+            dynamic_template_data: Data for a dynamic template.
+            substitutions: Substitution tags for a legacy template.
+
+        Returns:
+            The encoded request body.
+        """
+        recipient: dict[str, Any] = {"email": email}
+        if name:
+            recipient["name"] = name
+
+        personalization: dict[str, Any] = {"to": [recipient]}
+        if dynamic_template_data is not None:
+            personalization["dynamic_template_data"] = dynamic_template_data
+        if substitutions is not None:
+            personalization["substitutions"] = substitutions
+
+        return self.render(personalization)
+
+    def __repr__(self) -> str:
+        return f"MessageTemplate(size={len(self._suffix)})"
@@ -0,0 +1,5 @@
+"""
+Throughput and latency benchmarks for async-sendgrid.
+
+Run ``python -m benchmarks --help`` for the available options.
+"""
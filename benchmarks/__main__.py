@@ -0,0 +1,172 @@
+"""
+Command line entry point of the benchmarks.
+
+Example::
+
+    python -m benchmarks --concurrency 1 10 50 --output results.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import platform
+import sys
+from datetime import datetime, timezone
+from typing import Any, Optional, Sequence
+
+
+def _parse_args(argv: Optional[Sequence[str]]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks",
+        description="Benchmark SendgridAPI.send against a local fake "
+        "SendGrid server or SendGridSimulator.",
+    )
+    parser.add_argument(
+        "--concurrency", type=int, nargs="+", default=[1, 10, 50]
+    )
+    parser.add_argument(
+        "--payload-sizes",
+        type=int,
+        nargs="+",
+        default=[1024, 64 * 1024],
+        help="Sizes in bytes of the HTML content of the messages.",
+    )
+    parser.add_argument(
+        "--modes",
+        nargs="+",
+        choices=["ok", "retry"],
+        default=["ok", "retry"],
+        help="'retry' fails 5%% of requests with a 5xx and 5%% with a 429, "
+        "on the simulator.",
+    )
+    parser.add_argument("--sends", type=int, default=2000)
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=0.0,
+        help="Seconds the server waits before answering.",
+    )
+    parser.add_argument(
+        "--transport",
+        choices=["socket", "simulator"],
+        default="socket",
+        help="Run the 'ok' scenarios against a local HTTP server, or "
+        "in-process against SendGridSimulator.",
+    )
+    parser.add_argument(
+        "--telemetry", choices=["on", "off", "both"], default="both"
+    )
+    parser.add_argument(
+        "--output", help="Write the results as JSON to this file."
+    )
+    args = parser.parse_args(argv)
+
+    from async_sendgrid.telemetry import _get_settings
+
+    if args.telemetry != "off" and not _get_settings().enabled:
+        parser.error(
+            "telemetry is disabled by SENDGRID_TELEMETRY_IS_ENABLED=false"
+        )
+    return args
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    args = _parse_args(argv)
+
+    modes = ("off", "on") if args.telemetry == "both" else (args.telemetry,)
+    if "on" in modes:
+        _install_tracer_provider()
+    results = []
+    for mode in modes:
+        results.extend(_run(args, telemetry=mode == "on"))
+
+    report = {
+        "metadata": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "version": _version(),
+        },
+        "results": results,
+    }
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+    _print_table(results)
+    return 0
+
+
+def _run(args: argparse.Namespace, telemetry: bool) -> list[dict[str, Any]]:
+    from benchmarks.runner import run, sweep
+
+    scenarios = sweep(
+        concurrency=args.concurrency,
+        payload_sizes=args.payload_sizes,
+        modes=args.modes,
+        sends=args.sends,
+        latency=args.latency,
+        transport=args.transport,
+    )
+    return asyncio.run(run(scenarios, telemetry=telemetry))
+
+
+def _install_tracer_provider() -> None:
+    from opentelemetry import trace
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import (
+        BatchSpanProcessor,
+        SpanExporter,
+        SpanExportResult,
+    )
+
+    class _NullExporter(SpanExporter):
+        def export(self, spans: Any) -> SpanExportResult:
+            return SpanExportResult.SUCCESS
+
+    provider = TracerProvider()
+    provider.add_span_processor(BatchSpanProcessor(_NullExporter()))
+    trace.set_tracer_provider(provider)
+
+
+def _version() -> str:
+    from async_sendgrid import __version__
+
+    return __version__
+
+
+def _print_table(results: list[dict[str, Any]]) -> None:
+    columns = [
+        "scenario",
+        "telemetry",
+        "sends_per_s",
+        "p50_ms",
+        "p99_ms",
+        "cpu_us_per_send",
+        "memory_per_in_flight_kb",
+        "requests",
+        "failures",
+    ]
+    rows = [
+        [
+            (
+                str(result[column]["name"])
+                if column == "scenario"
+                else str(result[column])
+            )
+            for column in columns
+        ]
+        for result in results
+    ]
+    widths = [
+        max(len(column), *(len(row[i]) for row in rows))
+        for i, column in enumerate(columns)
+    ]
+    for row in [columns, *rows]:
+        print("  ".join(cell.rjust(width) for cell, width in zip(row, widths)))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,233 @@
+"""
+Benchmark scenarios driving ``SendgridAPI.send`` against ``FakeSendGrid``
+or ``SendGridSimulator``.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import gc
+import itertools
+import statistics
+import time
+import tracemalloc
+from dataclasses import asdict, dataclass, field
+from functools import partial
+from typing import Any, Iterable, Optional, Sequence
+
+from httpx import AsyncBaseTransport  # type: ignore
+from sendgrid.helpers.mail import Mail  # type: ignore
+
+from async_sendgrid import ConnectionPool, SendgridAPI
+from async_sendgrid.simulator import SendGridSimulator
+from benchmarks.server import FakeSendGrid
+
+# Transports the scenarios can run against: a local HTTP server, or the
+# simulator, without sockets.
+TRANSPORTS = ("socket", "simulator")
+
+
+@dataclass(frozen=True)
+class Scenario:
+    """A benchmark configuration."""
+
+    name: str
+    concurrency: int
+    payload_size: int
+    sends: int = 2000
+    latency: float = 0.0
+    error_rate: float = 0.0
+    throttle_rate: float = 0.0
+    transport: str = "socket"
+    pool: dict[str, Any] = field(default_factory=dict)
+
+
+@dataclass
+class Result:
+    """The measurements of a scenario."""
+
+    scenario: Scenario
+    telemetry: bool
+    sends: int
+    failures: int
+    requests: int
+    duration_s: float
+    sends_per_s: float
+    p50_ms: float
+    p90_ms: float
+    p99_ms: float
+    cpu_us_per_send: float
+    memory_per_in_flight_kb: float
+
+    def to_dict(self) -> dict[str, Any]:
+        result = asdict(self)
+        result["scenario"] = asdict(self.scenario)
+        return result
+
+
+# Sends are failed with a 5xx or a 429 in the retry scenarios, which run
+# against the simulator.
+RETRY_RATES = {"ok": (0.0, 0.0), "retry": (0.05, 0.05)}
+
+
+def sweep(
+    concurrency: Iterable[int] = (1, 10, 50),
+    payload_sizes: Iterable[int] = (1024, 64 * 1024),
+    modes: Iterable[str] = ("ok", "retry"),
+    sends: int = 2000,
+    latency: float = 0.0,
+    transport: str = "socket",
+) -> list[Scenario]:
+    """Build the cross product of the given settings."""
+    scenarios = []
+    for mode, level, size in itertools.product(
+        modes, concurrency, payload_sizes
+    ):
+        error_rate, throttle_rate = RETRY_RATES[mode]
+        scenarios.append(
+            Scenario(
+                name=f"{mode}-c{level}-{size}b",
+                concurrency=level,
+                payload_size=size,
+                sends=sends,
+                latency=latency,
+                error_rate=error_rate,
+                throttle_rate=throttle_rate,
+                transport="simulator" if mode == "retry" else transport,
+                pool={
+                    "max_connections": level,
+                    "max_keepalive_connections": level,
+                    "backoff_factor": 0.0,
+                },
+            )
+        )
+    return scenarios
+
+
+def make_mail(payload_size: int, index: int = 0) -> Mail:
+    """Build a message whose HTML content is ``payload_size`` bytes."""
+    return Mail(
+        from_email="benchmark@example.com",
+        to_emails=f"user{index}@example.com",
+        subject="Benchmark",
+        html_content="x" * payload_size,
+    )
+
+
+async def run_scenario(scenario: Scenario, telemetry: bool) -> Result:
+    """Run a scenario, then a shorter pass measuring memory."""
+    if scenario.transport == "simulator":
+        simulator = SendGridSimulator(
+            latency=scenario.latency,
+            error_rate=scenario.error_rate,
+            throttle_rate=scenario.throttle_rate,
+            validate=False,
+            seed=0,
+        )
+        result = await _measure(scenario, telemetry, transport=simulator)
+        requests = simulator.stats.requests
+    else:
+        async with FakeSendGrid(latency=scenario.latency) as server:
+            result = await _measure(scenario, telemetry, endpoint=server.url)
+            requests = server.requests
+    latencies, failures, duration, cpu, peak = result
+
+    quantiles = statistics.quantiles(latencies, n=100)
+    return Result(
+        scenario=scenario,
+        telemetry=telemetry,
+        sends=scenario.sends,
+        failures=failures,
+        requests=requests,
+        duration_s=round(duration, 4),
+        sends_per_s=round(scenario.sends / duration, 1),
+        p50_ms=round(quantiles[49] * 1000, 3),
+        p90_ms=round(quantiles[89] * 1000, 3),
+        p99_ms=round(quantiles[98] * 1000, 3),
+        cpu_us_per_send=round(cpu / scenario.sends * 1e6, 1),
+        memory_per_in_flight_kb=round(peak / scenario.concurrency / 1024, 1),
+    )
+
+
+async def run(
+    scenarios: Sequence[Scenario], telemetry: bool
+) -> list[dict[str, Any]]:
+    """Run scenarios one after the other."""
+    return [
+        (await run_scenario(scenario, telemetry)).to_dict()
+        for scenario in scenarios
+    ]
+
+
+async def _measure(
+    scenario: Scenario,
+    telemetry: bool,
+    endpoint: Optional[str] = None,
+    transport: Optional[AsyncBaseTransport] = None,
+) -> tuple[list[float], int, float, float, int]:
+    latencies, failures, duration, cpu = await _drive(
+        scenario, scenario.sends, telemetry, endpoint, transport
+    )
+    # tracemalloc slows everything down: measure it separately.
+    tracemalloc.start()
+    try:
+        await _drive(
+            scenario, scenario.concurrency * 4, telemetry, endpoint, transport
+        )
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return latencies, failures, duration, cpu, peak
+
+
+async def _drive(
+    scenario: Scenario,
+    sends: int,
+    telemetry: bool,
+    endpoint: Optional[str],
+    transport: Optional[AsyncBaseTransport],
+) -> tuple[list[float], int, float, float]:
+    pool = ConnectionPool(transport=transport, **scenario.pool)
+    options = {} if endpoint is None else {"endpoint": endpoint}
+    client = SendgridAPI(api_key="SG.benchmark", pool=pool, **options)
+    # The undecorated method sends without telemetry, whatever the
+    # SENDGRID_TELEMETRY_* variables say.
+    send = (
+        client.send
+        if telemetry
+        else partial(SendgridAPI.send.__wrapped__, client)  # type: ignore
+    )
+    emails = [
+        make_mail(scenario.payload_size, index)
+        for index in range(min(sends, 100))
+    ]
+    latencies: list[float] = []
+    failures = 0
+
+    async def _send(index: int) -> None:
+        nonlocal failures
+        start = time.perf_counter()
+        try:
+            response = await send(emails[index % len(emails)])
+            if response.status_code != 202:
+                failures += 1
+        except Exception:
+            failures += 1
+        latencies.append(time.perf_counter() - start)
+
+    await client.warm()
+    semaphore = asyncio.Semaphore(scenario.concurrency)
+
+    async def _bounded(index: int) -> None:
+        async with semaphore:
+            await _send(index)
+
+    gc.collect()
+    cpu_start = time.process_time()
+    start = time.perf_counter()
+    await asyncio.gather(*(_bounded(index) for index in range(sends)))
+    duration = time.perf_counter() - start
+    cpu = time.process_time() - cpu_start
+
+    await pool.shutdown()
+    return latencies, failures, duration, cpu
@@ -0,0 +1,100 @@
+"""
+A minimal in-process HTTP/1.1 server standing in for SendGrid.
+
+It answers ``POST`` requests with ``202 Accepted`` over keep-alive
+connections, after an optional delay. Unlike ``SendGridSimulator``, the
+requests go through real sockets, so the runs include the cost of the
+connections, the HTTP parsing and the connection pool. Failures are left
+to the simulator, which the retry scenarios run against.
+"""
+
+from __future__ import annotations
+
+import asyncio
+from typing import Optional
+
+_ACCEPTED = (
+    b"HTTP/1.1 202 Accepted\r\n"
+    b"Content-Length: 0\r\n"
+    b"X-Message-Id: benchmark\r\n"
+    b"\r\n"
+)
+
+
+class FakeSendGrid:
+    """
+    A fake mail/send endpoint listening on localhost.
+
+    Example::
+
+        async with FakeSendGrid(latency=0.005) as server:
+            client = SendgridAPI(api_key="...", endpoint=server.url)
+    """
+
+    def __init__(self, latency: float = 0.0) -> None:
+        """
+        Initialize the server.
+
+        Args:
+            latency: Seconds waited before answering each request.
+        """
+        self._latency = latency
+        self._server: Optional[asyncio.Server] = None
+        # Warm-up requests are not counted.
+        self.requests = 0
+        self.received_bytes = 0
+
+    @property
+    def url(self) -> str:
+        """The URL of the mail/send endpoint."""
+        assert self._server is not None, "server is not started"
+        port = self._server.sockets[0].getsockname()[1]
+        return f"http://127.0.0.1:{port}/v3/mail/send"
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(
+            self._handle, "127.0.0.1", 0, backlog=1024
+        )
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def __aenter__(self) -> FakeSendGrid:
+        await self.start()
+        return self
+
+    async def __aexit__(self, *args: object) -> None:
+        await self.stop()
+
+    def _response(self) -> bytes:
+        # Tests replace it to script the answers.
+        return _ACCEPTED
+
+    async def _handle(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                length = 0
+                for line in head.split(b"\r\n")[1:]:
+                    name, _, value = line.partition(b":")
+                    if name.strip().lower() == b"content-length":
+                        length = int(value)
+                if length:
+                    await reader.readexactly(length)
+
+                if head.startswith(b"POST "):
+                    self.requests += 1
+                    self.received_bytes += len(head) + length
+                    if self._latency:
+                        await asyncio.sleep(self._latency)
+                writer.write(self._response())
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
@@ -0,0 +1,102 @@
+"""
+Micro-benchmark of the per-send overhead of telemetry.
+
+It times the ``trace_client`` wrapper around a send answering at once, so
+only the telemetry work is measured: spans, attributes and sampling.
+
+Example::
+
+    python -m benchmarks.telemetry --sends 50000
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import sys
+import time
+from typing import Any, Awaitable, Callable, Optional, Sequence
+
+from benchmarks.runner import make_mail
+
+
+def measure(
+    sends: int = 20000, sample_ratio: float = 0.1, repeat: int = 3
+) -> dict[str, float]:
+    """
+    Time a send with telemetry off, on, and sampled.
+
+    Args:
+        sends: The number of sends timed per setting.
+        sample_ratio: The share of sends traced in the sampled setting.
+        repeat: The number of runs per setting; the fastest is kept.
+
+    Returns:
+        The microseconds spent per send, by setting.
+    """
+    from httpx import Request, Response  # type: ignore
+
+    from async_sendgrid.telemetry import trace_client
+
+    response = Response(
+        202,
+        headers={"Content-Length": "0"},
+        request=Request("POST", "https://api.sendgrid.com/v3/mail/send"),
+    )
+
+    async def send(self: Any, email: Any, **kwargs: Any) -> Response:
+        return response
+
+    variants = {
+        "off": send,
+        "on": trace_client(sample_ratio=1.0)(send),
+        f"sampled {sample_ratio:g}": trace_client(sample_ratio=sample_ratio)(
+            send
+        ),
+    }
+    email = make_mail(1024)
+    return {
+        name: min(
+            asyncio.run(_time(func, email, sends)) for _ in range(repeat)
+        )
+        for name, func in variants.items()
+    }
+
+
+async def _time(
+    send: Callable[..., Awaitable[Any]], email: Any, sends: int
+) -> float:
+    start = time.perf_counter()
+    for _ in range(sends):
+        await send(None, email)
+    return round((time.perf_counter() - start) / sends * 1e6, 2)
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks.telemetry",
+        description="Measure the per-send overhead of telemetry.",
+    )
+    parser.add_argument("--sends", type=int, default=20000)
+    parser.add_argument("--sample-ratio", type=float, default=0.1)
+    args = parser.parse_args(argv)
+
+    from async_sendgrid.telemetry import _get_settings
+    from benchmarks.__main__ import _install_tracer_provider
+
+    if not _get_settings().enabled:
+        parser.error(
+            "telemetry is disabled by SENDGRID_TELEMETRY_IS_ENABLED=false"
+        )
+
+    _install_tracer_provider()
+
+    results = measure(args.sends, args.sample_ratio)
+    for name, micros in results.items():
+        overhead = micros - results["off"]
+        print(f"{name:>14}  {micros:8.2f} us/send  {overhead:+8.2f} us")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
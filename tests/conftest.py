@@ -1,9 +1,14 @@
-from typing import Generator
+from typing import Any, Callable, Generator
 
 import pytest
-from httpx import request
+from httpx import AsyncClient, MockTransport, request
 from opentelemetry import trace
 from opentelemetry.sdk.trace import TracerProvider
+from sendgrid.helpers.mail import Mail  # type: ignore
+
+from async_sendgrid.pool import ConnectionPool
+from async_sendgrid.sendgrid import SendgridAPI
+from async_sendgrid.simulator import SendGridSimulator
 
 
 @pytest.fixture(scope="package")
@@ -18,3 +23,48 @@ def provider() -> Generator[TracerProvider, None, None]:
 def cleanup_test_server():
     yield
     request("DELETE", url="http://localhost:3000/api/mails")
+
+
+@pytest.fixture
+def make_mail() -> Callable[..., Mail]:
+    """Build plain text emails to a recipient."""
+
+    def _make_mail(
+        recipient: str = "user@example.com", subject: str = "Example email"
+    ) -> Mail:
+        return Mail(
+            from_email="johndoe@example.com",
+            to_emails=recipient,
+            subject=subject,
+            plain_text_content="Hello World!",
+        )
+
+    return _make_mail
+
+
+@pytest.fixture
+def mock_client() -> Callable[..., SendgridAPI]:
+    """Build clients whose session is served by a request handler."""
+
+    def _mock_client(handler: Callable, **kwargs: Any) -> SendgridAPI:
+        kwargs.setdefault("pool", ConnectionPool(max_connections=4))
+        client = SendgridAPI(api_key="SECRET_KEY", **kwargs)
+        client._session = AsyncClient(
+            headers=client.headers, transport=MockTransport(handler)
+        )
+        return client
+
+    return _mock_client
+
+
+@pytest.fixture
+def simulator_client() -> Callable[..., SendgridAPI]:
+    """Build clients sending through a ``SendGridSimulator``."""
+
+    def _simulator_client(
+        simulator: SendGridSimulator, **kwargs: Any
+    ) -> SendgridAPI:
+        pool = ConnectionPool(transport=simulator, backoff_factor=0, **kwargs)
+        return SendgridAPI(api_key="SG.test", pool=pool)
+
+    return _simulator_client
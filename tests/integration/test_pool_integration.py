@@ -1,7 +1,9 @@
 import asyncio
 
 import pytest
+import pytest_asyncio
 
+from async_sendgrid.exception import SessionClosedException
 from async_sendgrid.pool import ConnectionPool
 
 
@@ -30,3 +32,78 @@ async def test_concurrent_requests(pool: ConnectionPool):
     responses = await asyncio.gather(*tasks)
 
     assert all(response.status_code == 200 for response in responses)
+
+
+URL = "http://localhost:3000/api/mails"
+
+
+@pytest_asyncio.fixture
+async def warm_pool():
+    p = ConnectionPool(
+        max_connections=10,
+        max_keepalive_connections=4,
+        keepalive_expiry=0.5,
+    )
+    p._create_client({"Authorization": "Bearer test"})
+    yield p
+    await p.shutdown()
+
+
+def _open_connections(pool: ConnectionPool) -> int:
+    return sum(
+        1
+        for connection in pool._http_transport._pool.connections
+        if not connection.is_closed()
+    )
+
+
+@pytest.mark.asyncio
+async def test_warm_opens_keepalive_connections(warm_pool: ConnectionPool):
+    """Test that warm pre-establishes the requested connections."""
+    warmed = await warm_pool.warm(URL, 3)
+
+    assert warmed == 3
+    assert _open_connections(warm_pool) == 3
+
+
+@pytest.mark.asyncio
+async def test_warm_is_capped_at_keepalive_connections(
+    warm_pool: ConnectionPool,
+):
+    """Test that warm never opens more than the keep-alive limit."""
+    warmed = await warm_pool.warm(URL, 8)
+
+    assert warmed == 4
+    assert _open_connections(warm_pool) == 4
+
+
+@pytest.mark.asyncio
+async def test_warm_reports_failures(warm_pool: ConnectionPool):
+    """Test that unreachable hosts are reported, not raised."""
+    assert await warm_pool.warm("http://127.0.0.1:1/v3/mail/send", 2) == 0
+
+
+@pytest.mark.asyncio
+async def test_warm_after_shutdown_raises(warm_pool: ConnectionPool):
+    """Test that warming a shut down pool raises."""
+    await warm_pool.shutdown()
+    with pytest.raises(SessionClosedException):
+        await warm_pool.warm(URL)
+
+
+@pytest.mark.asyncio
+async def test_keep_warm_refreshes_connections(warm_pool: ConnectionPool):
+    """Test that the keeper refreshes connections before they expire."""
+    warm_pool.keep_warm(URL, connections=2, interval=0.2)
+    await asyncio.sleep(0.1)
+    connections = list(warm_pool._http_transport._pool.connections)
+
+    # Without refreshes, the connections would expire after 0.5s.
+    await asyncio.sleep(1.0)
+
+    assert len(connections) == 2
+    assert list(warm_pool._http_transport._pool.connections) == connections
+    assert _open_connections(warm_pool) == 2
+
+    await warm_pool.shutdown()
+    assert warm_pool._keeper is None
@@ -0,0 +1,110 @@
+import json
+
+import pytest
+
+from benchmarks.__main__ import main
+from benchmarks.runner import Scenario, run_scenario, sweep
+from benchmarks.telemetry import measure
+
+
+def test_sweep_builds_the_cross_product():
+    scenarios = sweep(
+        concurrency=[1, 10], payload_sizes=[100], modes=["ok", "retry"]
+    )
+    assert [s.name for s in scenarios] == [
+        "ok-c1-100b",
+        "ok-c10-100b",
+        "retry-c1-100b",
+        "retry-c10-100b",
+    ]
+    assert scenarios[1].pool["max_connections"] == 10
+    assert scenarios[2].error_rate > 0
+    assert [s.transport for s in scenarios] == [
+        "socket",
+        "socket",
+        "simulator",
+        "simulator",
+    ]
+
+
+def test_sweep_runs_every_scenario_on_the_simulator():
+    """Test the transport option of the sweep."""
+    scenarios = sweep(
+        concurrency=[1], payload_sizes=[100], transport="simulator"
+    )
+    assert {s.transport for s in scenarios} == {"simulator"}
+
+
+@pytest.mark.asyncio
+async def test_run_scenario_reports_measurements():
+    """Test a short run against the local server."""
+    scenario = Scenario(
+        name="smoke",
+        concurrency=4,
+        payload_size=100,
+        sends=50,
+        pool={"max_connections": 4, "backoff_factor": 0.0},
+    )
+    result = await run_scenario(scenario, telemetry=False)
+
+    assert result.sends == 50
+    assert result.failures == 0
+    assert result.requests >= 50
+    assert 0 < result.p50_ms <= result.p99_ms
+    assert result.sends_per_s > 0
+    assert result.memory_per_in_flight_kb > 0
+
+
+@pytest.mark.asyncio
+async def test_retry_scenario_runs_on_the_simulator():
+    """Test a short run with server errors and 429s, some retried."""
+    scenario = Scenario(
+        name="retry",
+        concurrency=4,
+        payload_size=100,
+        sends=50,
+        error_rate=0.1,
+        throttle_rate=0.1,
+        transport="simulator",
+        pool={"max_connections": 4, "backoff_factor": 0.0},
+    )
+    result = await run_scenario(scenario, telemetry=True)
+
+    assert result.sends == 50
+    # A 500 is not retried, and the simulator counts every attempt.
+    assert result.failures < 50
+    assert result.requests > 50
+    assert 0 < result.p50_ms <= result.p99_ms
+
+
+def test_cli_writes_json_results(tmp_path):
+    output = tmp_path / "results.json"
+    assert (
+        main(
+            [
+                "--concurrency",
+                "2",
+                "--payload-sizes",
+                "100",
+                "--modes",
+                "ok",
+                "--sends",
+                "20",
+                "--telemetry",
+                "off",
+                "--output",
+                str(output),
+            ]
+        )
+        == 0
+    )
+
+    report = json.loads(output.read_text())
+    assert report["metadata"]["python"]
+    assert [r["scenario"]["name"] for r in report["results"]] == ["ok-c2-100b"]
+
+
+def test_telemetry_micro_benchmark():
+    results = measure(sends=50, sample_ratio=0.5, repeat=1)
+    assert list(results) == ["off", "on", "sampled 0.5"]
+    assert all(micros > 0 for micros in results.values())
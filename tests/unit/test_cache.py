@@ -0,0 +1,231 @@
+import asyncio
+import base64
+import io
+import json
+import os
+import time
+
+import pytest
+from httpx import AsyncClient, MockTransport, Request, Response
+from sendgrid.helpers.mail import Mail  # type: ignore
+
+from async_sendgrid import cache as cache_module
+from async_sendgrid.cache import AttachmentCache, CacheStats
+from async_sendgrid.sendgrid import SendgridAPI
+from async_sendgrid.streaming import StreamingAttachment, stream_body
+
+DATA = b"%PDF-1.4 terms and conditions" * 100
+
+
+@pytest.fixture
+def path(tmp_path) -> str:
+    path = tmp_path / "terms.pdf"
+    path.write_bytes(DATA)
+    return str(path)
+
+
+@pytest.mark.asyncio
+async def test_fragments_are_reused_across_sources(path: str):
+    """Test that the same content is encoded once, whatever its source."""
+    cache = AttachmentCache()
+
+    first = await cache.resolve(StreamingAttachment(path))
+    second = await cache.resolve(StreamingAttachment(DATA, "terms.pdf"))
+    with open(path, "rb") as file:
+        third = await cache.resolve(StreamingAttachment(file, "terms.pdf"))
+
+    assert first is second is third
+    assert json.loads(first) == {
+        "content": base64.b64encode(DATA).decode(),
+        "filename": "terms.pdf",
+    }
+    assert cache.stats == CacheStats(
+        hits=2, misses=1, evictions=0, size=len(first), entries=1
+    )
+
+
+@pytest.mark.asyncio
+async def test_metadata_is_part_of_the_key():
+    cache = AttachmentCache()
+    await cache.resolve(StreamingAttachment(DATA, "a.pdf"))
+    await cache.resolve(StreamingAttachment(DATA, "b.pdf"))
+    assert cache.stats.misses == 2
+
+
+@pytest.mark.asyncio
+async def test_unchanged_files_are_not_read_again(path: str, monkeypatch):
+    """Test that a hit on an unchanged file skips reading it."""
+    cache = AttachmentCache()
+    await cache.resolve(StreamingAttachment(path))
+
+    def fail(attachment):
+        raise AssertionError("file read")
+
+    monkeypatch.setattr(cache_module, "_read_all", fail)
+    await cache.resolve(StreamingAttachment(path))
+    assert cache.stats.hits == 1
+
+
+@pytest.mark.parametrize(
+    "buffer, hashes", [(bytes, 1), (bytearray, 2)], ids=["bytes", "bytearray"]
+)
+@pytest.mark.asyncio
+async def test_large_buffers_are_hashed_off_the_loop(
+    buffer, hashes, monkeypatch
+):
+    """Test that large buffers are hashed in a thread, bytes only once."""
+    calls = []
+    sha256 = cache_module._sha256
+
+    def counting_sha256(content):
+        calls.append(len(content))
+        return sha256(content)
+
+    monkeypatch.setattr(cache_module, "_sha256", counting_sha256)
+    cache = AttachmentCache(max_bytes=16 * 2**20)
+    attachment = StreamingAttachment(
+        buffer(cache_module._HASH_OFFLOAD_BYTES), "large.bin"
+    )
+
+    await cache.resolve(attachment)
+    await cache.resolve(attachment)
+
+    assert len(calls) == hashes
+    assert cache.stats.hits == 1
+
+
+class _SlowSeekFile(io.BytesIO):
+    """A file object leaving time for another read after each seek."""
+
+    def seek(self, *args) -> int:
+        position = super().seek(*args)
+        time.sleep(0.001)
+        return position
+
+
+@pytest.mark.asyncio
+async def test_file_object_read_while_streamed():
+    """Test that cache misses and sends can read a file object at once."""
+    data = bytes(range(256)) * 4096
+    attachment = StreamingAttachment(_SlowSeekFile(data), "large.bin")
+    body = stream_body({"subject": "Example"}, [attachment])
+
+    async def resolve() -> bytes:
+        cache = AttachmentCache(max_bytes=16 * 2**20)
+        fragment = await cache.resolve(attachment)
+        return json.loads(fragment)["content"]
+
+    async def stream() -> bytes:
+        content = b"".join([bytes(chunk) async for chunk in body])
+        return json.loads(content)["attachments"][0]["content"]
+
+    contents = await asyncio.gather(
+        *(read() for _ in range(4) for read in (resolve, stream))
+    )
+
+    assert set(contents) == {base64.b64encode(data).decode()}
+
+
+@pytest.mark.asyncio
+async def test_modified_files_are_encoded_again(path: str):
+    cache = AttachmentCache()
+    await cache.resolve(StreamingAttachment(path))
+
+    with open(path, "ab") as file:
+        file.write(b"v2")
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+
+    fragment = await cache.resolve(StreamingAttachment(path))
+    assert base64.b64decode(json.loads(fragment)["content"]) == DATA + b"v2"
+    assert cache.stats.misses == 2
+
+
+@pytest.mark.asyncio
+async def test_least_recently_used_fragments_are_evicted():
+    """Test that the cache stays within its byte budget."""
+    fragment_size = len(
+        await AttachmentCache().resolve(StreamingAttachment(b"0" * 300, "0"))
+    )
+    cache = AttachmentCache(
+        max_bytes=2 * fragment_size, max_item_bytes=fragment_size
+    )
+    attachments = [
+        StreamingAttachment(str(i).encode() * 300, str(i)) for i in range(3)
+    ]
+
+    await cache.resolve(attachments[0])
+    await cache.resolve(attachments[1])
+    await cache.resolve(attachments[0])
+    await cache.resolve(attachments[2])
+
+    assert cache.stats == CacheStats(
+        hits=1,
+        misses=3,
+        evictions=1,
+        size=2 * fragment_size,
+        entries=2,
+    )
+    await cache.resolve(attachments[0])
+    assert cache.stats.hits == 2
+
+
+@pytest.mark.asyncio
+async def test_large_attachments_are_streamed():
+    cache = AttachmentCache(max_bytes=1000)
+    attachment = StreamingAttachment(io.BytesIO(b"x" * 1000), "large.bin")
+
+    assert await cache.resolve(attachment) is attachment
+    assert len(cache) == 0
+
+
+@pytest.mark.asyncio
+async def test_send_splices_cached_attachments(path: str):
+    """Test that messages sent with a cache carry the attachments."""
+    requests: list[Request] = []
+
+    def handler(request: Request) -> Response:
+        requests.append(request)
+        return Response(202)
+
+    cache = AttachmentCache()
+    client = SendgridAPI(api_key="SECRET_KEY", attachment_cache=cache)
+    client._session = AsyncClient(
+        headers=client.headers, transport=MockTransport(handler)
+    )
+    for recipient in ("a@example.com", "b@example.com"):
+        email = Mail(
+            from_email="johndoe@example.com",
+            to_emails=recipient,
+            subject="Example email",
+            plain_text_content="Hello World!",
+        )
+        await client.send(
+            email,
+            attachments=[
+                StreamingAttachment(path),
+                StreamingAttachment(b"receipt", "receipt.txt"),
+            ],
+        )
+
+    for request in requests:
+        assert int(request.headers["Content-Length"]) == len(request.content)
+        attachments = json.loads(request.content)["attachments"]
+        assert [a["filename"] for a in attachments] == [
+            "terms.pdf",
+            "receipt.txt",
+        ]
+        assert base64.b64decode(attachments[0]["content"]) == DATA
+    assert cache.stats.hits == 2
+
+
+@pytest.mark.parametrize(
+    "kwargs, match",
+    [
+        ({"max_bytes": 0}, "max_bytes"),
+        ({"max_item_bytes": -1}, "max_item_bytes"),
+    ],
+)
+def test_invalid_settings_raise(kwargs, match):
+    with pytest.raises(ValueError, match=match):
+        AttachmentCache(**kwargs)
@@ -0,0 +1,114 @@
+import gzip
+
+import pytest
+from httpx import AsyncClient, MockTransport, Request, Response
+from opentelemetry import trace
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import (
+    InMemorySpanExporter,
+)
+
+from async_sendgrid.compression import CompressionTransport
+from async_sendgrid.pool import ConnectionPool
+
+BODY = (
+    b'{"content":[{"type":"text/html","value":"' + b"<p>Hi</p>" * 500 + b'"}]}'
+)
+
+
+def _client(requests: list[Request], **kwargs) -> AsyncClient:
+    def handler(request: Request) -> Response:
+        requests.append(request)
+        return Response(202)
+
+    return AsyncClient(
+        transport=CompressionTransport(MockTransport(handler), **kwargs)
+    )
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("offload_threshold", [1, 1 << 30])
+async def test_large_bodies_are_gzipped(offload_threshold):
+    """Test that bodies above the threshold are gzipped, inline or not."""
+    requests: list[Request] = []
+    client = _client(
+        requests, threshold=1024, offload_threshold=offload_threshold
+    )
+
+    await client.post("https://example.com", content=BODY)
+
+    request = requests[0]
+    assert request.headers["Content-Encoding"] == "gzip"
+    assert int(request.headers["Content-Length"]) == len(request.content)
+    assert len(request.content) < len(BODY)
+    assert gzip.decompress(request.content) == BODY
+
+
+@pytest.mark.asyncio
+async def test_small_bodies_are_sent_as_is():
+    requests: list[Request] = []
+    client = _client(requests, threshold=len(BODY) + 1)
+
+    await client.post("https://example.com", content=BODY)
+
+    assert "Content-Encoding" not in requests[0].headers
+    assert requests[0].content == BODY
+
+
+@pytest.mark.asyncio
+async def test_streamed_bodies_are_sent_as_is():
+    requests: list[Request] = []
+    client = _client(requests, threshold=0)
+
+    async def stream():
+        yield BODY
+
+    await client.post("https://example.com", content=stream())
+
+    assert "Content-Encoding" not in requests[0].headers
+
+
+@pytest.mark.asyncio
+async def test_compression_is_recorded_on_the_current_span(
+    provider: TracerProvider,
+):
+    """Test that the ratio and CPU time are set on the active span."""
+    exporter = InMemorySpanExporter()
+    provider.add_span_processor(SimpleSpanProcessor(exporter))
+    client = _client([], threshold=1024)
+
+    with trace.get_tracer(__name__).start_as_current_span("send"):
+        await client.post("https://example.com", content=BODY)
+
+    attributes = exporter.get_finished_spans()[-1].attributes
+    assert attributes["http.request.body.size"] == len(BODY)
+    assert attributes["sendgrid.compression.ratio"] > 1
+    assert attributes["sendgrid.compression.cpu_time_ms"] >= 0
+
+
+def test_pool_compresses_when_enabled():
+    pool = ConnectionPool(compress=True)
+    client = pool._create_client({})
+    assert pool.compress is True
+    assert isinstance(client._transport, CompressionTransport)
+
+
+def test_pool_does_not_compress_by_default():
+    pool = ConnectionPool()
+    client = pool._create_client({})
+    assert pool.compress is False
+    assert not isinstance(client._transport, CompressionTransport)
+
+
+@pytest.mark.parametrize(
+    "kwargs, match",
+    [
+        ({"compress_threshold": -1}, "compress_threshold"),
+        ({"compress_level": 0}, "compress_level"),
+        ({"compress_level": 10}, "compress_level"),
+    ],
+)
+def test_pool_invalid_compression_settings_raise(kwargs, match):
+    with pytest.raises(ValueError, match=match):
+        ConnectionPool(**kwargs)
@@ -0,0 +1,199 @@
+import asyncio
+
+import pytest
+from httpx import MockTransport, ReadTimeout, Request, Response
+
+from async_sendgrid.concurrency import (
+    AdaptiveConcurrencyLimiter,
+    AdaptiveConcurrencyTransport,
+    StreamLimitTransport,
+)
+from async_sendgrid.pool import ConnectionPool
+
+
+async def _complete(
+    limiter: AdaptiveConcurrencyLimiter,
+    count: int,
+    latency: float = 0.01,
+    overloaded: bool = False,
+) -> None:
+    for _ in range(count):
+        sequence = await limiter.acquire()
+        limiter.release(sequence, latency, overloaded)
+
+
+@pytest.mark.asyncio
+async def test_limit_starts_at_the_ceiling_and_is_cut_on_overload():
+    """Test that an overloaded response halves the limit."""
+    limiter = AdaptiveConcurrencyLimiter(max_limit=16, min_limit=2)
+    assert limiter.limit == 16
+
+    await _complete(limiter, 1, overloaded=True)
+    assert limiter.limit == 8
+
+
+@pytest.mark.asyncio
+async def test_limit_never_goes_below_the_floor():
+    """Test that the limit stays above min_limit."""
+    limiter = AdaptiveConcurrencyLimiter(max_limit=16, min_limit=3)
+    for _ in range(10):
+        await _complete(limiter, 1, overloaded=True)
+    assert limiter.limit == 3
+
+
+@pytest.mark.asyncio
+async def test_requests_started_before_a_cut_do_not_cut_again():
+    """Test that a burst of failures only cuts the limit once."""
+    limiter = AdaptiveConcurrencyLimiter(max_limit=16)
+    sequences = [await limiter.acquire() for _ in range(4)]
+
+    for sequence in sequences:
+        limiter.release(sequence, 0.01, overloaded=True)
+
+    assert limiter.limit == 8
+
+
+@pytest.mark.asyncio
+async def test_limit_grows_additively_up_to_the_ceiling():
+    """Test that each healthy round adds one slot, up to max_limit."""
+    limiter = AdaptiveConcurrencyLimiter(max_limit=6)
+    await _complete(limiter, 1, overloaded=True)
+    assert limiter.limit == 3
+
+    await _complete(limiter, 3)
+    assert limiter.limit == 4
+
+    await _complete(limiter, 100)
+    assert limiter.limit == 6
+
+
+@pytest.mark.asyncio
+async def test_slow_rounds_cut_the_limit():
+    """Test that a p95 latency above target cuts the limit."""
+    limiter = AdaptiveConcurrencyLimiter(max_limit=4, latency_target=0.1)
+    await _complete(limiter, 4, latency=0.5)
+    assert limiter.limit == 2
+
+
+@pytest.mark.asyncio
+async def test_in_flight_requests_never_exceed_the_limit():
+    """Test that requests wait for a free slot."""
+    limiter = AdaptiveConcurrencyLimiter(max_limit=3)
+    state = {"peak": 0}
+
+    async def request():
+        sequence = await limiter.acquire()
+        state["peak"] = max(state["peak"], limiter.in_flight)
+        await asyncio.sleep(0.001)
+        limiter.release(sequence, 0.001, overloaded=False)
+
+    await asyncio.gather(*(request() for _ in range(20)))
+
+    assert state["peak"] == 3
+    assert limiter.in_flight == 0
+
+
+@pytest.mark.asyncio
+async def test_cancelled_waiters_release_their_slot():
+    """Test that a cancelled waiter does not leak a slot."""
+    limiter = AdaptiveConcurrencyLimiter(max_limit=1)
+    sequence = await limiter.acquire()
+
+    waiter = asyncio.ensure_future(limiter.acquire())
+    await asyncio.sleep(0)
+    waiter.cancel()
+    limiter.release(sequence, 0.01, overloaded=False)
+
+    with pytest.raises(asyncio.CancelledError):
+        await waiter
+    assert limiter.in_flight == 0
+
+
+@pytest.mark.parametrize(
+    "kwargs, match",
+    [
+        ({"max_limit": 4, "min_limit": 0}, "min_concurrency"),
+        ({"max_limit": 2, "min_limit": 3}, "max_concurrency"),
+        ({"max_limit": None}, "max_concurrency"),
+        ({"max_limit": 4, "latency_target": 0}, "latency_target"),
+        ({"max_limit": 4, "decrease_factor": 1}, "decrease_factor"),
+    ],
+)
+def test_invalid_settings_raise(kwargs, match):
+    with pytest.raises(ValueError, match=match):
+        AdaptiveConcurrencyLimiter(**kwargs)
+
+
+@pytest.mark.parametrize(
+    "outcome, expected_limit",
+    [
+        (Response(202), 4),
+        (Response(400), 4),
+        (Response(429), 2),
+        (Response(503), 2),
+        (ReadTimeout("timeout"), 2),
+    ],
+)
+@pytest.mark.asyncio
+async def test_transport_reports_outcomes(outcome, expected_limit):
+    """Test that 429, 5xx and timeouts count as overload."""
+
+    def handler(request: Request) -> Response:
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    limiter = AdaptiveConcurrencyLimiter(max_limit=4)
+    transport = AdaptiveConcurrencyTransport(MockTransport(handler), limiter)
+
+    try:
+        await transport.handle_async_request(
+            Request("POST", "https://example.com")
+        )
+    except ReadTimeout:
+        pass
+
+    assert limiter.limit == expected_limit
+    assert limiter.in_flight == 0
+
+
+def test_pool_concurrency_limit():
+    """Test that the pool exposes the current concurrency limit."""
+    pool = ConnectionPool(max_connections=8)
+    assert pool.concurrency_limiter is None
+    assert pool.concurrency_limit == 8
+
+    pool = ConnectionPool(
+        max_connections=8, adaptive_concurrency=True, max_concurrency=6
+    )
+    client = pool._create_client({"Authorization": "Bearer test"})
+
+    assert pool.concurrency_limit == 6
+    assert isinstance(
+        client._transport._async_transport, AdaptiveConcurrencyTransport
+    )
+
+
+@pytest.mark.asyncio
+async def test_stream_slot_is_held_until_the_body_is_read():
+    """Test that a stream is only freed once its response is consumed."""
+
+    async def body():
+        yield b"{}"
+
+    transport = StreamLimitTransport(
+        MockTransport(lambda request: Response(202, content=body())), 1
+    )
+    first = await transport.handle_async_request(
+        Request("POST", "https://example.com")
+    )
+    second = asyncio.ensure_future(
+        transport.handle_async_request(Request("POST", "https://example.com"))
+    )
+    await asyncio.sleep(0.01)
+    assert not second.done()
+
+    await first.aread()
+    response = await asyncio.wait_for(second, timeout=1)
+    await response.aclose()
+    assert transport._semaphore._value == 1
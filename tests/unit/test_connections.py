@@ -0,0 +1,299 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from httpx import MockTransport, Response
+from opentelemetry import trace
+from opentelemetry.sdk.metrics import MeterProvider
+from opentelemetry.sdk.metrics.export import InMemoryMetricReader
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import (
+    InMemorySpanExporter,
+)
+from sendgrid.helpers.mail import Mail  # type: ignore
+
+from async_sendgrid import metrics
+from async_sendgrid.connections import EMPTY_STATS, PoolStats
+from async_sendgrid.metrics import SendMetrics
+from async_sendgrid.pool import ConnectionPool
+from async_sendgrid.sendgrid import SendgridAPI
+from benchmarks.server import _ACCEPTED, FakeSendGrid
+
+HEADERS = {"Authorization": "Bearer test"}
+_UNAVAILABLE = b"HTTP/1.1 503 Service Unavailable\r\nContent-Length: 0\r\n\r\n"
+
+
+@pytest.fixture
+def exporter(provider: TracerProvider) -> InMemorySpanExporter:
+    exporter = InMemorySpanExporter()
+    provider.add_span_processor(SimpleSpanProcessor(exporter))
+    return exporter
+
+
+@pytest.fixture
+def reader(monkeypatch) -> InMemoryMetricReader:
+    reader = InMemoryMetricReader()
+    instruments = SendMetrics(MeterProvider(metric_readers=[reader]))
+    monkeypatch.setattr(metrics, "_instruments", instruments)
+    return reader
+
+
+def _collect(reader: InMemoryMetricReader) -> dict:
+    data = reader.get_metrics_data()
+    return {
+        metric.name: list(metric.data.data_points)
+        for resource in data.resource_metrics
+        for scope in resource.scope_metrics
+        for metric in scope.metrics
+    }
+
+
+@pytest.mark.asyncio
+async def test_stats_report_queued_requests_and_waits():
+    async with FakeSendGrid(latency=0.05) as server:
+        pool = ConnectionPool(max_connections=1, max_keepalive_connections=1)
+        client = pool._create_client(HEADERS)
+
+        sends = [
+            asyncio.create_task(client.post(server.url, content=b"{}"))
+            for _ in range(3)
+        ]
+        await asyncio.sleep(0.02)
+        in_flight = pool.stats()
+        await asyncio.gather(*sends)
+        stats = pool.stats()
+        await pool.shutdown()
+
+    assert in_flight.connections == 1
+    assert in_flight.active == 1
+    assert in_flight.queued == 2
+
+    assert stats.connections == 1
+    assert stats.idle == 1
+    assert stats.queued == 0
+    assert stats.opened == 1
+    assert stats.closed == 0
+    assert stats.tls_handshakes == 0
+    assert stats.waits == 3
+    # The last request waited for the two others.
+    assert stats.max_wait >= 0.09
+    assert 0 < stats.mean_wait < stats.max_wait
+
+
+@pytest.mark.asyncio
+async def test_stats_count_closed_connections():
+    async with FakeSendGrid() as server:
+        pool = ConnectionPool(max_connections=2, max_keepalive_connections=2)
+        client = pool._create_client(HEADERS)
+        await asyncio.gather(
+            *(client.post(server.url, content=b"{}") for _ in range(2))
+        )
+        await pool.shutdown()
+
+    stats = pool.stats()
+    assert stats.opened == 2
+    assert stats.closed == 2
+    assert stats.connections == 0
+
+
+@pytest.mark.asyncio
+async def test_trace_extension_of_the_request_is_kept():
+    events: list[str] = []
+
+    async def trace(event: str, info: dict) -> None:
+        events.append(event)
+
+    async with FakeSendGrid() as server:
+        pool = ConnectionPool()
+        client = pool._create_client(HEADERS)
+        response = await client.post(
+            server.url, content=b"{}", extensions={"trace": trace}
+        )
+        await pool.shutdown()
+
+    assert "connection.connect_tcp.complete" in events
+    assert response.request.extensions["trace"] is trace
+    assert pool.stats().opened == 1
+
+
+@pytest.mark.asyncio
+async def test_stats_do_not_need_the_private_queue(monkeypatch):
+    """Test that stats only rely on the public API of the pool."""
+    async with FakeSendGrid() as server:
+        pool = ConnectionPool()
+        client = pool._create_client(HEADERS)
+        await client.post(server.url, content=b"{}")
+        connections = pool._http_transport._pool.connections
+        monkeypatch.setattr(
+            pool._http_transport,
+            "_pool",
+            SimpleNamespace(connections=connections),
+        )
+        stats = pool.stats()
+        monkeypatch.undo()
+        await pool.shutdown()
+
+    assert stats.connections == 1
+    assert stats.idle == 1
+    assert stats.queued == 0
+    assert stats.opened == 1
+    assert stats.closed == 0
+
+
+def test_stats_are_empty_with_a_custom_transport():
+    pool = ConnectionPool(transport=MockTransport(lambda r: Response(202)))
+    pool._create_client(HEADERS)
+    assert pool.stats() == EMPTY_STATS
+    assert ConnectionPool().stats() == EMPTY_STATS
+    assert PoolStats(*EMPTY_STATS).mean_wait == 0.0
+
+
+@pytest.mark.asyncio
+async def test_pool_metrics_are_observed(reader):
+    async with FakeSendGrid() as server:
+        pool = ConnectionPool(metrics=True)
+        client = pool._create_client(HEADERS)
+        await client.post(server.url, content=b"{}")
+        points = _collect(reader)
+        await pool.shutdown()
+
+    connections = {
+        point.attributes["http.connection.state"]: point.value
+        for point in points["http.client.open_connections"]
+    }
+    assert connections == {"active": 0, "idle": 1}
+    assert points["sendgrid.pool.connections.opened"][0].value == 1
+    assert points["sendgrid.pool.connections.closed"][0].value == 0
+    assert points["sendgrid.pool.queued_requests"][0].value == 0
+    assert points["sendgrid.pool.wait.duration"][0].count == 1
+
+
+@pytest.mark.asyncio
+async def test_phases_are_recorded_on_the_current_span(exporter):
+    async with FakeSendGrid(latency=0.02) as server:
+        pool = ConnectionPool()
+        client = pool._create_client(HEADERS)
+        with trace.get_tracer(__name__).start_as_current_span("send"):
+            await client.post(server.url, content=b"{}")
+        await pool.shutdown()
+
+    span = exporter.get_finished_spans()[-1]
+    attributes = span.attributes
+    assert attributes["sendgrid.attempts"] == 1
+    assert attributes["sendgrid.phase.server_ms"] >= 20
+    for phase in ("pool_wait", "connect", "write"):
+        assert attributes[f"sendgrid.phase.{phase}_ms"] >= 0
+    assert "sendgrid.phase.tls_ms" not in attributes
+    assert "sendgrid.phase.retry_wait_ms" not in attributes
+    assert not span.events
+
+
+@pytest.mark.asyncio
+async def test_phases_add_up_across_retries(exporter):
+    async with FakeSendGrid() as server:
+        responses = [_UNAVAILABLE, _ACCEPTED]
+        server._response = lambda: responses.pop(0)  # type: ignore
+        pool = ConnectionPool(backoff_factor=0.01, backoff_jitter=0.0)
+        client = pool._create_client(HEADERS)
+        with trace.get_tracer(__name__).start_as_current_span("send"):
+            response = await client.post(server.url, content=b"{}")
+        await pool.shutdown()
+
+    assert response.status_code == 202
+    span = exporter.get_finished_spans()[-1]
+    events = list(span.events)
+    assert [event.name for event in events] == ["sendgrid.attempt"] * 2
+    assert "sendgrid.phase.retry_wait_ms" not in events[0].attributes
+    assert events[1].attributes["sendgrid.phase.retry_wait_ms"] > 0
+    assert span.attributes["sendgrid.attempts"] == 2
+    assert span.attributes["sendgrid.phase.server_ms"] == pytest.approx(
+        sum(event.attributes["sendgrid.phase.server_ms"] for event in events)
+    )
+
+
+@pytest.mark.asyncio
+async def test_send_records_serialization_and_phase_metrics(exporter, reader):
+    async with FakeSendGrid() as server:
+        pool = ConnectionPool(metrics=True)
+        sendgrid = SendgridAPI(
+            api_key="SG.test", endpoint=server.url, pool=pool
+        )
+        response = await sendgrid.send(
+            Mail(
+                from_email="sender@example.com",
+                to_emails="user@example.com",
+                subject="Hello",
+                plain_text_content="Hello",
+            )
+        )
+        points = _collect(reader)
+        await pool.shutdown()
+
+    assert response.status_code == 202
+    span = exporter.get_finished_spans()[-1]
+    assert span.attributes["sendgrid.phase.serialize_ms"] > 0
+    assert span.attributes["sendgrid.phase.server_ms"] > 0
+
+    phases = {
+        point.attributes["sendgrid.phase"]
+        for point in points["sendgrid.phase.duration"]
+    }
+    assert phases == {"serialize", "pool_wait", "connect", "write", "server"}
+
+
+@pytest.mark.asyncio
+async def test_limit_waits_have_their_own_phase(reader):
+    async with FakeSendGrid(latency=0.05) as server:
+        pool = ConnectionPool(
+            metrics=True, adaptive_concurrency=True, max_concurrency=1
+        )
+        client = pool._create_client(HEADERS)
+        await asyncio.gather(
+            *(client.post(server.url, content=b"{}") for _ in range(2))
+        )
+        points = _collect(reader)
+        await pool.shutdown()
+
+    phases = {
+        point.attributes["sendgrid.phase"]: point
+        for point in points["sendgrid.phase.duration"]
+    }
+    assert phases["limit_wait"].count == 2
+    # The second request waited for the first one to complete.
+    assert phases["limit_wait"].max >= 0.04
+    assert phases["pool_wait"].max < phases["limit_wait"].max
+
+
+@pytest.mark.asyncio
+async def test_coalesced_sends_record_serialization(reader):
+    async with FakeSendGrid() as server:
+        pool = ConnectionPool(metrics=True)
+        sendgrid = SendgridAPI(
+            api_key="SG.test",
+            endpoint=server.url,
+            pool=pool,
+            coalesce_window=0.01,
+        )
+        await asyncio.gather(
+            *(
+                sendgrid.send(
+                    Mail(
+                        from_email="sender@example.com",
+                        to_emails=f"user{i}@example.com",
+                        subject="Hello",
+                        plain_text_content="Hello",
+                    )
+                )
+                for i in range(3)
+            )
+        )
+        points = _collect(reader)
+        await pool.shutdown()
+
+    phases = {
+        point.attributes["sendgrid.phase"]: point
+        for point in points["sendgrid.phase.duration"]
+    }
+    # The three messages were encoded once, as one request.
+    assert phases["serialize"].count == 1
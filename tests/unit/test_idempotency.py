@@ -0,0 +1,272 @@
+import asyncio
+
+import pytest
+from httpx import ConnectError, MockTransport, ReadTimeout, Request, Response
+
+from async_sendgrid.idempotency import (
+    REPLAYED,
+    MemoryDedupeStore,
+    SentMessage,
+    SQLiteDedupeStore,
+)
+from async_sendgrid.pool import ConnectionPool
+from async_sendgrid.sendgrid import SendgridAPI
+
+
+def _accept(calls: list[Request]):
+    def handler(request: Request) -> Response:
+        calls.append(request)
+        return Response(202, headers={"X-Message-Id": f"id-{len(calls)}"})
+
+    return handler
+
+
+@pytest.mark.asyncio
+async def test_duplicate_content_is_not_sent_twice(make_mail, mock_client):
+    """Test that the same message is answered from the store."""
+    calls: list[Request] = []
+    client = mock_client(
+        _accept(calls), dedupe_store=MemoryDedupeStore(), dedupe_content=True
+    )
+
+    first = await client.send(make_mail())
+    second = await client.send(make_mail())
+    other = await client.send(make_mail("other@example.com"))
+
+    assert len(calls) == 2
+    assert first.extensions.get(REPLAYED) is None
+    assert second.extensions[REPLAYED] is True
+    assert second.status_code == 202
+    assert second.headers["X-Message-Id"] == "id-1"
+    assert other.headers["X-Message-Id"] == "id-2"
+
+
+@pytest.mark.asyncio
+async def test_messages_without_a_key_are_always_sent(make_mail, mock_client):
+    """Test that content keys are only derived when opted into."""
+    calls: list[Request] = []
+    client = mock_client(_accept(calls), dedupe_store=MemoryDedupeStore())
+
+    await client.send(make_mail())
+    await client.send(make_mail())
+
+    assert len(calls) == 2
+
+
+@pytest.mark.asyncio
+async def test_caller_supplied_keys(make_mail, mock_client):
+    """Test that explicit keys take precedence over the content."""
+    calls: list[Request] = []
+    client = mock_client(_accept(calls), dedupe_store=MemoryDedupeStore())
+
+    await client.send(make_mail(), idempotency_key="order-1")
+    await client.send(
+        make_mail("other@example.com"), idempotency_key="order-1"
+    )
+    await client.send(make_mail(), idempotency_key="order-2")
+
+    assert len(calls) == 2
+
+
+@pytest.mark.asyncio
+async def test_concurrent_duplicates_share_one_request(make_mail, mock_client):
+    """Test that duplicates sent concurrently share a single request."""
+    calls: list[Request] = []
+
+    async def handler(request: Request) -> Response:
+        calls.append(request)
+        await asyncio.sleep(0.05)
+        return Response(202)
+
+    client = mock_client(
+        handler, dedupe_store=MemoryDedupeStore(), dedupe_content=True
+    )
+    responses = await asyncio.gather(
+        *(client.send(make_mail()) for _ in range(5))
+    )
+
+    assert len(calls) == 1
+    assert all(response.status_code == 202 for response in responses)
+
+
+@pytest.mark.asyncio
+async def test_duplicate_is_sent_when_the_first_send_is_cancelled(
+    make_mail, mock_client
+):
+    """Test that cancelling the first caller does not cancel the others."""
+    calls: list[Request] = []
+
+    async def handler(request: Request) -> Response:
+        calls.append(request)
+        await asyncio.sleep(0.05)
+        return Response(202)
+
+    client = mock_client(
+        handler, dedupe_store=MemoryDedupeStore(), dedupe_content=True
+    )
+    first = asyncio.ensure_future(client.send(make_mail()))
+    await asyncio.sleep(0.01)
+    second = asyncio.ensure_future(client.send(make_mail()))
+    await asyncio.sleep(0.01)
+    first.cancel()
+
+    assert (await second).status_code == 202
+    assert len(calls) == 2
+
+
+@pytest.mark.asyncio
+async def test_failed_sends_are_not_remembered(make_mail, mock_client):
+    """Test that a message which failed can be sent again."""
+    statuses = iter([500, 202])
+    calls: list[Request] = []
+
+    def handler(request: Request) -> Response:
+        calls.append(request)
+        return Response(next(statuses))
+
+    client = mock_client(
+        handler, dedupe_store=MemoryDedupeStore(), dedupe_content=True
+    )
+
+    assert (await client.send(make_mail())).status_code == 500
+    assert (await client.send(make_mail())).status_code == 202
+    assert len(calls) == 2
+
+
+@pytest.mark.asyncio
+async def test_ambiguous_failures_are_not_retried(make_mail):
+    """Test that a send which may have been delivered is not sent again."""
+    calls: list[Request] = []
+
+    def handler(request: Request) -> Response:
+        calls.append(request)
+        if len(calls) == 1:
+            raise ReadTimeout("timeout", request=request)
+        return Response(202)
+
+    pool = ConnectionPool(transport=MockTransport(handler), backoff_factor=0)
+    client = SendgridAPI(
+        api_key="SECRET_KEY", pool=pool, dedupe_store=MemoryDedupeStore()
+    )
+
+    with pytest.raises(ReadTimeout):
+        await client.send(make_mail(), idempotency_key="order-1")
+    assert len(calls) == 1
+
+    # Without a key, the send is not deduplicated and is retried.
+    calls.clear()
+    assert (await client.send(make_mail())).status_code == 202
+    assert len(calls) == 2
+
+
+@pytest.mark.asyncio
+async def test_connection_failures_are_retried(make_mail):
+    """Test that a send which never reached the server is retried."""
+    calls: list[Request] = []
+
+    def handler(request: Request) -> Response:
+        calls.append(request)
+        if len(calls) == 1:
+            raise ConnectError("refused", request=request)
+        return Response(202)
+
+    pool = ConnectionPool(transport=MockTransport(handler), backoff_factor=0)
+    client = SendgridAPI(
+        api_key="SECRET_KEY", pool=pool, dedupe_store=MemoryDedupeStore()
+    )
+
+    response = await client.send(make_mail(), idempotency_key="order-1")
+
+    assert response.status_code == 202
+    assert len(calls) == 2
+
+
+@pytest.mark.asyncio
+async def test_suppressed_sends_are_logged(
+    make_mail, mock_client, caplog: pytest.LogCaptureFixture
+):
+    """Test that each suppressed send is logged."""
+    calls: list[Request] = []
+    client = mock_client(_accept(calls), dedupe_store=MemoryDedupeStore())
+
+    with caplog.at_level("INFO", logger="async_sendgrid.idempotency"):
+        await client.send(make_mail(), idempotency_key="order-1")
+        await client.send(make_mail(), idempotency_key="order-1")
+
+    assert len(calls) == 1
+    assert caplog.text.count("Suppressed a duplicate send") == 1
+
+
+@pytest.mark.asyncio
+async def test_idempotency_key_requires_a_store(make_mail):
+    client = SendgridAPI(api_key="SECRET_KEY")
+    with pytest.raises(ValueError, match="dedupe_store"):
+        await client.send(make_mail(), idempotency_key="order-1")
+
+
+def test_dedupe_content_requires_a_store():
+    with pytest.raises(ValueError, match="dedupe_store"):
+        SendgridAPI(api_key="SECRET_KEY", dedupe_content=True)
+
+
+@pytest.mark.asyncio
+async def test_memory_store_expires_and_evicts_keys():
+    """Test the TTL and the LRU bound of the in-memory store."""
+    store = MemoryDedupeStore(ttl=0.05, max_size=2)
+    for key in ("a", "b", "c"):
+        await store.put(key, SentMessage(202))
+
+    assert len(store) == 2
+    assert await store.get("a") is None
+    assert await store.get("c") == SentMessage(202)
+
+    await asyncio.sleep(0.06)
+    assert await store.get("c") is None
+
+
+@pytest.mark.asyncio
+async def test_sqlite_store_survives_restarts(
+    make_mail, mock_client, tmp_path
+):
+    """Test that keys stored on disk suppress duplicates after a restart."""
+    path = str(tmp_path / "dedupe.db")
+    calls: list[Request] = []
+
+    store = SQLiteDedupeStore(path)
+    await mock_client(
+        _accept(calls), dedupe_store=store, dedupe_content=True
+    ).send(make_mail())
+    await store.close()
+
+    store = SQLiteDedupeStore(path)
+    response = await mock_client(
+        _accept(calls), dedupe_store=store, dedupe_content=True
+    ).send(make_mail())
+    await store.close()
+
+    assert len(calls) == 1
+    assert response.extensions[REPLAYED] is True
+    assert response.headers["X-Message-Id"] == "id-1"
+
+
+@pytest.mark.asyncio
+async def test_sqlite_store_expires_keys(tmp_path):
+    store = SQLiteDedupeStore(str(tmp_path / "dedupe.db"), ttl=0.05)
+    await store.put("a", SentMessage(202, "id"))
+    assert await store.get("a") == SentMessage(202, "id")
+
+    await asyncio.sleep(0.06)
+    assert await store.get("a") is None
+    await store.close()
+
+
+@pytest.mark.parametrize(
+    "kwargs, match",
+    [
+        ({"ttl": 0}, "ttl"),
+        ({"max_size": 0}, "max_size"),
+    ],
+)
+def test_invalid_store_settings_raise(kwargs, match):
+    with pytest.raises(ValueError, match=match):
+        MemoryDedupeStore(**kwargs)
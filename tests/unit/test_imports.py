@@ -0,0 +1,52 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+
+def _import(code: str, **env: str) -> set[str]:
+    """Run code in a fresh interpreter and return the modules loaded."""
+    result = subprocess.run(
+        [sys.executable, "-c", f"{code}\nimport sys\nprint(*sys.modules)"],
+        capture_output=True,
+        text=True,
+        check=True,
+        env={**os.environ, **env},
+    )
+    return set(result.stdout.split())
+
+
+def test_package_import_is_lazy():
+    modules = _import("import async_sendgrid")
+
+    assert not [
+        name
+        for name in modules
+        if name.split(".")[0]
+        in ("httpx", "httpx_retries", "opentelemetry", "orjson", "sendgrid")
+        or name == "importlib.metadata"
+    ]
+
+
+@pytest.mark.parametrize("enabled", ["true", "false"])
+def test_client_import_does_not_load_optional_dependencies(enabled):
+    modules = _import(
+        "from async_sendgrid import SendgridAPI",
+        SENDGRID_TELEMETRY_IS_ENABLED=enabled,
+    )
+
+    assert "async_sendgrid.sendgrid" in modules
+    for name in ("opentelemetry.sdk", "sendgrid", "httpx_retries"):
+        assert name not in modules
+
+
+def test_public_names_resolve_on_access():
+    import async_sendgrid
+
+    assert async_sendgrid.SendgridAPI.__name__ == "SendgridAPI"
+    assert async_sendgrid.ConnectionPool.__name__ == "ConnectionPool"
+    assert async_sendgrid.__version__
+    assert "SendgridAPI" in dir(async_sendgrid)
+    with pytest.raises(AttributeError):
+        async_sendgrid.missing
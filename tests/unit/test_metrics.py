@@ -0,0 +1,176 @@
+import pytest
+from httpx import ConnectError, MockTransport, Request, Response
+from httpx_retries import RetryTransport
+from opentelemetry.sdk.metrics import MeterProvider
+from opentelemetry.sdk.metrics.export import InMemoryMetricReader
+
+from async_sendgrid import metrics
+from async_sendgrid.metrics import (
+    AttemptMetricsTransport,
+    MetricsTransport,
+    SendMetrics,
+    get_metrics,
+)
+from async_sendgrid.idempotency import MemoryDedupeStore
+from async_sendgrid.pool import ConnectionPool
+from async_sendgrid.sendgrid import SendgridAPI
+
+HEADERS = {"Authorization": "Bearer test"}
+URL = "https://api.sendgrid.com/v3/mail/send"
+
+
+@pytest.fixture
+def reader(monkeypatch) -> InMemoryMetricReader:
+    reader = InMemoryMetricReader()
+    instruments = SendMetrics(MeterProvider(metric_readers=[reader]))
+    monkeypatch.setattr(metrics, "_instruments", instruments)
+    return reader
+
+
+def _collect(reader: InMemoryMetricReader) -> dict:
+    data = reader.get_metrics_data()
+    return {
+        metric.name: list(metric.data.data_points)
+        for resource in data.resource_metrics
+        for scope in resource.scope_metrics
+        for metric in scope.metrics
+    }
+
+
+def _pool(statuses: list[int], **kwargs) -> ConnectionPool:
+    def handler(request: Request) -> Response:
+        return Response(statuses.pop(0))
+
+    return ConnectionPool(
+        metrics=True,
+        backoff_factor=0.0,
+        transport=MockTransport(handler),
+        **kwargs,
+    )
+
+
+@pytest.mark.asyncio
+async def test_successful_request_is_recorded(reader):
+    client = _pool([202])._create_client(HEADERS)
+
+    await client.post(URL, content=b"x" * 100)
+
+    points = _collect(reader)
+    (duration,) = points["sendgrid.request.duration"]
+    assert duration.count == 1
+    assert duration.attributes == {"http.response.status_class": "2xx"}
+    (size,) = points["sendgrid.request.body.size"]
+    assert size.sum == 100
+    (responses,) = points["sendgrid.responses"]
+    assert responses.value == 1
+    (in_flight,) = points["sendgrid.requests.in_flight"]
+    assert in_flight.value == 0
+    assert "sendgrid.retries" not in points
+    assert "sendgrid.throttled" not in points
+
+
+@pytest.mark.asyncio
+async def test_retries_and_throttling_are_counted(reader):
+    client = _pool([429, 503, 202])._create_client(HEADERS)
+
+    response = await client.post(URL, content=b"{}")
+
+    assert response.status_code == 202
+    points = _collect(reader)
+    assert points["sendgrid.retries"][0].value == 2
+    assert points["sendgrid.throttled"][0].value == 1
+    assert points["http.client.request.body.size"][0].count == 3
+    # The request is measured once, whatever the number of attempts.
+    assert points["sendgrid.request.duration"][0].count == 1
+
+
+@pytest.mark.asyncio
+async def test_status_classes_are_split(reader):
+    client = _pool([202, 400, 400], retry_attempts=0)._create_client(HEADERS)
+
+    for _ in range(3):
+        await client.post(URL, content=b"{}")
+
+    responses = {
+        point.attributes["http.response.status_class"]: point.value
+        for point in _collect(reader)["sendgrid.responses"]
+    }
+    assert responses == {"2xx": 1, "4xx": 2}
+
+
+@pytest.mark.asyncio
+async def test_transport_errors_are_recorded(reader):
+    def handler(request: Request) -> Response:
+        raise ConnectError("refused", request=request)
+
+    pool = ConnectionPool(
+        metrics=True, retry_attempts=0, transport=MockTransport(handler)
+    )
+    client = pool._create_client(HEADERS)
+
+    with pytest.raises(ConnectError):
+        await client.post(URL, content=b"{}")
+
+    points = _collect(reader)
+    (responses,) = points["sendgrid.responses"]
+    assert responses.attributes == {"http.response.status_class": "error"}
+    assert points["sendgrid.requests.in_flight"][0].value == 0
+
+
+def test_instruments_are_created_once(monkeypatch):
+    monkeypatch.setattr(metrics, "_instruments", None)
+    instruments = get_metrics()
+
+    first = MetricsTransport(MockTransport(lambda request: Response(202)))
+    second = AttemptMetricsTransport(first)
+
+    assert get_metrics() is instruments
+    assert first._metrics is instruments
+    assert second._metrics is instruments
+
+
+def test_pool_records_metrics_only_when_enabled():
+    pool = ConnectionPool()
+    client = pool._create_client(HEADERS)
+    assert pool.metrics is False
+    assert isinstance(client._transport, RetryTransport)
+
+    pool = ConnectionPool(metrics=True)
+    client = pool._create_client(HEADERS)
+    assert pool.metrics is True
+    assert isinstance(client._transport, MetricsTransport)
+    assert isinstance(
+        client._transport._transport._async_transport,
+        AttemptMetricsTransport,
+    )
+
+
+@pytest.mark.asyncio
+async def test_suppressed_sends_are_counted(reader, make_mail):
+    client = SendgridAPI(
+        api_key="SECRET_KEY",
+        pool=_pool([202]),
+        dedupe_store=MemoryDedupeStore(),
+    )
+
+    for _ in range(3):
+        await client.send(make_mail(), idempotency_key="order-1")
+
+    (suppressed,) = _collect(reader)["sendgrid.dedupe.suppressed"]
+    assert suppressed.value == 2
+
+
+@pytest.mark.asyncio
+async def test_compression_is_recorded(reader):
+    client = _pool([202], compress=True)._create_client(HEADERS)
+
+    await client.post(URL, content=b"x" * 10_000)
+
+    points = _collect(reader)
+    (ratio,) = points["sendgrid.compression.ratio"]
+    assert ratio.count == 1
+    assert ratio.sum > 1
+    (cpu_time,) = points["sendgrid.compression.cpu_time"]
+    assert cpu_time.count == 1
+    (size,) = points["sendgrid.request.body.size"]
+    assert size.sum == 10_000
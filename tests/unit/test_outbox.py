@@ -0,0 +1,223 @@
+import asyncio
+import json
+import sqlite3
+
+import pytest
+from httpx import ConnectError, Request, Response
+
+from async_sendgrid.exception import SessionClosedException
+from async_sendgrid.outbox import Outbox
+from async_sendgrid.sendgrid import SendgridAPI
+
+
+def _recipient(request: Request) -> str:
+    body = json.loads(request.content)
+    return body["personalizations"][0]["to"][0]["email"]
+
+
+@pytest.fixture
+def path(tmp_path) -> str:
+    return str(tmp_path / "outbox.db")
+
+
+@pytest.mark.asyncio
+async def test_enqueued_messages_are_sent_and_removed(
+    make_mail, mock_client, path: str
+):
+    """Test that stored messages are sent then deleted."""
+    sent: list[str] = []
+
+    def handler(request: Request) -> Response:
+        sent.append(_recipient(request))
+        return Response(202)
+
+    async with Outbox(mock_client(handler), path, workers=3) as outbox:
+        ids = await asyncio.gather(
+            *(
+                outbox.enqueue(make_mail(f"user{i}@example.com"))
+                for i in range(20)
+            )
+        )
+        await asyncio.wait_for(outbox.join(), timeout=5)
+
+        assert await outbox.pending() == 0
+        assert await outbox.failed() == 0
+
+    assert sorted(ids) == list(range(1, 21))
+    assert sorted(sent) == sorted(f"user{i}@example.com" for i in range(20))
+
+
+@pytest.mark.asyncio
+async def test_concurrent_enqueues_are_group_committed(
+    make_mail, mock_client, path: str
+):
+    """Test that concurrent enqueues share a single transaction."""
+    outbox = Outbox(mock_client(lambda request: Response(202)), path)
+    await outbox.start()
+    commits: list[int] = []
+    apply = outbox._apply
+
+    def counting_apply(writes):
+        commits.append(len(writes))
+        return apply(writes)
+
+    outbox._apply = counting_apply  # type: ignore[method-assign]
+    await asyncio.gather(
+        *(outbox.enqueue(make_mail(f"user{i}@example.com")) for i in range(50))
+    )
+    await outbox.stop()
+
+    assert commits[0] == 50
+
+
+@pytest.mark.asyncio
+async def test_sustained_enqueues_and_deletes_are_batched(
+    make_mail, mock_client, path: str
+):
+    """Test that a stream of enqueues and sends needs few commits."""
+    outbox = Outbox(
+        mock_client(lambda request: Response(202)), path, workers=20
+    )
+    await outbox.start()
+    commits: list[int] = []
+    apply = outbox._apply
+
+    def counting_apply(writes):
+        commits.append(len(writes))
+        return apply(writes)
+
+    outbox._apply = counting_apply  # type: ignore[method-assign]
+
+    async def produce(producer: int) -> None:
+        for i in range(10):
+            await outbox.enqueue(make_mail(f"user{producer}-{i}@example.com"))
+
+    await asyncio.gather(*(produce(producer) for producer in range(50)))
+    await outbox.join()
+    await outbox.stop()
+
+    # 500 inserts and 500 deletes.
+    assert sum(commits) == 1000
+    assert len(commits) <= 100
+
+
+@pytest.mark.asyncio
+async def test_unsent_messages_are_resumed_after_restart(
+    make_mail, mock_client, path: str
+):
+    """Test that messages left over by a previous run are sent."""
+
+    def down(request: Request) -> Response:
+        raise ConnectError("down", request=request)
+
+    async with Outbox(mock_client(down), path, backoff_factor=0.01) as outbox:
+        for i in range(3):
+            await outbox.enqueue(make_mail(f"user{i}@example.com"))
+
+    sent: list[str] = []
+
+    def up(request: Request) -> Response:
+        sent.append(_recipient(request))
+        return Response(202)
+
+    async with Outbox(mock_client(up), path, backoff_factor=0.01) as outbox:
+        await asyncio.wait_for(outbox.join(), timeout=5)
+        assert await outbox.pending() == 0
+
+    assert sorted(sent) == [f"user{i}@example.com" for i in range(3)]
+
+
+@pytest.mark.asyncio
+async def test_rejected_messages_are_marked_as_failed(
+    make_mail, mock_client, path: str
+):
+    """Test that a 4xx marks the message as failed without retrying."""
+    calls: list[Request] = []
+
+    def handler(request: Request) -> Response:
+        calls.append(request)
+        return Response(400, text="bad request")
+
+    async with Outbox(mock_client(handler), path) as outbox:
+        await outbox.enqueue(make_mail("user@example.com"))
+        await asyncio.wait_for(outbox.join(), timeout=5)
+        assert await outbox.failed() == 1
+
+    assert len(calls) == 1
+    row = sqlite3.connect(path).execute("SELECT last_error FROM outbox")
+    assert row.fetchone()[0] == "HTTP 400: bad request"
+
+
+@pytest.mark.asyncio
+async def test_transient_failures_are_retried_until_max_attempts(
+    make_mail, mock_client, path: str
+):
+    """Test that 5xx are retried, then marked as failed."""
+    calls: list[Request] = []
+
+    def handler(request: Request) -> Response:
+        calls.append(request)
+        return Response(503)
+
+    async with Outbox(
+        mock_client(handler), path, max_attempts=3, backoff_factor=0.01
+    ) as outbox:
+        await outbox.enqueue(make_mail("user@example.com"))
+        await asyncio.wait_for(outbox.join(), timeout=5)
+        assert await outbox.failed() == 1
+
+    assert len(calls) == 3
+
+
+@pytest.mark.asyncio
+async def test_dispatcher_survives_database_errors(
+    make_mail, mock_client, path: str, caplog
+):
+    """Test that a failed read is logged and the outbox keeps draining."""
+    sent: list[str] = []
+
+    def handler(request: Request) -> Response:
+        sent.append(_recipient(request))
+        return Response(202)
+
+    outbox = Outbox(mock_client(handler), path, backoff_factor=0.01)
+    fetch = outbox._fetch
+    failures = [sqlite3.OperationalError("database is locked")] * 2
+
+    def failing_fetch(now, limit):
+        if failures:
+            raise failures.pop()
+        return fetch(now, limit)
+
+    outbox._fetch = failing_fetch  # type: ignore[method-assign]
+    async with outbox:
+        await outbox.enqueue(make_mail("user@example.com"))
+        await asyncio.wait_for(outbox.join(), timeout=5)
+        assert not outbox._dispatcher.done()
+
+    assert sent == ["user@example.com"]
+    assert caplog.text.count("Failed to read the outbox") == 2
+
+
+@pytest.mark.asyncio
+async def test_enqueue_requires_a_running_outbox(
+    make_mail, mock_client, path: str
+):
+    """Test that enqueueing into a stopped outbox raises."""
+    outbox = Outbox(mock_client(lambda request: Response(202)), path)
+    with pytest.raises(SessionClosedException):
+        await outbox.enqueue(make_mail("user@example.com"))
+
+
+@pytest.mark.parametrize(
+    "kwargs, match",
+    [
+        ({"workers": 0}, "workers"),
+        ({"max_attempts": 0}, "max_attempts"),
+        ({"backoff_factor": -1}, "backoff_factor"),
+        ({"max_backoff": -1}, "max_backoff"),
+    ],
+)
+def test_invalid_settings_raise(path: str, kwargs, match):
+    with pytest.raises(ValueError, match=match):
+        Outbox(SendgridAPI(api_key="SECRET_KEY"), path, **kwargs)
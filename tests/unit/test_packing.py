@@ -0,0 +1,76 @@
+import pytest
+from sendgrid.helpers.mail import Attachment  # type: ignore
+
+from async_sendgrid.packing import (
+    MAX_PERSONALIZATIONS,
+    pack_key,
+    pack_messages,
+)
+
+
+def test_pack_key_ignores_personalizations(make_mail):
+    """Test that messages only differing by recipients share a key."""
+    first = make_mail("a@example.com").get()
+    second = make_mail("b@example.com").get()
+    assert pack_key(first) == pack_key(second)
+
+
+@pytest.mark.parametrize(
+    "field, value",
+    [("subject", "Other subject"), ("from_email", "other@example.com")],
+)
+def test_pack_key_differs_on_shared_fields(make_mail, field: str, value: str):
+    """Test that differing shared fields produce different keys."""
+    other = make_mail("b@example.com")
+    setattr(other, field, value)
+    assert pack_key(make_mail("a@example.com").get()) != pack_key(other.get())
+
+
+def test_pack_key_differs_on_attachments(make_mail):
+    """Test that attachments are part of the key."""
+    email = make_mail("b@example.com")
+    email.add_attachment(
+        Attachment(file_content="aGVsbG8=", file_name="a.txt")
+    )
+    assert pack_key(make_mail("a@example.com").get()) != pack_key(email.get())
+
+
+def test_pack_messages_merges_compatible_messages(make_mail):
+    """Test that compatible messages are merged in a single body."""
+    emails = [
+        make_mail("a@example.com"),
+        make_mail("x@example.com", subject="Other subject"),
+        make_mail("b@example.com"),
+    ]
+
+    packed = pack_messages(emails)
+
+    assert len(packed) == 2
+    assert packed[0].indexes == [0, 2]
+    assert packed[0].payload["personalizations"] == [
+        {"to": [{"email": "a@example.com"}]},
+        {"to": [{"email": "b@example.com"}]},
+    ]
+    assert packed[0].payload["subject"] == "Example email"
+    assert packed[1].indexes == [1]
+
+
+def test_pack_messages_splits_at_the_personalization_limit(make_mail):
+    """Test that a body never exceeds the personalization limit."""
+    emails = [
+        make_mail(f"user{i}@example.com")
+        for i in range(MAX_PERSONALIZATIONS + 1)
+    ]
+
+    packed = pack_messages(emails)
+
+    assert [len(p.indexes) for p in packed] == [MAX_PERSONALIZATIONS, 1]
+
+
+def test_pack_messages_keeps_duplicate_recipients_apart(make_mail):
+    """Test that a recipient is never listed twice in the same body."""
+    emails = [make_mail("a@example.com"), make_mail("A@example.com")]
+
+    packed = pack_messages(emails)
+
+    assert [p.indexes for p in packed] == [[0], [1]]
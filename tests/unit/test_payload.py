@@ -0,0 +1,80 @@
+import json
+
+import pytest
+from sendgrid.helpers.mail import Attachment, Mail  # type: ignore
+
+from async_sendgrid import payload as payload_module
+from async_sendgrid.payload import Payload, dumps, estimate_size, to_payload
+
+
+@pytest.fixture
+def email() -> Mail:
+    return Mail(
+        from_email="johndoe@example.com",
+        to_emails=["a@example.com", "b@example.com"],
+        subject="Example email",
+        plain_text_content="Héllo World!",
+    )
+
+
+def test_dumps_is_compact_json(email: Mail):
+    """Test that dumps produces compact UTF-8 JSON."""
+    content = dumps(email.get())
+    assert json.loads(content) == email.get()
+    assert b": " not in content and b", " not in content
+
+
+def test_dumps_without_orjson(email: Mail, monkeypatch: pytest.MonkeyPatch):
+    """Test that dumps falls back to the standard library encoder."""
+    monkeypatch.setattr(payload_module, "orjson", None)
+    content = dumps(email.get())
+    assert json.loads(content) == email.get()
+    assert "Héllo".encode() in content
+
+
+def test_payload_from_mail(email: Mail):
+    """Test that a payload built from a Mail carries its metadata."""
+    email.add_attachment(
+        Attachment(file_content="aGVsbG8=", file_name="a.txt")
+    )
+    payload = Payload.from_mail(email)
+
+    assert json.loads(payload.content) == email.get()
+    assert payload.num_recipients == 2
+    assert payload.num_personalizations == 1
+    assert payload.has_attachments is True
+    assert len(payload) == len(payload.content)
+
+
+@pytest.mark.parametrize(
+    "body",
+    [b'{"a":1}', bytearray(b'{"a":1}'), memoryview(b'{"a":1}')],
+)
+def test_to_payload_keeps_encoded_bodies(body):
+    """Test that encoded bodies are posted without re-encoding."""
+    payload = to_payload(body)
+    assert payload.content == b'{"a":1}'
+    assert payload.num_recipients is None
+
+
+def test_to_payload_passes_payloads_through(email: Mail):
+    """Test that an existing payload is returned as-is."""
+    payload = Payload.from_mail(email)
+    assert to_payload(payload) is payload
+
+
+def test_to_payload_encodes_dicts_and_mails(email: Mail):
+    """Test that dicts and Mail objects are encoded."""
+    assert to_payload(email.get()).content == dumps(email.get())
+    assert to_payload(email).content == dumps(email.get())
+
+
+def test_estimate_size_counts_content_and_attachments(email: Mail):
+    """Test that the estimate matches for a Mail and its dict."""
+    email.attachment = Attachment("QUJD" * 100, "a.pdf", "application/pdf")
+    size = len("Héllo World!") + 400
+
+    assert estimate_size(email) == size
+    assert estimate_size(email.get()) == size
+    assert estimate_size(b"12345") == 5
+    assert estimate_size(Payload(b"123")) == 3
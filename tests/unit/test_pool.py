@@ -1,7 +1,20 @@
-import pytest
-from httpx import AsyncClient
+import asyncio
 
+import pytest
+from httpcore import AsyncMockBackend
+from httpcore._backends.mock import AsyncMockStream
+from httpx import (
+    AsyncClient,
+    ConnectError,
+    MockTransport,
+    Request,
+    Response,
+)
+
+from async_sendgrid.concurrency import StreamLimitTransport
+from async_sendgrid.exception import SessionClosedException
 from async_sendgrid.pool import ConnectionPool
+from async_sendgrid.simulator import SendGridSimulator
 
 
 @pytest.fixture
@@ -89,14 +102,6 @@ def test_create_client_timeout_propagated():
     assert client.timeout.read == 30.0
 
 
-def test_ephemeral_client_timeout_propagated():
-    """Test that custom timeout is propagated to ephemeral clients."""
-    pool = ConnectionPool(timeout=30.0)
-    client = pool._create_ephemeral_client(HEADERS, retry=1)
-    assert client.timeout.connect == 30.0
-    assert client.timeout.read == 30.0
-
-
 def test_pool_repr(pool: ConnectionPool):
     """Test repr of the pool."""
     assert repr(pool) == (
@@ -149,23 +154,297 @@ async def test_shutdown_sets_flag():
     assert pool.is_shutdown is True
 
 
-def test_create_ephemeral_client(pool: ConnectionPool):
-    """Test ephemeral client creation with custom retry/backoff."""
-    client = pool._create_ephemeral_client(HEADERS, retry=2, backoff=1.0)
-    assert client.headers["Authorization"] == "Bearer test"
+def test_retry_policy(pool: ConnectionPool):
+    """Test retry policy creation with custom retry/backoff."""
+    policy = pool._retry_policy(retry=2, backoff=1.0)
+    assert policy.total == 2
+    assert policy.backoff_factor == 1.0
+    assert policy.backoff_jitter == pool._retry.backoff_jitter
+    assert policy.is_retryable_method("POST")
+
+
+def test_retry_policy_defaults_to_pool_settings(pool: ConnectionPool):
+    """Test that unset overrides fall back to the pool settings."""
+    policy = pool._retry_policy(backoff=2.0)
+    assert policy.total == pool._retry.total
+    assert policy.backoff_factor == 2.0
+
+
+def test_retry_policy_is_cached(pool: ConnectionPool):
+    """Test that policies are reused for identical settings."""
+    assert pool._retry_policy(retry=2) is pool._retry_policy(retry=2)
+    assert pool._retry_policy(retry=2) is not pool._retry_policy(retry=3)
+
+
+def test_retry_policy_cache_is_bounded(pool: ConnectionPool):
+    """Test that the least recently used policies are evicted."""
+    first = pool._retry_policy(retry=0)
+    for retry in range(1, 40):
+        pool._retry_policy(retry=retry)
+    assert len(pool._retry_policies) == 32
+    assert pool._retry_policy(retry=0) is not first
+
+
+def test_retry_policy_does_not_create_clients(pool: ConnectionPool):
+    """Test that per-request overrides reuse the pool client."""
+    client = pool._create_client(HEADERS)
+    pool._retry_policy(retry=1, backoff=0.1)
+    assert pool._create_client(HEADERS) is client
 
 
 @pytest.mark.parametrize("retry", [-1, -100, 1.5, "3"])
-def test_ephemeral_client_invalid_retry_raises(pool: ConnectionPool, retry):
+def test_retry_policy_invalid_retry_raises(pool: ConnectionPool, retry):
     """Test that invalid retry override raises ValueError."""
     with pytest.raises(ValueError, match="retry_attempts"):
-        pool._create_ephemeral_client(HEADERS, retry=retry)
+        pool._retry_policy(retry=retry)
 
 
 @pytest.mark.parametrize("backoff", [-0.5, -1, "0.5"])
-def test_ephemeral_client_invalid_backoff_raises(
-    pool: ConnectionPool, backoff
-):
+def test_retry_policy_invalid_backoff_raises(pool: ConnectionPool, backoff):
     """Test that invalid backoff override raises ValueError."""
     with pytest.raises(ValueError, match="backoff_factor"):
-        pool._create_ephemeral_client(HEADERS, backoff=backoff)
+        pool._retry_policy(backoff=backoff)
+
+
+def test_pool_http2_disabled_by_default(pool: ConnectionPool):
+    """Test that the pool uses HTTP/1.1 by default."""
+    client = pool._create_client(HEADERS)
+    assert pool.http2 is False
+    assert client._transport._async_transport._pool._http2 is False
+    assert pool.concurrency_limit == pool.limits.max_connections
+
+
+def test_pool_http2_multiplexes_streams():
+    """Test that HTTP/2 mode enables h2 and sizes the concurrency limit."""
+    pytest.importorskip("h2")
+    pool = ConnectionPool(http2=True, max_connections=2, http2_max_streams=50)
+    client = pool._create_client(HEADERS)
+
+    assert pool.http2 is True
+    assert pool._http_transport._pool._http2 is True
+    assert pool.limits.max_connections == 2
+    assert pool.concurrency_limit == 100
+    transport = client._transport._async_transport
+    assert isinstance(transport, StreamLimitTransport)
+    assert transport.limit == 100
+
+
+@pytest.mark.asyncio
+async def test_pool_http2_caps_streams_in_flight():
+    """Test that HTTP/2 requests beyond the stream limit wait."""
+    pytest.importorskip("h2")
+    state = {"in_flight": 0, "peak": 0}
+
+    async def handler(request: Request) -> Response:
+        state["in_flight"] += 1
+        state["peak"] = max(state["peak"], state["in_flight"])
+        await asyncio.sleep(0.001)
+        state["in_flight"] -= 1
+        return Response(202)
+
+    pool = ConnectionPool(
+        http2=True,
+        max_connections=2,
+        http2_max_streams=3,
+        transport=MockTransport(handler),
+    )
+    client = pool._create_client(HEADERS)
+
+    responses = await asyncio.gather(
+        *(client.post("https://example.com", content=b"{}") for _ in range(20))
+    )
+
+    assert [r.status_code for r in responses] == [202] * 20
+    assert state["peak"] == 6
+
+
+def test_pool_http2_falls_back_without_h2(
+    monkeypatch: pytest.MonkeyPatch, caplog: pytest.LogCaptureFixture
+):
+    """Test that HTTP/2 mode falls back to HTTP/1.1 without h2."""
+    monkeypatch.setattr("async_sendgrid.pool.find_spec", lambda name: None)
+
+    pool = ConnectionPool(http2=True, max_connections=2)
+
+    assert pool.http2 is False
+    assert pool.concurrency_limit == 2
+    assert "falling back to HTTP/1.1" in caplog.text
+
+
+@pytest.mark.parametrize("http2_max_streams", [0, -1, 1.5, "3"])
+def test_pool_invalid_http2_max_streams_raises(http2_max_streams):
+    """Test that invalid http2_max_streams raises ValueError."""
+    with pytest.raises(ValueError, match="http2_max_streams"):
+        ConnectionPool(http2_max_streams=http2_max_streams)
+
+
+class _YieldingStream(AsyncMockStream):
+    """A mock socket handing control back to the loop on every read."""
+
+    async def read(self, max_bytes: int, timeout=None) -> bytes:
+        await asyncio.sleep(0)
+        return await super().read(max_bytes, timeout)
+
+
+class _YieldingBackend(AsyncMockBackend):
+    """A mock network opening ``_YieldingStream`` connections."""
+
+    async def connect_tcp(self, *args, **kwargs) -> _YieldingStream:
+        return _YieldingStream(list(self._buffer), http2=self._http2)
+
+
+def _h2_responses(count: int) -> list:
+    """Build the frames answering ``count`` HTTP/2 requests."""
+    from hpack import Encoder
+    from hyperframe.frame import HeadersFrame, SettingsFrame
+
+    encoder = Encoder()
+    frames = [SettingsFrame().serialize()]
+    for stream_id in range(1, 2 * count, 2):
+        frames.append(
+            HeadersFrame(
+                stream_id,
+                data=encoder.encode([(b":status", b"200")]),
+                flags=["END_HEADERS", "END_STREAM"],
+            ).serialize()
+        )
+    return frames
+
+
+def _mock_network_pool(http2: bool = False) -> ConnectionPool:
+    """Build a pool whose connections are opened on a mock network."""
+    pool = ConnectionPool(
+        max_connections=4, max_keepalive_connections=4, http2=http2
+    )
+    pool._create_client(HEADERS)
+    buffer = (
+        _h2_responses(3)
+        if http2
+        else [b"HTTP/1.1 200 OK\r\nContent-Length: 0\r\n\r\n"]
+    )
+    pool._http_transport._pool._network_backend = _YieldingBackend(
+        buffer, http2=http2
+    )
+    return pool
+
+
+@pytest.mark.asyncio
+async def test_warm_opens_one_connection_per_request():
+    """Test that HTTP/1.1 warming opens the requested connections."""
+    pool = _mock_network_pool()
+
+    assert await pool.warm("https://example.com", 3) == 3
+    assert pool.stats().opened == 3
+    assert pool.stats().idle == 3
+    await pool.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_warm_reports_the_connections_open_under_http2():
+    """Test that multiplexed warm-up requests count as one connection."""
+    pytest.importorskip("h2")
+    pool = _mock_network_pool(http2=True)
+
+    assert await pool.warm("https://example.com", 3) == 1
+    assert pool.stats().opened == 1
+    await pool.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_warm_is_capped_at_keepalive_connections():
+    """Test that warm sends at most max_keepalive_connections requests."""
+    heads = []
+
+    def handler(request: Request) -> Response:
+        heads.append(request.method)
+        return Response(200)
+
+    pool = ConnectionPool(
+        max_keepalive_connections=2, transport=MockTransport(handler)
+    )
+    pool._create_client(HEADERS)
+
+    assert await pool.warm("https://example.com", 5) == 2
+    assert heads == ["HEAD", "HEAD"]
+    await pool.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_warm_counts_failures_out():
+    """Test that requests failing to connect are not counted."""
+
+    def handler(request: Request) -> Response:
+        raise ConnectError("refused")
+
+    pool = ConnectionPool(transport=MockTransport(handler))
+    pool._create_client(HEADERS)
+
+    assert await pool.warm("https://example.com", 2) == 0
+    await pool.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_warm_after_shutdown_raises():
+    """Test that warming a shut down pool raises."""
+    pool = ConnectionPool(transport=SendGridSimulator())
+    pool._create_client(HEADERS)
+    await pool.shutdown()
+
+    with pytest.raises(SessionClosedException):
+        await pool.warm("https://example.com")
+
+
+@pytest.mark.parametrize("connections", [0, -1, 1.5, "2"])
+@pytest.mark.asyncio
+async def test_keep_warm_invalid_connections_raises(connections):
+    """Test that keep_warm rejects connections before starting a task."""
+    pool = ConnectionPool(transport=SendGridSimulator())
+    pool._create_client(HEADERS)
+
+    with pytest.raises(ValueError, match="connections"):
+        pool.keep_warm("https://example.com", connections=connections)
+    assert pool._keeper is None
+
+
+@pytest.mark.asyncio
+async def test_keep_warm_refreshes_until_shutdown():
+    """Test that keep_warm warms periodically and stops on shutdown."""
+    heads = []
+
+    def handler(request: Request) -> Response:
+        heads.append(request.method)
+        return Response(200)
+
+    pool = ConnectionPool(transport=MockTransport(handler))
+    pool._create_client(HEADERS)
+    pool.keep_warm("https://example.com", connections=2, interval=0.01)
+    keeper = pool._keeper
+
+    await asyncio.sleep(0.05)
+    assert heads.count("HEAD") >= 4
+
+    await pool.shutdown()
+    await asyncio.sleep(0)
+    assert keeper.cancelled()
+    assert pool._keeper is None
+
+
+@pytest.mark.asyncio
+async def test_rebuilt_client_reuses_an_open_custom_transport():
+    """Test that closing the client leaves a custom transport usable."""
+    closed = []
+
+    class Transport(MockTransport):
+        async def aclose(self) -> None:
+            closed.append(True)
+
+    pool = ConnectionPool(transport=Transport(lambda r: Response(202)))
+    await pool._create_client(HEADERS).aclose()
+    assert closed == []
+
+    client = pool._create_client(HEADERS)
+    response = await client.post("https://example.com", content=b"{}")
+    assert response.status_code == 202
+
+    await pool.shutdown()
+    assert closed == [True]
@@ -0,0 +1,318 @@
+import asyncio
+import time
+from email.utils import formatdate
+from types import SimpleNamespace
+
+import pytest
+from httpx import MockTransport, Request, Response
+
+from async_sendgrid import ratelimit
+from async_sendgrid.pool import ConnectionPool
+from async_sendgrid.ratelimit import (
+    RateLimiter,
+    RateLimitTransport,
+    ThrottleGate,
+    _parse_retry_after,
+)
+
+
+class FakeClock:
+    """
+    A clock only moving when every sleeper is waiting on it.
+
+    A sleep yields to the other tasks first, then moves the clock to its
+    deadline once no earlier deadline is pending, so the elapsed times
+    are exact whatever the load of the machine.
+    """
+
+    def __init__(self) -> None:
+        self.now = 1000.0
+        self._wall = time.time() - self.now
+        self._deadlines: list[float] = []
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def time(self) -> float:
+        return self._wall + self.now
+
+    async def sleep(self, delay: float) -> None:
+        deadline = self.now + max(delay, 0)
+        self._deadlines.append(deadline)
+        try:
+            while self.now < deadline:
+                await _sleep(0)
+                if deadline <= min(self._deadlines):
+                    self.now = deadline
+        finally:
+            self._deadlines.remove(deadline)
+
+
+_sleep = asyncio.sleep
+
+
+@pytest.fixture
+def clock(monkeypatch) -> FakeClock:
+    clock = FakeClock()
+    monkeypatch.setattr(
+        ratelimit,
+        "time",
+        SimpleNamespace(monotonic=clock.monotonic, time=clock.time),
+    )
+    monkeypatch.setattr(asyncio, "sleep", clock.sleep)
+    return clock
+
+
+def _response(status_code: int = 202, **headers: str) -> Response:
+    return Response(
+        status_code,
+        headers={k.replace("_", "-"): v for k, v in headers.items()},
+    )
+
+
+def _window(
+    remaining: int, reset_in: float, now: float | None = None
+) -> dict[str, str]:
+    return {
+        "X_RateLimit_Limit": "600",
+        "X_RateLimit_Remaining": str(remaining),
+        "X_RateLimit_Reset": str((now or time.time()) + reset_in),
+    }
+
+
+async def _timed_acquires(
+    clock: FakeClock, limiter: RateLimiter, count: int
+) -> float:
+    start = clock.monotonic()
+    for _ in range(count):
+        await limiter.acquire()
+    return clock.monotonic() - start
+
+
+@pytest.mark.asyncio
+async def test_no_window_does_not_delay(clock):
+    """Test that requests are not delayed until a window is known."""
+    limiter = RateLimiter()
+    assert await _timed_acquires(clock, limiter, 100) == 0
+    assert limiter.remaining is None
+
+
+@pytest.mark.asyncio
+async def test_exhausted_window_holds_until_reset(clock):
+    """Test that an exhausted budget holds requests until the reset."""
+    limiter = RateLimiter()
+    limiter.update(
+        _response(**_window(remaining=0, reset_in=0.2, now=clock.time()))
+    )
+
+    elapsed = await _timed_acquires(clock, limiter, 1)
+
+    assert elapsed == pytest.approx(0.2)
+
+
+@pytest.mark.asyncio
+async def test_remaining_budget_is_paced_over_the_window(clock):
+    """Test that the remaining budget is spread over the window."""
+    limiter = RateLimiter(burst=1)
+    limiter.update(
+        _response(**_window(remaining=5, reset_in=1.0, now=clock.time()))
+    )
+
+    elapsed = await _timed_acquires(clock, limiter, 3)
+
+    # One immediate request, then one every 0.2s.
+    assert elapsed == pytest.approx(0.4)
+    assert limiter.remaining == 2
+
+
+@pytest.mark.asyncio
+async def test_retry_after_holds_requests(clock):
+    """Test that a 429 with Retry-After holds every request."""
+    limiter = RateLimiter()
+    limiter.update(_response(429, Retry_After="0.2"))
+
+    assert limiter.remaining == 0
+    assert await _timed_acquires(clock, limiter, 1) == pytest.approx(0.2)
+
+
+@pytest.mark.asyncio
+async def test_later_window_does_not_shorten_a_hold(clock):
+    """Test that headers arriving after a 429 cannot end its hold early."""
+    limiter = RateLimiter()
+    limiter.update(_response(429, Retry_After="0.5"))
+    limiter.update(
+        _response(**_window(remaining=100, reset_in=0.1, now=clock.time()))
+    )
+
+    assert limiter.remaining == 0
+    assert await _timed_acquires(clock, limiter, 1) == pytest.approx(0.5)
+
+
+@pytest.mark.asyncio
+async def test_budget_is_refilled_to_the_limit_after_the_reset(clock):
+    """Test that a new window starts with the full limit."""
+    limiter = RateLimiter(burst=10)
+    headers = _window(remaining=0, reset_in=0.2, now=clock.time())
+    headers["X_RateLimit_Limit"] = "3"
+    limiter.update(_response(**headers))
+
+    assert limiter.remaining == 0
+    await _timed_acquires(clock, limiter, 1)
+    assert limiter.remaining == 3
+    assert limiter._tokens == 3
+
+
+@pytest.mark.asyncio
+async def test_concurrent_waiters_sleep_in_parallel(clock):
+    """Test that waiters reserve their slot and sleep without a lock."""
+    limiter = RateLimiter(burst=1)
+    limiter.update(
+        _response(**_window(remaining=5, reset_in=1.0, now=clock.time()))
+    )
+    start = clock.monotonic()
+    released: list[float] = []
+
+    async def request():
+        await limiter.acquire()
+        released.append(clock.monotonic() - start)
+
+    await asyncio.gather(*(request() for _ in range(3)))
+
+    assert released == pytest.approx([0.0, 0.2, 0.4])
+    assert limiter.remaining == 2
+
+
+@pytest.mark.parametrize(
+    "value, expected",
+    [("3", 3.0), ("-1", 0.0), ("", None), (None, None), ("soon", None)],
+)
+def test_parse_retry_after_seconds(value, expected):
+    assert _parse_retry_after(value) == expected
+
+
+def test_parse_retry_after_date():
+    delay = _parse_retry_after(formatdate(time.time() + 10, usegmt=True))
+    assert delay is not None and 8 <= delay <= 10
+
+
+@pytest.mark.parametrize("burst", [0, -1, 1.5, "3"])
+def test_invalid_burst_raises(burst):
+    with pytest.raises(ValueError, match="burst"):
+        RateLimiter(burst=burst)
+
+
+@pytest.mark.asyncio
+async def test_transport_updates_limiter():
+    """Test that the transport feeds responses to the limiter."""
+    limiter = RateLimiter()
+    transport = RateLimitTransport(
+        MockTransport(lambda request: _response(**_window(42, 60))),
+        limiter=limiter,
+    )
+
+    await transport.handle_async_request(
+        Request("POST", "https://example.com")
+    )
+
+    assert limiter.remaining == 42
+
+
+@pytest.mark.asyncio
+async def test_gate_is_open_by_default(clock):
+    """Test that an open gate does not delay requests."""
+    gate = ThrottleGate()
+    start = clock.monotonic()
+    for _ in range(100):
+        await gate.wait()
+    assert clock.monotonic() == start
+    assert gate.is_closed is False
+
+
+@pytest.mark.parametrize(
+    "response",
+    [
+        _response(503, Retry_After="1"),
+        _response(429),
+        _response(202, **_window(remaining=0, reset_in=1)),
+    ],
+)
+def test_gate_only_closes_on_throttled_responses(response):
+    """Test that the gate only closes on a 429 telling when to resume."""
+    gate = ThrottleGate()
+    gate.update(response)
+    assert gate.is_closed is False
+
+
+@pytest.mark.parametrize(
+    "headers",
+    [{"Retry_After": "1"}, _window(remaining=0, reset_in=3600)],
+)
+def test_gate_closes_on_429(headers):
+    """Test that a 429 with Retry-After or a reset time closes the gate."""
+    gate = ThrottleGate()
+    gate.update(_response(429, **headers))
+    assert gate.is_closed is True
+
+
+@pytest.mark.asyncio
+async def test_gate_pauses_every_request_then_releases_gradually(clock):
+    """
+    Test that every request waits for the reopening, then the queued
+    requests are released one by one at the release rate.
+    """
+    gate = ThrottleGate(release_rate=20)
+    gate.update(_response(429, Retry_After="0.2"))
+    start = clock.monotonic()
+    released: list[float] = []
+
+    async def request():
+        await gate.wait()
+        released.append(clock.monotonic() - start)
+
+    await asyncio.gather(*(request() for _ in range(4)))
+
+    assert released == pytest.approx([0.2, 0.25, 0.3, 0.35])
+
+
+@pytest.mark.parametrize("release_rate", [0, -1, "3"])
+def test_invalid_release_rate_raises(release_rate):
+    with pytest.raises(ValueError, match="release_rate"):
+        ThrottleGate(release_rate=release_rate)
+
+
+@pytest.mark.asyncio
+async def test_transport_closes_gate():
+    """Test that the transport feeds responses to the gate."""
+    gate = ThrottleGate()
+    transport = RateLimitTransport(
+        MockTransport(lambda request: _response(429, Retry_After="5")),
+        gate=gate,
+    )
+
+    await transport.handle_async_request(
+        Request("POST", "https://example.com")
+    )
+
+    assert gate.is_closed is True
+
+
+def test_pool_throttle_gate_wraps_transport():
+    """Test that the pool installs the gate when enabled."""
+    assert ConnectionPool().throttle_gate is None
+
+    pool = ConnectionPool(throttle_gate=True, throttle_release_rate=10)
+    client = pool._create_client({"Authorization": "Bearer test"})
+
+    assert isinstance(pool.throttle_gate, ThrottleGate)
+    assert isinstance(client._transport._async_transport, RateLimitTransport)
+
+
+def test_pool_rate_limit_wraps_transport():
+    """Test that the pool only installs the limiter when enabled."""
+    assert ConnectionPool().rate_limiter is None
+
+    pool = ConnectionPool(rate_limit=True)
+    client = pool._create_client({"Authorization": "Bearer test"})
+
+    assert isinstance(pool.rate_limiter, RateLimiter)
+    assert isinstance(client._transport._async_transport, RateLimitTransport)
@@ -1,5 +1,14 @@
+import asyncio
+import json
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
 import pytest
+from httpx import ConnectError, MockTransport, Request, Response
+from sendgrid.helpers.mail import Mail  # type: ignore
 
+from async_sendgrid.idempotency import MemoryDedupeStore
+from async_sendgrid.payload import Payload
+from async_sendgrid.pool import ConnectionPool
 from async_sendgrid.sendgrid import SendgridAPI
 
 
@@ -43,3 +52,507 @@ def test_repr(client: SendgridAPI) -> None:
         "timeout=5.0))"
     )
     assert str(client) == repr(client)
+
+
+@pytest.mark.asyncio
+async def test_send_many_preserves_order_and_bounds_concurrency(
+    make_mail, mock_client
+) -> None:
+    """
+    Test that send_many yields results in input order and never exceeds
+    the requested concurrency.
+    """
+    state = {"in_flight": 0, "peak": 0}
+
+    async def handler(request: Request) -> Response:
+        state["in_flight"] += 1
+        state["peak"] = max(state["peak"], state["in_flight"])
+        recipient = json.loads(request.content)["personalizations"][0]
+        index = int(recipient["to"][0]["email"].split("@")[0][4:])
+        # Later messages complete first to exercise the reordering.
+        await asyncio.sleep(0.001 * (20 - index))
+        state["in_flight"] -= 1
+        return Response(202, json={"index": index})
+
+    client = mock_client(handler)
+    emails = (make_mail(f"user{i}@example.com") for i in range(20))
+
+    results = [r async for r in client.send_many(emails, concurrency=3)]
+
+    assert [r.json()["index"] for r in results] == list(range(20))
+    assert state["peak"] == 3
+
+
+@pytest.mark.asyncio
+async def test_concurrent_send_many_share_the_pool_budget(
+    make_mail, mock_client
+) -> None:
+    """
+    Test that concurrent send_many calls together stay within the pool's
+    concurrency limit.
+    """
+    state = {"in_flight": 0, "peak": 0}
+
+    async def handler(request: Request) -> Response:
+        state["in_flight"] += 1
+        state["peak"] = max(state["peak"], state["in_flight"])
+        await asyncio.sleep(0.001)
+        state["in_flight"] -= 1
+        return Response(202)
+
+    client = mock_client(handler)
+    tenant = client.for_tenant(on_behalf_of="sub")
+    tenant._session = client._session
+
+    async def drain(sender: SendgridAPI) -> list:
+        emails = (make_mail(f"user{i}@example.com") for i in range(20))
+        return [r async for r in sender.send_many(emails)]
+
+    results = await asyncio.gather(drain(client), drain(tenant))
+
+    assert [len(r) for r in results] == [20, 20]
+    assert state["peak"] == client.pool.concurrency_limit == 4
+
+
+@pytest.mark.asyncio
+async def test_send_many_returns_exceptions_in_place(
+    make_mail, mock_client
+) -> None:
+    """
+    Test that a failing message yields its exception without aborting
+    the remaining sends.
+    """
+
+    async def handler(request: Request) -> Response:
+        if b"fail@" in request.content:
+            raise ConnectError("boom", request=request)
+        return Response(202)
+
+    client = mock_client(handler)
+    emails = [
+        make_mail("ok1@example.com"),
+        make_mail("fail@example.com"),
+        make_mail("ok2@example.com"),
+    ]
+
+    results = [r async for r in client.send_many(emails)]
+
+    assert results[0].status_code == 202
+    assert isinstance(results[1], ConnectError)
+    assert results[2].status_code == 202
+
+
+@pytest.mark.asyncio
+async def test_send_many_accepts_async_iterables(
+    make_mail, mock_client
+) -> None:
+    """
+    Test that send_many consumes async iterables.
+    """
+
+    async def emails():
+        for i in range(3):
+            yield make_mail(f"user{i}@example.com")
+
+    client = mock_client(lambda request: Response(202))
+    results = [r async for r in client.send_many(emails())]
+
+    assert [r.status_code for r in results] == [202, 202, 202]
+
+
+@pytest.mark.parametrize("concurrency, expected", [(None, 4), (2, 2), (50, 4)])
+def test_resolve_concurrency(concurrency, expected) -> None:
+    """
+    Test that concurrency defaults to and is capped at max_connections.
+    """
+    client = SendgridAPI(
+        api_key="SECRET_KEY", pool=ConnectionPool(max_connections=4)
+    )
+    assert client._resolve_concurrency(concurrency) == expected
+
+
+@pytest.mark.parametrize("concurrency", [0, -1, 1.5, "3"])
+def test_resolve_concurrency_invalid_raises(concurrency) -> None:
+    """
+    Test that an invalid concurrency raises ValueError.
+    """
+    client = SendgridAPI(api_key="SECRET_KEY")
+    with pytest.raises(ValueError, match="concurrency"):
+        client._resolve_concurrency(concurrency)
+
+
+@pytest.mark.asyncio
+async def test_send_packed_maps_responses_back(make_mail, mock_client) -> None:
+    """
+    Test that send_packed issues one request per compatible group and
+    maps each response back to every original message.
+    """
+    requests: list[dict] = []
+
+    def handler(request: Request) -> Response:
+        payload = json.loads(request.content)
+        requests.append(payload)
+        if payload["subject"] == "Rejected":
+            return Response(400)
+        return Response(202)
+
+    client = mock_client(handler)
+    rejected = make_mail("x@example.com")
+    rejected.subject = "Rejected"
+    emails = [
+        make_mail("a@example.com"),
+        rejected,
+        make_mail("b@example.com"),
+        make_mail("c@example.com"),
+    ]
+
+    results = await client.send_packed(emails)
+
+    assert len(requests) == 2
+    assert [r.status_code for r in results] == [202, 400, 202, 202]
+    assert results[0] is results[2] is results[3]
+
+
+@pytest.mark.asyncio
+async def test_coalesced_sends_share_one_request(
+    make_mail, mock_client
+) -> None:
+    """
+    Test that concurrent compatible sends are merged into one request and
+    every caller receives the shared response.
+    """
+    requests: list[dict] = []
+
+    def handler(request: Request) -> Response:
+        requests.append(json.loads(request.content))
+        return Response(202)
+
+    client = mock_client(handler, coalesce_window=0.01)
+
+    responses = await asyncio.gather(
+        *(client.send(make_mail(f"user{i}@example.com")) for i in range(5))
+    )
+
+    assert len(requests) == 1
+    assert len(requests[0]["personalizations"]) == 5
+    assert all(response is responses[0] for response in responses)
+
+
+@pytest.mark.asyncio
+async def test_coalesced_batch_flushes_when_full(
+    make_mail, mock_client
+) -> None:
+    """
+    Test that a batch is sent as soon as it reaches its maximum size.
+    """
+    requests: list[dict] = []
+
+    def handler(request: Request) -> Response:
+        requests.append(json.loads(request.content))
+        return Response(202)
+
+    client = mock_client(handler, coalesce_window=60, coalesce_max_size=2)
+
+    await asyncio.wait_for(
+        asyncio.gather(
+            *(client.send(make_mail(f"user{i}@example.com")) for i in range(4))
+        ),
+        timeout=1,
+    )
+
+    assert [len(r["personalizations"]) for r in requests] == [2, 2]
+
+
+@pytest.mark.asyncio
+async def test_coalesced_failure_propagates_to_every_caller(
+    make_mail, mock_client
+) -> None:
+    """
+    Test that a failed coalesced request raises in every caller.
+    """
+
+    def handler(request: Request) -> Response:
+        raise ConnectError("boom", request=request)
+
+    client = mock_client(handler, coalesce_window=0.01)
+
+    results = await asyncio.gather(
+        *(client.send(make_mail(f"user{i}@example.com")) for i in range(3)),
+        return_exceptions=True,
+    )
+
+    assert all(isinstance(result, ConnectError) for result in results)
+
+
+@pytest.mark.asyncio
+async def test_cancelled_coalesced_request_cancels_every_caller(
+    make_mail, mock_client
+) -> None:
+    """
+    Test that callers of a cancelled coalesced request do not wait forever.
+    """
+    started = asyncio.Event()
+
+    async def handler(request: Request) -> Response:
+        started.set()
+        await asyncio.sleep(60)
+        return Response(202)
+
+    client = mock_client(handler, coalesce_window=0.01)
+    sends = [
+        asyncio.ensure_future(client.send(make_mail(f"user{i}@example.com")))
+        for i in range(3)
+    ]
+    await started.wait()
+    for task in client._coalescer._tasks:
+        task.cancel()
+
+    results = await asyncio.wait_for(
+        asyncio.gather(*sends, return_exceptions=True), timeout=1
+    )
+
+    assert all(
+        isinstance(result, asyncio.CancelledError) for result in results
+    )
+
+
+@pytest.mark.parametrize(
+    "kwargs, match",
+    [
+        ({"coalesce_window": 0}, "coalesce_window"),
+        ({"coalesce_window": "5"}, "coalesce_window"),
+        ({"coalesce_window": 0.005, "coalesce_max_size": 0}, "max_size"),
+        ({"coalesce_window": 0.005, "coalesce_max_size": 1001}, "max_size"),
+    ],
+)
+def test_invalid_coalescing_settings_raise(kwargs, match) -> None:
+    """
+    Test that invalid coalescing settings raise ValueError.
+    """
+    with pytest.raises(ValueError, match=match):
+        SendgridAPI(api_key="SECRET_KEY", **kwargs)
+
+
+@pytest.mark.parametrize(
+    "encode",
+    [
+        lambda email: email.get(),
+        lambda email: json.dumps(email.get()).encode(),
+        Payload.from_mail,
+    ],
+    ids=["dict", "bytes", "payload"],
+)
+@pytest.mark.asyncio
+async def test_send_accepts_encoded_bodies(
+    make_mail, mock_client, encode
+) -> None:
+    """
+    Test that send posts dicts, bytes and payloads as the request body.
+    """
+    requests: list[Request] = []
+
+    def handler(request: Request) -> Response:
+        requests.append(request)
+        return Response(202)
+
+    client = mock_client(handler)
+    response = await client.send(encode(make_mail("a@example.com")))
+
+    assert response.status_code == 202
+    assert json.loads(requests[0].content) == make_mail("a@example.com").get()
+    assert requests[0].headers["Content-Type"] == "application/json"
+
+
+@pytest.mark.asyncio
+async def test_send_with_overrides_carries_the_retry_policy(
+    make_mail, mock_client
+) -> None:
+    """
+    Test that per-call retry overrides travel with the request through
+    the shared session.
+    """
+    requests: list[Request] = []
+
+    def handler(request: Request) -> Response:
+        requests.append(request)
+        return Response(202)
+
+    client = mock_client(handler)
+    session = client.session
+
+    await client.send(make_mail("a@example.com"), retry=1, backoff=0.1)
+
+    policy = requests[0].extensions["retry"]
+    assert (policy.total, policy.backoff_factor) == (1, 0.1)
+    assert client.session is session and not session.is_closed
+
+
+def _large_mail(recipient: str, size: int) -> Mail:
+    return Mail(
+        from_email="johndoe@example.com",
+        to_emails=recipient,
+        subject="Example email",
+        html_content="x" * size,
+    )
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "executor_class", [ThreadPoolExecutor, ProcessPoolExecutor]
+)
+async def test_large_messages_are_encoded_in_the_executor(
+    mock_client,
+    executor_class,
+) -> None:
+    """
+    Test that messages above the threshold are encoded off the event
+    loop, and smaller ones inline.
+    """
+    bodies: list[dict] = []
+
+    def handler(request: Request) -> Response:
+        bodies.append(json.loads(request.content))
+        return Response(202)
+
+    with executor_class(max_workers=1) as executor:
+        client = mock_client(
+            handler, serialize_executor=executor, serialize_threshold=1000
+        )
+        submit = executor.submit
+        offloaded: list[object] = []
+
+        def counting_submit(func, *args):
+            offloaded.append(args[0])
+            return submit(func, *args)
+
+        executor.submit = counting_submit  # type: ignore[method-assign]
+
+        large = _large_mail("large@example.com", 1000)
+        small = _large_mail("small@example.com", 999)
+        await client.send(large)
+        await client.send(small)
+
+    assert offloaded == [large]
+    assert [
+        body["personalizations"][0]["to"][0]["email"] for body in bodies
+    ] == [
+        "large@example.com",
+        "small@example.com",
+    ]
+    assert bodies[0] == large.get()
+
+
+def test_invalid_serialize_threshold_raises() -> None:
+    with pytest.raises(ValueError, match="serialize_threshold"):
+        SendgridAPI(api_key="SECRET_KEY", serialize_threshold=-1)
+
+
+def _tenant_pool(requests: list[Request]) -> ConnectionPool:
+    def handler(request: Request) -> Response:
+        requests.append(request)
+        return Response(202)
+
+    return ConnectionPool(transport=MockTransport(handler))
+
+
+@pytest.mark.asyncio
+async def test_clients_sharing_a_pool_keep_their_credentials(
+    make_mail,
+) -> None:
+    requests: list[Request] = []
+    pool = _tenant_pool(requests)
+    first = SendgridAPI(api_key="FIRST", pool=pool)
+    second = SendgridAPI(api_key="SECOND", on_behalf_of="sub", pool=pool)
+
+    await first.send(make_mail("a@example.com"))
+    await second.send(make_mail("b@example.com"))
+    await first.send(make_mail("c@example.com"))
+
+    assert first.session is second.session
+    assert "Authorization" not in first.session.headers
+    assert [r.headers["Authorization"] for r in requests] == [
+        "Bearer FIRST",
+        "Bearer SECOND",
+        "Bearer FIRST",
+    ]
+    assert [r.headers.get("On-Behalf-Of") for r in requests] == [
+        None,
+        "sub",
+        None,
+    ]
+    assert requests[1].headers["Content-Type"] == "application/json"
+
+
+@pytest.mark.asyncio
+async def test_for_tenant_shares_the_pool(make_mail) -> None:
+    requests: list[Request] = []
+    client = SendgridAPI(
+        api_key="PARENT",
+        endpoint="https://example.com/v3/mail/send",
+        pool=_tenant_pool(requests),
+        coalesce_window=0.01,
+    )
+
+    tenant = client.for_tenant(on_behalf_of="sub")
+    other = client.for_tenant(api_key="OTHER")
+
+    assert client.for_tenant(on_behalf_of="sub") is tenant
+    assert tenant.pool is client.pool
+    assert tenant.session is client.session
+    assert tenant.endpoint == client.endpoint
+    assert tenant.api_key == "PARENT"
+    assert other.api_key == "OTHER"
+    assert tenant._coalescer is not client._coalescer
+
+    # Concurrent messages of different tenants are not merged.
+    await asyncio.gather(
+        client.send(make_mail("a@example.com")),
+        tenant.send(make_mail("b@example.com")),
+        tenant.send(make_mail("c@example.com")),
+    )
+    by_tenant = {
+        request.headers.get("On-Behalf-Of"): len(
+            json.loads(request.content)["personalizations"]
+        )
+        for request in requests
+    }
+    assert by_tenant == {None: 1, "sub": 2}
+
+
+def test_tenant_clients_are_bounded(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setattr("async_sendgrid.sendgrid._MAX_TENANTS", 2)
+    client = SendgridAPI(api_key="PARENT")
+
+    first = client.for_tenant(on_behalf_of="first")
+    second = client.for_tenant(on_behalf_of="second")
+    # Using the first tenant makes the second the least recently used.
+    assert client.for_tenant(on_behalf_of="first") is first
+    client.for_tenant(on_behalf_of="third")
+
+    assert len(client._tenants) == 2
+    assert client.for_tenant(on_behalf_of="first") is first
+    assert client.for_tenant(on_behalf_of="second") is not second
+
+
+@pytest.mark.asyncio
+async def test_duplicate_suppression_is_scoped_to_the_tenant(
+    make_mail,
+) -> None:
+    requests: list[Request] = []
+    client = SendgridAPI(
+        api_key="PARENT",
+        pool=_tenant_pool(requests),
+        dedupe_store=MemoryDedupeStore(),
+    )
+    tenant = client.for_tenant(on_behalf_of="sub")
+
+    await client.send(make_mail("a@example.com"), idempotency_key="key")
+    await tenant.send(make_mail("a@example.com"), idempotency_key="key")
+    replay = await tenant.send(
+        make_mail("a@example.com"), idempotency_key="key"
+    )
+
+    assert len(requests) == 2
+    assert replay.extensions["idempotent_replay"] is True
@@ -0,0 +1,256 @@
+import asyncio
+import gzip
+import json
+import random
+
+import pytest
+from httpx import AsyncClient, ReadError, ReadTimeout
+
+from async_sendgrid.simulator import SendGridSimulator, lognormal, uniform
+
+URL = "https://api.sendgrid.com/v3/mail/send"
+
+
+class _Clock:
+    def __init__(self) -> None:
+        self.now = 1_000_000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.mark.asyncio
+async def test_valid_messages_are_accepted(make_mail, simulator_client):
+    simulator = SendGridSimulator()
+    client = simulator_client(simulator)
+
+    responses = [await client.send(make_mail()) for _ in range(3)]
+
+    assert [r.status_code for r in responses] == [202, 202, 202]
+    assert responses[2].headers["X-Message-Id"] == "simulated-3"
+    assert simulator.stats.accepted == 3
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "body, field",
+    [
+        ({"from": {"email": "a@example.com"}}, "personalizations"),
+        (
+            {"personalizations": [{"to": [{"email": "nope"}]}]},
+            "personalizations.to.email",
+        ),
+        (
+            {"personalizations": [{"to": [{"email": "b@example.com"}]}]},
+            "from.email",
+        ),
+        (
+            {
+                "personalizations": [{"to": [{"email": "b@example.com"}]}],
+                "from": {"email": "a@example.com"},
+                "subject": "Hello",
+            },
+            "content",
+        ),
+    ],
+)
+async def test_invalid_messages_are_rejected(simulator_client, body, field):
+    """Test that invalid bodies get a SendGrid-style 400."""
+    simulator = SendGridSimulator()
+    response = await simulator_client(simulator).send(body)
+
+    assert response.status_code == 400
+    assert response.json()["errors"][0]["field"] == field
+    assert simulator.stats.invalid == 1
+
+
+@pytest.mark.asyncio
+async def test_template_messages_need_no_content(simulator_client):
+    body = {
+        "personalizations": [{"to": [{"email": "b@example.com"}]}],
+        "from": {"email": "a@example.com"},
+        "template_id": "d-123",
+    }
+    response = await simulator_client(SendGridSimulator()).send(body)
+    assert response.status_code == 202
+
+
+@pytest.mark.asyncio
+async def test_requests_without_api_key_are_rejected():
+    async with AsyncClient(transport=SendGridSimulator()) as client:
+        response = await client.post(URL, content=b"{}")
+    assert response.status_code == 401
+
+
+@pytest.mark.asyncio
+async def test_gzipped_bodies_are_validated(make_mail, simulator_client):
+    simulator = SendGridSimulator()
+    client = simulator_client(simulator, compress=True, compress_threshold=0)
+
+    assert (await client.send(make_mail())).status_code == 202
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "content, headers",
+    [
+        (b"{not json", {}),
+        (b"\xff\xfe", {}),
+        (b'{"personalizations": [1]}', {}),
+        (b"not gzip", {"Content-Encoding": "gzip"}),
+        (gzip.compress(b"{}")[:-4], {"Content-Encoding": "gzip"}),
+        (
+            b"\x1f\x8b\x08\x00" + b"\x00" * 6 + b"bad",
+            {"Content-Encoding": "gzip"},
+        ),
+    ],
+    ids=[
+        "json",
+        "utf-8",
+        "personalization",
+        "gzip-header",
+        "gzip-truncated",
+        "deflate",
+    ],
+)
+async def test_malformed_bodies_get_a_400(content, headers):
+    """Test that undecodable bodies are rejected instead of raising."""
+    simulator = SendGridSimulator()
+    async with AsyncClient(transport=simulator) as client:
+        response = await client.post(
+            URL,
+            content=content,
+            headers={"Authorization": "Bearer SG.test", **headers},
+        )
+
+    assert response.status_code == 400
+    assert response.json()["errors"][0]["message"]
+    assert simulator.stats.invalid == 1
+
+
+@pytest.mark.asyncio
+async def test_rate_limit_headers_and_429(make_mail, simulator_client):
+    """Test the rate-limit window and its headers."""
+    clock = _Clock()
+    simulator = SendGridSimulator(rate_limit=2, clock=clock)
+    client = simulator_client(simulator, retry_attempts=0)
+
+    first = await client.send(make_mail())
+    second = await client.send(make_mail())
+    throttled = await client.send(make_mail())
+
+    assert first.headers["X-RateLimit-Limit"] == "2"
+    assert first.headers["X-RateLimit-Remaining"] == "1"
+    assert second.headers["X-RateLimit-Remaining"] == "0"
+    assert float(first.headers["X-RateLimit-Reset"]) == clock.now + 1
+    assert throttled.status_code == 429
+    assert throttled.headers["Retry-After"] == "1"
+    assert throttled.headers["X-RateLimit-Remaining"] == "0"
+
+    clock.now += 1
+    assert (await client.send(make_mail())).status_code == 202
+    assert simulator.stats.throttled == 1
+
+
+@pytest.mark.asyncio
+async def test_faults_are_injected_deterministically(make_mail):
+    """Test that the same seed gives the same outcomes."""
+
+    async def outcomes(seed: int) -> list[str]:
+        simulator = SendGridSimulator(
+            error_rate=0.2, timeout_rate=0.1, reset_rate=0.1, seed=seed
+        )
+        results = []
+        async with AsyncClient(
+            transport=simulator, headers={"Authorization": "Bearer x"}
+        ) as client:
+            for _ in range(200):
+                try:
+                    response = await client.post(
+                        URL, content=json.dumps(make_mail().get())
+                    )
+                    results.append(str(response.status_code))
+                except (ReadTimeout, ReadError) as exc:
+                    results.append(type(exc).__name__)
+        return results
+
+    first = await outcomes(seed=7)
+    assert first == await outcomes(seed=7)
+    assert {"202", "ReadTimeout", "ReadError"} <= set(first)
+    assert {"500", "502", "503"} & set(first)
+    assert 100 < first.count("202") < 160
+
+
+@pytest.mark.asyncio
+async def test_pool_retries_injected_faults(make_mail, simulator_client):
+    """Test that the retry transport recovers from injected faults."""
+    simulator = SendGridSimulator(
+        error_rate=0.1, timeout_rate=0.1, reset_rate=0.1, seed=1
+    )
+    client = simulator_client(simulator, retry_attempts=10)
+
+    responses = await asyncio.gather(
+        *(client.send(make_mail()) for _ in range(50))
+    )
+
+    # Timeouts, resets, 502 and 503 are retried; 500 is not retryable.
+    statuses = [response.status_code for response in responses]
+    assert set(statuses) <= {202, 500}
+    assert simulator.stats.accepted == statuses.count(202) > 45
+    assert simulator.stats.timeouts and simulator.stats.resets
+    assert simulator.stats.requests > 50
+
+
+@pytest.mark.asyncio
+async def test_throttled_responses_are_injected(make_mail, simulator_client):
+    """Test that random 429s come without Retry-After and are retried."""
+    simulator = SendGridSimulator(throttle_rate=0.3, seed=2)
+    client = simulator_client(simulator, retry_attempts=10)
+
+    responses = await asyncio.gather(
+        *(client.send(make_mail()) for _ in range(20))
+    )
+
+    assert [response.status_code for response in responses] == [202] * 20
+    assert simulator.stats.throttled > 0
+    assert simulator.stats.requests == 20 + simulator.stats.throttled
+
+
+@pytest.mark.asyncio
+async def test_latency_distributions(make_mail, simulator_client):
+    """Test that the latency is drawn from the given distribution."""
+    draws = []
+
+    def recording(rng):
+        draws.append(uniform(0.001, 0.002)(rng))
+        return draws[-1]
+
+    client = simulator_client(SendGridSimulator(latency=recording, seed=3))
+    await asyncio.gather(*(client.send(make_mail()) for _ in range(5)))
+
+    assert len(draws) == 5
+    assert all(0.001 <= draw <= 0.002 for draw in draws)
+    assert 0 < lognormal(0.05)(random.Random(1)) < 1
+
+
+@pytest.mark.asyncio
+async def test_pool_warms_through_the_simulator(simulator_client):
+    client = simulator_client(SendGridSimulator())
+    assert await client.warm(3) == 3
+
+
+@pytest.mark.parametrize(
+    "kwargs, match",
+    [
+        ({"error_rate": 1.5}, "error_rate"),
+        ({"timeout_rate": -0.1}, "timeout_rate"),
+        ({"error_rate": 0.6, "reset_rate": 0.6}, "add up"),
+        ({"throttle_rate": 2}, "throttle_rate"),
+        ({"rate_limit": 0}, "rate_limit"),
+        ({"rate_limit_window": 0}, "rate_limit_window"),
+        ({"latency": -1}, "latency"),
+    ],
+)
+def test_invalid_settings_raise(kwargs, match):
+    with pytest.raises(ValueError, match=match):
+        SendGridSimulator(**kwargs)
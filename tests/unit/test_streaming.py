@@ -0,0 +1,244 @@
+import asyncio
+import base64
+import io
+import json
+import mmap
+import tracemalloc
+
+import pytest
+from httpx import AsyncClient, MockTransport, Request, Response
+from sendgrid.helpers.mail import Attachment, Mail  # type: ignore
+
+from async_sendgrid.sendgrid import SendgridAPI
+from async_sendgrid.streaming import (
+    StreamingAttachment,
+    StreamingBody,
+    stream_body,
+)
+
+DATA = bytes(range(256)) * 1000 + b"tail"
+
+
+@pytest.fixture
+def email() -> Mail:
+    return Mail(
+        from_email="johndoe@example.com",
+        to_emails="user@example.com",
+        subject="Example email",
+        plain_text_content="Hello World!",
+    )
+
+
+@pytest.fixture
+def path(tmp_path) -> str:
+    path = tmp_path / "report.pdf"
+    path.write_bytes(DATA)
+    return str(path)
+
+
+async def _read(body: StreamingBody) -> bytes:
+    return b"".join([bytes(chunk) async for chunk in body])
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("kind", ["path", "file", "bytes", "mmap"])
+async def test_body_is_the_json_of_the_message(email: Mail, path: str, kind):
+    """Test that every source produces the same JSON body."""
+    with open(path, "rb") as file:
+        source = {
+            "path": path,
+            "file": file,
+            "bytes": DATA,
+            "mmap": mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ),
+        }[kind]
+        attachment = StreamingAttachment(
+            source, filename="report.pdf", file_type="application/pdf"
+        )
+        body = stream_body(email, [attachment])
+        content = await _read(body)
+
+    expected = email.get()
+    expected["attachments"] = [
+        {
+            "content": base64.b64encode(DATA).decode(),
+            "filename": "report.pdf",
+            "type": "application/pdf",
+        }
+    ]
+    assert json.loads(content) == expected
+    assert len(body) == len(content)
+
+
+@pytest.mark.asyncio
+async def test_body_keeps_the_message_attachments(email: Mail):
+    """Test that streamed attachments follow the message's own."""
+    email.attachment = Attachment("QUJD", "inline.txt", "text/plain")
+    body = stream_body(
+        email.get(),
+        [
+            StreamingAttachment(b"first", filename="1.txt"),
+            StreamingAttachment(io.BytesIO(b"second"), filename="2.txt"),
+        ],
+    )
+    content = await _read(body)
+
+    attachments = json.loads(content)["attachments"]
+    assert [a["filename"] for a in attachments] == [
+        "inline.txt",
+        "1.txt",
+        "2.txt",
+    ]
+    assert base64.b64decode(attachments[2]["content"]) == b"second"
+    assert len(body) == len(content)
+
+
+class _ShortReads(io.BytesIO):
+    """A file object returning at most 1000 bytes per read, like a pipe."""
+
+    def read(self, size: int | None = -1) -> bytes:
+        if size is None or size < 0 or size > 1000:
+            size = 1000
+        return super().read(size)
+
+
+@pytest.mark.asyncio
+async def test_short_reads_are_encoded_without_padding(email: Mail):
+    """Test that short reads do not put padding inside the content."""
+    body = stream_body(
+        email, [StreamingAttachment(_ShortReads(DATA), "report.pdf")]
+    )
+    content = await _read(body)
+
+    (attachment,) = json.loads(content)["attachments"]
+    assert attachment["content"] == base64.b64encode(DATA).decode()
+    assert len(body) == len(content)
+
+
+@pytest.mark.asyncio
+async def test_uneven_chunks_are_encoded_without_padding(
+    email: Mail, monkeypatch
+):
+    """Test that chunks not made of 3-byte groups carry their remainder."""
+    monkeypatch.setattr("async_sendgrid.streaming._CHUNK_SIZE", 1000)
+    body = stream_body(email, [StreamingAttachment(DATA, "report.pdf")])
+    content = await _read(body)
+
+    (attachment,) = json.loads(content)["attachments"]
+    assert attachment["content"] == base64.b64encode(DATA).decode()
+    assert len(body) == len(content)
+
+
+@pytest.mark.asyncio
+async def test_body_without_streamed_attachments_is_valid_json(email: Mail):
+    """Test that the message's own attachments end the list cleanly."""
+    email.attachment = Attachment("QUJD", "inline.txt", "text/plain")
+    body = StreamingBody(email.get(), [])
+    content = await _read(body)
+
+    attachments = json.loads(content)["attachments"]
+    assert [a["filename"] for a in attachments] == ["inline.txt"]
+    assert len(body) == len(content)
+
+
+@pytest.mark.asyncio
+async def test_body_can_be_read_again(email: Mail, path: str):
+    """Test that a retried request sends the same body."""
+    with open(path, "rb") as file:
+        body = stream_body(email, [StreamingAttachment(file, "report.pdf")])
+        assert await _read(body) == await _read(body)
+
+
+@pytest.mark.asyncio
+async def test_concurrent_sends_share_a_file_object(
+    email: Mail, path: str, mock_client
+):
+    """Test that sends reading the same file object at once both get it."""
+    requests: list[Request] = []
+
+    def handler(request: Request) -> Response:
+        requests.append(request)
+        return Response(202)
+
+    client = mock_client(handler)
+    with open(path, "rb") as file:
+        attachment = StreamingAttachment(file, "report.pdf")
+        await asyncio.gather(
+            *(client.send(email, attachments=[attachment]) for _ in range(4))
+        )
+
+    for request in requests:
+        content = json.loads(request.content)["attachments"][0]["content"]
+        assert base64.b64decode(content) == DATA
+
+
+@pytest.mark.asyncio
+async def test_memory_does_not_grow_with_the_attachment(email: Mail, tmp_path):
+    """Test that the body is produced without loading the file."""
+    path = tmp_path / "large.bin"
+    with open(path, "wb") as file:
+        file.truncate(20 * 1024 * 1024)
+    body = stream_body(email, [StreamingAttachment(str(path))])
+
+    tracemalloc.start()
+    try:
+        size = 0
+        async for chunk in body:
+            size += len(chunk)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    assert size == len(body)
+    assert peak < 4 * 1024 * 1024
+
+
+@pytest.mark.asyncio
+async def test_send_streams_with_a_content_length(email: Mail, path: str):
+    """Test that the request carries the exact length, not chunks."""
+    requests: list[Request] = []
+
+    def handler(request: Request) -> Response:
+        requests.append(request)
+        return Response(202)
+
+    client = SendgridAPI(api_key="SECRET_KEY")
+    client._session = AsyncClient(
+        headers=client.headers, transport=MockTransport(handler)
+    )
+    response = await client.send(
+        email, attachments=[StreamingAttachment(path)]
+    )
+
+    assert response.status_code == 202
+    request = requests[0]
+    assert "Transfer-Encoding" not in request.headers
+    assert int(request.headers["Content-Length"]) == len(request.content)
+    attachment = json.loads(request.content)["attachments"][0]
+    assert attachment["filename"] == "report.pdf"
+    assert base64.b64decode(attachment["content"]) == DATA
+
+
+@pytest.mark.asyncio
+async def test_send_rejects_attachments_with_encoded_bodies():
+    client = SendgridAPI(api_key="SECRET_KEY")
+    with pytest.raises(ValueError, match="Mail or dict"):
+        await client.send(
+            b"{}", attachments=[StreamingAttachment(b"x", "x.txt")]
+        )
+
+
+class _Unseekable(io.RawIOBase):
+    def readable(self) -> bool:
+        return True
+
+
+@pytest.mark.parametrize(
+    "kwargs, match",
+    [
+        ({"source": _Unseekable(), "filename": "x"}, "seekable"),
+        ({"source": b"x"}, "filename"),
+    ],
+)
+def test_invalid_attachments_raise(kwargs, match):
+    with pytest.raises(ValueError, match=match):
+        StreamingAttachment(**kwargs)
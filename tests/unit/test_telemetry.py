@@ -1,18 +1,22 @@
 import pytest
-from httpx import URL, Request, Response
+from httpx import URL, ByteStream, Request, Response
 from opentelemetry import trace
 from opentelemetry.sdk.trace import TracerProvider
 from opentelemetry.sdk.trace.export import SimpleSpanProcessor
 from opentelemetry.sdk.trace.export.in_memory_span_exporter import (
     InMemorySpanExporter,
 )
+from opentelemetry.trace import INVALID_SPAN_CONTEXT, NonRecordingSpan
 from opentelemetry.trace.span import Span
 from sendgrid.helpers.mail import Attachment, Mail  # type: ignore
 
+from async_sendgrid import telemetry
+from async_sendgrid.payload import Payload
 from async_sendgrid.telemetry import (
     create_span,
     set_http_metrics,
     set_sendgrid_metrics,
+    trace_client,
 )
 
 
@@ -157,3 +161,110 @@ def test_set_http_metrics_method(
     set_http_metrics(span, response)
 
     assert span.attributes["http.method"] == method  # type: ignore
+
+
+def test_set_sendgrid_metrics_payload(span: Span):
+    """Test the metrics of a message given as a dict."""
+    payload = {
+        "personalizations": [
+            {"to": [{"email": "a@example.com"}, {"email": "b@example.com"}]},
+            {"to": [{"email": "c@example.com"}]},
+        ],
+        "attachments": [{"content": "aGVsbG8=", "filename": "a.txt"}],
+    }
+    set_sendgrid_metrics(span, payload)
+    assert span.attributes["email.has_attachments"] is True  # type: ignore
+    assert span.attributes["email.num_recipients"] == 2  # type: ignore
+    assert span.attributes["email.num_personalizations"] == 2  # type: ignore
+
+
+def test_set_sendgrid_metrics_encoded_payload(span: Span):
+    """Test the metrics carried by an encoded payload."""
+    payload = Payload(b"{}", num_recipients=3, num_personalizations=1)
+    set_sendgrid_metrics(span, payload)
+    assert span.attributes["email.num_recipients"] == 3  # type: ignore
+    assert "email.has_attachments" not in span.attributes  # type: ignore
+
+
+def test_set_sendgrid_metrics_skips_raw_bytes(span: Span):
+    """Test that raw bytes are not parsed for metrics."""
+    set_sendgrid_metrics(span, b"{}")
+    assert "email.num_recipients" not in span.attributes  # type: ignore
+
+
+def test_set_http_metrics_does_not_read_the_body(span: Span):
+    """Test that the content length is taken from the headers."""
+    response = Response(
+        status_code=400,
+        headers={"Content-Length": "5"},
+        stream=ByteStream(b"error"),
+    )
+    response.request = Request(method="POST", url=URL("https://example.com"))
+
+    set_http_metrics(span, response)
+
+    assert not response.is_stream_consumed
+    assert span.attributes["http.content_length"] == 5  # type: ignore
+    assert span.status.description == (  # type: ignore
+        "Request failed with status 400 Bad Request"
+    )
+
+
+def test_set_http_metrics_skips_a_malformed_content_length(span: Span):
+    """Test that an invalid Content-Length header is not recorded."""
+    response = Response(status_code=202, headers={"Content-Length": "abc"})
+    response.request = Request(method="POST", url=URL("https://example.com"))
+
+    set_http_metrics(span, response)
+
+    assert "http.content_length" not in span.attributes  # type: ignore
+    assert span.attributes["http.status_code"] == 202  # type: ignore
+
+
+def test_metrics_are_skipped_when_the_span_is_not_recording():
+    """Test that a non-recording span is left alone."""
+    span = NonRecordingSpan(INVALID_SPAN_CONTEXT)
+    response = Response(status_code=500, stream=ByteStream(b"error"))
+
+    # The response has no request: it would fail if it were inspected.
+    set_http_metrics(span, response)
+    set_sendgrid_metrics(span, Mail())
+
+
+async def _send(self, email, **kwargs) -> Response:
+    return Response(202, request=Request("POST", "https://example.com"))
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("draw, traced", [(0.2, True), (0.7, False)])
+async def test_trace_client_samples_sends(
+    monkeypatch, exporter: InMemorySpanExporter, draw: float, traced: bool
+):
+    """Test that sends are traced at the sample ratio."""
+    monkeypatch.setattr(telemetry.random, "random", lambda: draw)
+    send = trace_client(sample_ratio=0.5)(_send)
+
+    response = await send(None, {})
+
+    assert response.status_code == 202
+    assert len(exporter.get_finished_spans()) == int(traced)
+
+
+def test_trace_client_without_sampling_returns_the_function():
+    """Test that a zero sample ratio leaves the send undecorated."""
+    assert trace_client(sample_ratio=0.0)(_send) is _send
+
+
+def test_trace_client_rejects_invalid_ratios():
+    """Test that a sample ratio above 1 raises."""
+    with pytest.raises(ValueError, match="sample_ratio"):
+        trace_client(sample_ratio=1.5)
+
+
+@pytest.mark.parametrize(
+    "value, expected", [("0.25", 0.25), ("1", 1.0), ("2", 1.0), ("x", 1.0)]
+)
+def test_sample_ratio_from_environment(monkeypatch, value, expected):
+    """Test that invalid ratios in the environment fall back to 1."""
+    monkeypatch.setenv("SENDGRID_TELEMETRY_SAMPLE_RATIO", value)
+    assert telemetry._sample_ratio() == expected
@@ -0,0 +1,90 @@
+import json
+
+import pytest
+from sendgrid.helpers.mail import Mail, Personalization, To  # type: ignore
+
+from async_sendgrid.template import MessageTemplate
+
+
+@pytest.fixture
+def template() -> MessageTemplate:
+    return MessageTemplate(
+        Mail(
+            from_email="noreply@example.com",
+            to_emails="ignored@example.com",
+            subject="Your code",
+            html_content="<p>Your code is -code-</p>",
+        )
+    )
+
+
+def test_template_ignores_personalizations(template: MessageTemplate):
+    """Test that the compiled part carries no personalizations."""
+    body = json.loads(template.for_recipient("jane@example.com").content)
+    assert body["personalizations"] == [
+        {"to": [{"email": "jane@example.com"}]}
+    ]
+
+
+def test_template_matches_the_equivalent_mail(template: MessageTemplate):
+    """Test that rendered bodies equal the body of the equivalent Mail."""
+    expected = Mail(
+        from_email="noreply@example.com",
+        to_emails="jane@example.com",
+        subject="Your code",
+        html_content="<p>Your code is -code-</p>",
+    ).get()
+
+    payload = template.for_recipient("jane@example.com")
+
+    assert json.loads(payload.content) == expected
+    assert payload.num_recipients == 1
+    assert payload.num_personalizations == 1
+    assert payload.has_attachments is False
+
+
+def test_for_recipient_options(template: MessageTemplate):
+    """Test that per-recipient options land in the personalization."""
+    payload = template.for_recipient(
+        "jane@example.com",
+        name="Jane",
+        dynamic_template_data={"code": "1234"},
+        substitutions={"-code-": "1234"},
+    )
+    assert json.loads(payload.content)["personalizations"] == [
+        {
+            "to": [{"email": "jane@example.com", "name": "Jane"}],
+            "dynamic_template_data": {"code": "1234"},
+            "substitutions": {"-code-": "1234"},
+        }
+    ]
+
+
+def test_render_accepts_personalization_objects(template: MessageTemplate):
+    """Test that Personalization helpers and dicts can be mixed."""
+    personalization = Personalization()
+    personalization.add_to(To("jane@example.com"))
+
+    payload = template.render(
+        personalization, {"to": [{"email": "john@example.com"}]}
+    )
+
+    assert json.loads(payload.content)["personalizations"] == [
+        {"to": [{"email": "jane@example.com"}]},
+        {"to": [{"email": "john@example.com"}]},
+    ]
+    assert payload.num_personalizations == 2
+
+
+def test_render_requires_a_personalization(template: MessageTemplate):
+    """Test that rendering without personalizations raises."""
+    with pytest.raises(ValueError, match="personalization"):
+        template.render()
+
+
+def test_empty_template():
+    """Test that an empty message still renders valid JSON."""
+    payload = MessageTemplate(Mail()).for_recipient("jane@example.com")
+    assert json.loads(payload.content) == {
+        "personalizations": [{"to": [{"email": "jane@example.com"}]}]
+    }